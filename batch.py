@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import time
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from gridCache import fileHash
+from lakeStore import LakeStore
+from metrics import Metrics, nullMetrics
+from solar import computeSolarTable
+from sweep import SWEEP_STRATEGIES, runTask
+from temperatureLoader import LAYOUTS, loadTemperatureFile
+
+BATCH_VERSION = 1
+STAGES = ('parse', 'resample', 'climatology', 'gapFill', 'interpolate', 'fitness', 'strategies')
+LAKE_DEFAULTS = {'years': None, 'layout': 'hourly', 'utcOffset': 0}
+
+def readManifest(filename):
+    """Reads a json manifest of lakes: a list (or {'lakes': [...]}) of dictionaries with
+    'name', 'file', 'latitude' and 'longitude', and optionally 'utcOffset' (hours from UTC of
+    the local standard time, default 0), 'years' (default every year in the file) and
+    'layout' (default 'hourly'). Relative file names are relative to the manifest.
+
+    Returns:
+        list of lake dictionaries
+    """
+    with open(filename) as f:
+        lakes = json.load(f)
+    if isinstance(lakes, dict):
+        lakes = lakes['lakes']
+    base = os.path.dirname(os.path.abspath(filename))
+    return [checkLake(dict(lake, file=os.path.join(base, lake['file'])) if 'file' in lake else lake)
+            for lake in lakes]
+
+def checkLake(lake):
+    """Fills in the defaults of a manifest entry and checks it.
+
+    Returns:
+        lake dictionary
+    """
+    missing = [key for key in ('name', 'file', 'latitude', 'longitude') if key not in lake]
+    if missing:
+        raise ValueError('lake %r is missing %s' % (lake.get('name'), missing))
+    lake = dict(LAKE_DEFAULTS, **lake)
+    if lake['layout'] not in LAYOUTS:
+        raise ValueError('unknown layout %r, choose from %s' % (lake['layout'], sorted(LAYOUTS)))
+    return lake
+
+class BatchStore(object):
+    """The consolidated result of a batch: one LakeStore per lake under a common directory, and a
+    json catalog with every lake's manifest entry, strategy results, timings and errors.
+
+    Args:
+        directory: the batch directory, created if needed
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        catalogFile = os.path.join(directory, 'batch.json')
+        if os.path.isfile(catalogFile):
+            with open(catalogFile) as f:
+                self.catalog = json.load(f)
+        else:
+            self.catalog = {'version': BATCH_VERSION, 'settings': {}, 'lakes': {}}
+
+    @property
+    def lakes(self):
+        return sorted(self.catalog['lakes'])
+
+    def __contains__(self, name):
+        return name in self.catalog['lakes']
+
+    def store(self, name):
+        """The LakeStore of one lake, usable directly with runSweep."""
+        if name not in self:
+            raise KeyError(name)
+        return LakeStore(self._path(name))
+
+    def results(self, name):
+        """The strategy results of one lake: a list of {'year', 'strategy', 'totalFitness', 'meanDepth'}."""
+        return self.catalog['lakes'][name]['results']
+
+    def add(self, name, entry):
+        """Records one lake and rewrites the catalog atomically."""
+        self.catalog['lakes'][name] = entry
+        staging = os.path.join(self.directory, '.batch.json')
+        with open(staging, 'w') as f:
+            json.dump(self.catalog, f, indent=1, default=str)
+        os.replace(staging, os.path.join(self.directory, 'batch.json'))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+def runBatch(lakes, directory, strategies=SWEEP_STRATEGIES, nAgents=1, seed=None, workers=None, readers=4,
+             queueSize=2, resolution=0.1, method='linear', model='synechococcus', params=None, step=None,
+             resampling='mean', metrics=None):
+    """Processes many lakes concurrently into one BatchStore and yields each lake as it finishes.
+
+    Parsing is I/O bound and runs on a pool of reader threads; gap filling, interpolation,
+    fitness and the strategies are CPU bound and run one lake per worker process, so parsing the
+    next lakes overlaps with processing the current ones and the batch takes about as long as its
+    slowest lake when there are enough cores. Parsed lakes wait in a queue of queueSize entries,
+    and no more lakes are handed to the process pool than it has workers: when processing falls
+    behind the readers block, so at most readers + queueSize + workers parsed files are in memory.
+
+    Args:
+        lakes: list of lake dictionaries (see readManifest)
+        directory: the BatchStore directory
+        strategies: strategies run on every lake year, see sweep.SWEEP_STRATEGIES
+        nAgents: agents per strategy run
+        seed: optional seed of every strategy run
+        workers: number of processes, defaults to the number of cores
+        readers: number of parsing threads
+        queueSize: parsed lakes allowed to wait for a free worker
+        resolution, method, model, params, step, resampling: as in processLakeYear
+        metrics: optional Metrics, receives the stages and counters of every lake
+
+    Yields:
+        the catalog entry of each lake, with its name, and the error for lakes that failed
+    """
+    lakes = [checkLake(lake) for lake in lakes]
+    names = [lake['name'] for lake in lakes]
+    if len(set(names)) != len(names):
+        raise ValueError('lake names must be unique, got %s' % names)
+    unknown = [strategy for strategy in strategies if strategy not in SWEEP_STRATEGIES]
+    if unknown:
+        raise ValueError('unknown strategies %s, choose from %s' % (unknown, SWEEP_STRATEGIES))
+    metrics = nullMetrics(metrics)
+    batch = BatchStore(directory)
+    settings = {'resolution': resolution, 'method': method, 'model': model, 'params': params, 'step': step,
+                'resampling': resampling}
+    batch.catalog['settings'] = dict(settings, strategies=list(strategies), nAgents=nAgents, seed=seed)
+
+    parsed = queue.Queue(queueSize)
+    stopping = []
+    def parse(lake):
+        #always puts exactly one entry per lake, so the consumer knows when every lake has been read
+        lakeMetrics = Metrics()
+        try:
+            with lakeMetrics.timed('parse'):
+                source = {'file': os.path.abspath(lake['file']), 'hash': fileHash(lake['file'])}
+                records = loadTemperatureFile(lake['file'], lake['layout'])
+            lakeMetrics.addWork('parse', len(records), len(records))
+            item = (lake, source, records, lakeMetrics, None)
+        except Exception:
+            item = (lake, None, None, lakeMetrics, traceback.format_exc())
+        while not stopping:
+            try:
+                parsed.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    cpu = ProcessPoolExecutor(workers)
+    io = ThreadPoolExecutor(readers)
+    try:
+        maxPending = workers or os.cpu_count() or 1
+        for lake in lakes:
+            io.submit(parse, lake)
+        received, pending = 0, {}
+        while received < len(lakes) or pending:
+            while received < len(lakes) and len(pending) < maxPending:
+                lake, source, records, lakeMetrics, error = parsed.get()
+                received += 1
+                if error is not None:
+                    metrics.merge(lakeMetrics)
+                    yield _record(batch, lake, {'error': error})
+                    continue
+                future = cpu.submit(_processLake, lake, source, records, batch._path(lake['name']), settings,
+                                    strategies, nAgents, seed)
+                pending[future] = (lake, lakeMetrics, time.perf_counter())
+                del records #the worker has its own copy
+            if not pending:
+                continue
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                lake, lakeMetrics, started = pending.pop(future)
+                try:
+                    entry, workerMetrics = future.result()
+                except Exception:
+                    entry = {'error': traceback.format_exc()}
+                else:
+                    lakeMetrics.merge(workerMetrics)
+                metrics.merge(lakeMetrics)
+                entry['seconds'] = time.perf_counter() - started
+                entry['metrics'] = lakeMetrics.toDict()
+                yield _record(batch, lake, entry)
+    finally:
+        stopping.append(True)
+        io.shutdown(wait=True)
+        cpu.shutdown(wait=True, cancel_futures=True)
+
+def processLake(lake, source, records, directory, settings, strategies=SWEEP_STRATEGIES, nAgents=1, seed=None,
+                metrics=None):
+    """Builds the LakeStore of one parsed lake and runs every strategy on each of its years
+    (also usable without a pool).
+
+    Args:
+        lake: lake dictionary (see readManifest)
+        source: description of the file the records came from, see LakeStore.fromRecords
+        records: TemperatureRecords of the whole file
+        directory: the LakeStore directory
+        settings: dictionary of the processLakeYear settings
+        strategies: strategies run on every year
+        nAgents: agents per run
+        seed: optional seed of every run
+        metrics: optional Metrics
+
+    Returns:
+        catalog entry with the years and the strategy results
+    """
+    metrics = nullMetrics(metrics)
+    years = lake['years']
+    if years is None:
+        years = np.unique(records.times.astype('datetime64[Y]').astype(np.int64) + 1970).tolist()
+    solarTable = None
+    if len(years):
+        solarTable = computeSolarTable(lake['latitude'], lake['longitude'], min(years), max(years), lake['utcOffset'])
+    store = LakeStore.fromRecords(directory, records, source, years, layout=lake['layout'], solarTable=solarTable,
+                                  metrics=metrics, **settings)
+    results = []
+    with metrics.timed('strategies'):
+        for year in years:
+            lakeGrid, fitness, daylight = store[year]
+            metrics.addWork('strategies', len(lakeGrid.times), len(lakeGrid.times) * len(strategies) * nAgents)
+            for strategy in strategies:
+                output = runTask(lakeGrid, fitness, daylight, {'year': year, 'strategy': strategy, 'seed': seed},
+                                 nAgents)
+                results.append({'year': year, 'strategy': strategy,
+                                'totalFitness': output['totalFitness'].tolist(),
+                                'meanDepth': output['meanDepth'].tolist()})
+            store.release(year)
+    return {'years': store.years, 'results': results}
+
+## helper functions ##
+
+def _processLake(lake, source, records, directory, settings, strategies, nAgents, seed):
+    metrics = Metrics()
+    entry = processLake(lake, source, records, directory, settings, strategies, nAgents, seed, metrics)
+    return entry, metrics
+
+def _record(batch, lake, entry):
+    entry = dict(entry, lake=lake)
+    batch.add(lake['name'], entry)
+    return dict(entry, name=lake['name'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Processes every lake of a manifest into one batch directory.')
+    parser.add_argument('manifest', help='json list of lakes')
+    parser.add_argument('--out', default='batch', help='batch directory to write')
+    parser.add_argument('--workers', type=int, help='worker processes, defaults to the number of cores')
+    parser.add_argument('--readers', type=int, default=4, help='parsing threads')
+    parser.add_argument('--agents', type=int, default=1, help='agents per strategy run')
+    parser.add_argument('--seed', type=int, help='seed of every strategy run')
+    parser.add_argument('--metrics', help='json file to write the combined metrics to')
+    args = parser.parse_args()
+
+    metrics = Metrics(STAGES)
+    failed = 0
+    for entry in runBatch(readManifest(args.manifest), args.out, nAgents=args.agents, seed=args.seed,
+                          workers=args.workers, readers=args.readers, metrics=metrics):
+        if 'error' in entry:
+            failed += 1
+            sys.stderr.write('%s failed:\n%s\n' % (entry['name'], entry['error']))
+        else:
+            sys.stdout.write('%s: %d years in %.1fs\n' % (entry['name'], len(entry['years']), entry['seconds']))
+    if args.metrics:
+        metrics.dump(args.metrics)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,376 @@
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+import numpy as np
+
+from fitness import createFitnessGrid
+from gapFill import fillGaps, hourlyClimatology
+from interpolation import interpolateGrid
+from lakeGrid import TIME_UNIT
+from oracle import unconstrainedOracle
+from solar import WAUSAU, computeSolarTable
+from strategyEngine import DenseSource, makeStrategy, runStrategy
+from temperatureLoader import TemperatureRecords, loadTemperatureFile
+
+REPORT_VERSION = 1
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+#stages of main() in order, each timed on the array path and, when it can be imported, on the original code
+STAGES = ('createDataMatrix', 'averageOverYears', 'fillGapsInData', 'extendDataMatrix', 'createFitnessDict')
+STRATEGIES = ('randomWalk', 'randomWalkDirectional', 'hillClimbing', 'circadian', 'oracle')
+
+## synthetic lakes ##
+
+def syntheticLake(years=1, nDepths=20, gapRate=0.05, seed=0, startYear=2005, maxDepth=18.0):
+    """A deterministic stand-in for an LTER hourly temperature record: a stratified lake whose
+    surface warms and cools with the seasons, whose thermocline deepens through the summer and
+    whose upper layers follow a diel cycle, plus a little sensor noise.
+
+    Gaps come in two kinds, whole-day outages of every sensor and single missing readings,
+    each making up about half of gapRate.
+
+    Args:
+        years: number of consecutive years
+        nDepths: number of sensor depths between the surface and maxDepth
+        gapRate: fraction of readings removed
+        seed: seed for the noise and the gaps, the same seed gives the same lake
+        startYear: the first year
+        maxDepth: depth of the deepest sensor in meters
+
+    Returns:
+        TemperatureRecords
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('%04d-01-01' % startYear, 'h')
+    end = np.datetime64('%04d-01-01' % (startYear + years), 'h')
+    times = np.arange(start, end).astype(TIME_UNIT)
+    depths = np.round(np.linspace(0, maxDepth, nDepths), 2)
+
+    dayOfYear = (times - times.astype('datetime64[Y]')).astype('timedelta64[h]').astype(np.float64) / 24.0
+    hour = (times - times.astype('datetime64[D]')).astype(np.int64) / 60.0
+    season = (1 - np.cos(2 * np.pi * (dayOfYear - 30) / 365.25)) / 2 #0 in late January, 1 in late July
+    surface = 4 + 20 * season
+    bottom = 4 + 3 * season
+    thermocline = 3 + 6 * np.clip((dayOfYear - 120) / 180, 0, 1)
+    diel = (0.3 + 0.7 * season) * np.sin(2 * np.pi * (hour - 9) / 24)
+
+    z = depths[None, :]
+    temps = bottom[:, None] + (surface - bottom)[:, None] / (1 + np.exp((z - thermocline[:, None]) / 0.8))
+    temps += diel[:, None] * np.exp(-z / 1.5)
+    temps += rng.normal(0, 0.05, temps.shape)
+
+    keep = rng.random(temps.shape) >= gapRate / 2
+    outages = int(round(gapRate / 2 * len(times) / 24))
+    for first in rng.integers(0, max(len(times) - 24, 1), outages).tolist():
+        keep[first:first + 24] = False
+
+    rows, cols = np.nonzero(keep)
+    return TemperatureRecords(times[rows], depths[cols], temps[rows, cols].astype(np.float32),
+                              np.full(len(rows), '', dtype='<U1'))
+
+def writeSyntheticFile(filename, records):
+    """Writes records in the LTER hourly layout read by createDataMatrix and loadTemperatureFile.
+
+    Args:
+        filename: the text file
+        records: TemperatureRecords on whole hours, eg. from syntheticLake
+    """
+    days = records.times.astype('datetime64[D]')
+    dates = np.datetime_as_string(days)
+    years = days.astype('datetime64[Y]').astype(np.int64) + 1970
+    months = (days.astype('datetime64[M]').astype(np.int64) % 12) + 1
+    dayNums = (days - days.astype('datetime64[Y]')).astype(np.int64) + 1
+    hours = (records.times - days).astype('timedelta64[h]').astype(np.int64) * 100 #military time eg. 1 -> 0100
+    with open(filename, 'w') as f:
+        f.write('sampledate,year4,month,daynum,hour,depth,wtemp,flag_wtemp\n')
+        for row in zip(dates.tolist(), years.tolist(), months.tolist(), dayNums.tolist(), hours.tolist(),
+                       records.depths.tolist(), records.temps.tolist(), records.flags.tolist()):
+            f.write('%s 00:00:00,%d,%d,%d,%04d,%g,%.3f,%s\n' % row)
+
+## benchmarks ##
+
+def benchmarkLake(years=1, nDepths=20, resolution=0.1, gapRate=0.05, seed=0, nAgents=1, repeat=1,
+                  legacy=False, directory=None):
+    """Times every stage of main() on one synthetic lake, on the array path and optionally on the
+    original dictionary code.
+
+    Args:
+        years: number of years of data
+        nDepths: number of sensor depths
+        resolution: depth resolution of the interpolated grid in meters
+        gapRate: fraction of readings removed from the synthetic record
+        seed: seed of the synthetic lake and of the agents
+        nAgents: number of agents per strategy
+        repeat: each stage is run this many times and the fastest run is kept
+        legacy: also time formatData and movementStrategies, where this interpreter can import them
+        directory: where the synthetic file is written, a temporary directory by default
+
+    Returns:
+        dictionary with the lake settings and stage -> {'seconds', 'cells'} for 'array' (and 'legacy')
+    """
+    records = syntheticLake(years, nDepths, gapRate, seed)
+    point = {'years': years, 'nDepths': nDepths, 'resolution': resolution, 'gapRate': gapRate,
+             'readings': len(records), 'nAgents': nAgents}
+    with _workDirectory(directory) as work:
+        filename = os.path.join(work, 'synthetic%dy%dd.txt' % (years, nDepths))
+        writeSyntheticFile(filename, records)
+        point['array'] = _arrayStages(filename, years, resolution, seed, nAgents, repeat)
+        if legacy:
+            point['legacy'] = _legacyStages(filename, resolution, repeat)
+    return point
+
+def scalingCurves(years=(1, 2, 4), depthCounts=(10, 20, 40), resolutions=(0.5, 0.25, 0.1), baseYears=1,
+                  baseDepths=20, baseResolution=0.1, **settings):
+    """Runs benchmarkLake over growing data sizes and finer depth resolutions.
+
+    Args:
+        years: lengths of record for the data size curve
+        depthCounts: sensor counts for the data size curve
+        resolutions: depth resolutions for the resolution curve
+        baseYears, baseDepths, baseResolution: the settings held fixed on the other curves
+        settings: passed on to benchmarkLake
+
+    Returns:
+        dictionary curve -> list of benchmarkLake points, with a fitted 'exponents' entry per curve
+    """
+    curves = {
+        'years': [benchmarkLake(n, baseDepths, baseResolution, **settings) for n in years],
+        'depths': [benchmarkLake(baseYears, n, baseResolution, **settings) for n in depthCounts],
+        'resolution': [benchmarkLake(baseYears, baseDepths, r, **settings) for r in resolutions],
+    }
+    return dict((name, {'points': points, 'exponents': scalingExponents(points)}) for name, points in curves.items())
+
+def scalingExponents(points, path='array'):
+    """The slope of log(seconds) against log(cells) of every stage along a curve, eg. 1 for a
+    stage that is linear in the size of the grid it works on.
+    """
+    exponents = {}
+    for stage in points[0].get(path, {}):
+        cells = np.array([point[path][stage].get('cells', 0) for point in points], dtype=np.float64)
+        seconds = np.array([point[path][stage].get('seconds', 0) for point in points], dtype=np.float64)
+        if len(points) < 2 or (cells <= 0).any() or (seconds <= 0).any() or len(np.unique(cells)) < 2:
+            continue
+        exponents[stage] = float(np.polyfit(np.log(cells), np.log(seconds), 1)[0])
+    return exponents
+
+def runBenchmarks(quick=False, legacy=False, repeat=1, seed=0):
+    """Builds the full, machine readable benchmark report.
+
+    Args:
+        quick: smaller curves, for a quick check
+        legacy: also time the original dictionary code where it can be imported
+        repeat: runs per stage, the fastest is kept
+        seed: seed of the synthetic lakes and agents
+
+    Returns:
+        report dictionary, see writeReport
+    """
+    if quick:
+        curves = scalingCurves(years=(1, 2), depthCounts=(8, 16), resolutions=(0.5, 0.25), baseDepths=8,
+                               baseResolution=0.5, seed=seed, repeat=repeat, legacy=legacy)
+    else:
+        curves = scalingCurves(seed=seed, repeat=repeat, legacy=legacy)
+    return {'version': REPORT_VERSION, 'environment': environment(), 'curves': curves}
+
+def environment():
+    """Python, numpy, machine and commit the report was made with."""
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=HERE, stderr=subprocess.DEVNULL)
+        commit = commit.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'processor': platform.processor(), 'cpus': os.cpu_count(), 'commit': commit,
+            'date': datetime.datetime.now().isoformat()}
+
+## reports ##
+
+def writeReport(report, filename):
+    """Writes a report as json."""
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+def readReport(filename):
+    """Reads a report written by writeReport."""
+    with open(filename) as f:
+        return json.load(f)
+
+def compareReports(baseline, current, tolerance=0.25, minSeconds=0.01):
+    """Lists the stages that got slower between two reports, matching points by curve and settings.
+
+    Args:
+        baseline: report of the reference commit
+        current: report of the commit under test
+        tolerance: allowed slowdown, 0.25 flags anything more than 25% slower
+        minSeconds: stages faster than this in both reports are ignored as noise
+
+    Returns:
+        list of {'curve', 'point', 'path', 'stage', 'baseline', 'current', 'ratio'}, slowest first
+    """
+    regressions = []
+    for name, curve in current['curves'].items():
+        reference = dict((_pointKey(point), point) for point in baseline['curves'].get(name, {}).get('points', []))
+        for point in curve['points']:
+            old = reference.get(_pointKey(point))
+            if old is None:
+                continue
+            for path in ('array', 'legacy'):
+                for stage, timing in point.get(path, {}).items():
+                    before = old.get(path, {}).get(stage, {}).get('seconds')
+                    after = timing.get('seconds')
+                    if before is None or after is None or max(before, after) < minSeconds:
+                        continue
+                    ratio = after / before if before > 0 else float('inf')
+                    if ratio > 1 + tolerance:
+                        regressions.append({'curve': name, 'point': _pointKey(point), 'path': path, 'stage': stage,
+                                            'baseline': before, 'current': after, 'ratio': ratio})
+    return sorted(regressions, key=lambda regression: -regression['ratio'])
+
+## helper functions ##
+
+def _arrayStages(filename, years, resolution, seed, nAgents, repeat):
+    startYear = 2005
+    yearList = list(range(startYear, startYear + years))
+    stages = {}
+    records = _timed(stages, 'createDataMatrix', repeat, lambda: loadTemperatureFile(filename, 'hourly'),
+                     lambda result: len(result))
+    measured = records.toGrid()
+    climatology = _timed(stages, 'averageOverYears', repeat, lambda: hourlyClimatology(measured),
+                         lambda result: measured.temps.size)
+    filled = _timed(stages, 'fillGapsInData', repeat, lambda: fillGaps(measured, climatology, yearList),
+                    lambda result: result[0].temps.size)[0]
+    grid = _timed(stages, 'extendDataMatrix', repeat, lambda: interpolateGrid(filled, resolution),
+                  lambda result: result.temps.size)
+    fitness = _timed(stages, 'createFitnessDict', repeat, lambda: createFitnessGrid(grid),
+                     lambda result: result.size)
+
+    source = DenseSource(grid, fitness)
+    daylight = computeSolarTable(WAUSAU[0], WAUSAU[1], startYear, yearList[-1], WAUSAU[2]).isDaylight(grid.times)
+    for name in STRATEGIES:
+        if name == 'oracle':
+            run = lambda: unconstrainedOracle(fitness)
+        else:
+            run = lambda name=name: runStrategy(source, makeStrategy(name), nAgents, seed,
+                                                daylight if name == 'circadian' else None)
+        _timed(stages, name, repeat, run, lambda result: fitness.size * nAgents)
+    return stages
+
+def _legacyStages(filename, resolution, repeat):
+    """The original dictionary pipeline of main(), or the reason it cannot run here."""
+    try:
+        movement, formatData = _legacyModules()
+    except (ImportError, SyntaxError) as error:
+        return dict((stage, {'skipped': '%s: %s' % (type(error).__name__, error)}) for stage in STAGES + STRATEGIES)
+
+    stages = {}
+    records = loadTemperatureFile(filename, 'hourly')
+    year = int(records.times[0].astype('datetime64[Y]').astype(np.int64)) + 1970
+    start, end = formatData.dateString(year, True)
+    dataMatrix = _legacyTimed(stages, 'createDataMatrix', repeat,
+                              lambda: formatData.createDataMatrix(filename, 'hourly'), lambda result: len(result))
+    dictionary = None if dataMatrix is None else formatData.createDictionary(dataMatrix)
+    average = _legacyTimed(stages, 'averageOverYears', repeat,
+                           lambda: formatData.averageOverYears(formatData.groupAllDates(dictionary)),
+                           lambda result: len(dataMatrix), dictionary)
+    #fillGapsInData and extendDataMatrix update the dictionary in place, so each run gets a fresh copy
+    copy = lambda d: dict((date, dict(d[date])) for date in d)
+    filled = _legacyTimed(stages, 'fillGapsInData', repeat,
+                          lambda: formatData.fillGapsInData(copy(dictionary), average, year), _legacyCells, average)
+    data = _legacyTimed(stages, 'extendDataMatrix', repeat,
+                        lambda: formatData.extendDataMatrix(copy(filled), start, end, resolution), _legacyCells, filled)
+    fitness = _legacyTimed(stages, 'createFitnessDict', repeat,
+                           lambda: movement.createFitnessDict(data, None, start, end), _legacyCells, data)
+
+    table = computeSolarTable(WAUSAU[0], WAUSAU[1], year, year, WAUSAU[2])
+    sunsetMatrix = [[sunrise.astype(datetime.datetime), sunset.astype(datetime.datetime)]
+                    for sunrise, sunset in (table.sunTimes(day) for day in table.days)]
+    runs = {'randomWalk': lambda: movement.randomWalk(data, fitness, start, end, True),
+            'randomWalkDirectional': lambda: movement.randomWalkDirectional(data, fitness, start, end, 0.5, True),
+            'hillClimbing': lambda: movement.hillClimbingMovement(data, fitness, start, end, True),
+            'circadian': lambda: movement.circadianMovement(data, fitness, sunsetMatrix, start, end, 'slow'),
+            'oracle': lambda: movement.oracleMovement(data, fitness, start, end, True)}
+    for name in STRATEGIES:
+        _legacyTimed(stages, name, repeat, runs[name], lambda result: _legacyCells(data), fitness)
+    return stages
+
+def _legacyModules():
+    """Imports movementStrategies (whose file name has a space in it) and formatData, which imports it."""
+    if 'movementStrategies' not in sys.modules:
+        spec = importlib.util.spec_from_file_location('movementStrategies', os.path.join(HERE, 'movementStrategies .py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules['movementStrategies'] = module
+    import formatData
+    return sys.modules['movementStrategies'], formatData
+
+def _legacyCells(dictionary):
+    return sum(len(dictionary[date]) for date in dictionary)
+
+def _legacyTimed(stages, name, repeat, function, cells, needs=True):
+    """_timed for the original code, which may import but still fail under this interpreter: a stage
+    that raises, or whose input could not be made, is reported as skipped with the reason.
+    """
+    if needs is None:
+        stages[name] = {'skipped': 'needs an earlier stage that was skipped'}
+        return None
+    try:
+        return _timed(stages, name, repeat, function, cells)
+    except Exception as error:
+        stages[name] = {'skipped': '%s: %s' % (type(error).__name__, error)}
+        return None
+
+def _timed(stages, name, repeat, function, cells):
+    """Runs function repeat times, records the fastest run and the cells it covered, returns its result."""
+    best = None
+    for _ in range(max(repeat, 1)):
+        start = timeit.default_timer()
+        result = function()
+        seconds = timeit.default_timer() - start
+        best = seconds if best is None else min(best, seconds)
+    stages[name] = {'seconds': best, 'cells': int(cells(result))}
+    return result
+
+def _pointKey(point):
+    return '%(years)dy-%(nDepths)dd-%(resolution)gm' % point
+
+class _workDirectory(object):
+    """The given directory, or a temporary one removed afterwards."""
+    def __init__(self, directory):
+        self.directory = directory
+        self._temporary = None
+
+    def __enter__(self):
+        if self.directory is not None:
+            return self.directory
+        self._temporary = tempfile.TemporaryDirectory()
+        return self._temporary.name
+
+    def __exit__(self, *exc):
+        if self._temporary is not None:
+            self._temporary.cleanup()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Times every stage on synthetic lakes and writes a json report.')
+    parser.add_argument('--out', default='benchmark.json', help='report to write')
+    parser.add_argument('--compare', help='baseline report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline')
+    parser.add_argument('--quick', action='store_true', help='smaller curves')
+    parser.add_argument('--legacy', action='store_true', help='also time the original dictionary code')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per stage, the fastest is kept')
+    args = parser.parse_args()
+
+    report = runBenchmarks(args.quick, args.legacy, args.repeat)
+    writeReport(report, args.out)
+    if args.compare:
+        regressions = compareReports(readReport(args.compare), report, args.tolerance)
+        for regression in regressions:
+            sys.stdout.write('%(curve)s %(point)s %(path)s %(stage)s: %(baseline).4fs -> %(current).4fs (x%(ratio).2f)\n'
+                             % regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,295 @@
+import json
+import os
+import numpy as np
+
+from lakeGrid import LakeGrid, GRID_ARRAYS, TIME_UNIT
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError: #parquet output is optional, npz bundles need only numpy
+    pyarrow = None
+
+BUNDLE_VERSION = 1
+FORMATS = ('npz', 'parquet')
+META_KEYS = ('lake', 'year', 'resolution', 'model', 'seed') #what every bundle should say about itself
+PARQUET_TIME = 'datetime64[s]' #arrow has no minute timestamps
+
+class Trajectories(object):
+    """Depth and fitness of N agents over T simulated hours, the common form of EnsembleResult,
+    StrategyResult and OracleResult on disk.
+
+    Args:
+        times: (T,) datetime64 times simulated
+        depthAxis: depth axis of the grid the agents moved on
+        depthIndex: (N, T) column of every agent at every hour
+        fitness: (N, T) fitness of every agent at every hour
+    """
+    def __init__(self, times, depthAxis, depthIndex, fitness):
+        self.times = np.asarray(times).astype(TIME_UNIT)
+        self.depthAxis = np.asarray(depthAxis, dtype=np.float64)
+        self.depthIndex = np.atleast_2d(depthIndex)
+        self.fitness = np.atleast_2d(fitness)
+
+    @classmethod
+    def fromResult(cls, result, lakeGrid=None):
+        """Converts the result of runEnsemble, runStrategy or an oracle. Results that only know
+        their grid rows (runStrategy, the oracles) need the grid they were run on.
+        """
+        if isinstance(result, Trajectories):
+            return result
+        times = getattr(result, 'times', None)
+        depthAxis = getattr(result, 'depthAxis', None)
+        if times is None or depthAxis is None:
+            if lakeGrid is None:
+                raise ValueError('%s needs the LakeGrid it was run on' % type(result).__name__)
+            times = lakeGrid.times[result.rows] if times is None else times
+            depthAxis = lakeGrid.depths if depthAxis is None else depthAxis
+        return cls(times, depthAxis, result.depthIndex, result.fitness)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Joins trajectories of consecutive stretches of time, eg. the chunks of a streaming run."""
+        parts = list(parts)
+        return cls(np.concatenate([p.times for p in parts]), parts[0].depthAxis,
+                   np.concatenate([p.depthIndex for p in parts], axis=1), np.concatenate([p.fitness for p in parts], axis=1))
+
+    @property
+    def depths(self):
+        """(N, T) depth in meters of every agent at every hour."""
+        return self.depthAxis[self.depthIndex].astype(np.float32)
+
+    def arrays(self):
+        return {'times': self.times, 'depthAxis': self.depthAxis, 'depthIndex': self.depthIndex, 'fitness': self.fitness}
+
+class Bundle(object):
+    """What readBundle returns: any of a lake grid, its fitness grid and named trajectories, plus metadata."""
+    def __init__(self, grid=None, fitness=None, trajectories=None, meta=None):
+        self.grid = grid
+        self.fitness = fitness
+        self.trajectories = {} if trajectories is None else trajectories
+        self.meta = {} if meta is None else meta
+
+## bundles ##
+
+def writeBundle(filename, grid=None, fitness=None, trajectories=None, meta=None, format='npz'):
+    """Writes a lake grid, its fitness grid and strategy trajectories as typed columns, the
+    replacement for writeCSV. Nothing is converted to text, so reading it back is a memory copy.
+
+    'npz' writes one compressed .npz file. 'parquet' (needs pyarrow) writes a directory with a
+    long table per item, for use from other tools; the metadata goes into each table's schema.
+    The parquet grid table only has the cells with a value, so hours without any come back absent.
+
+    Args:
+        filename: the .npz file or parquet directory
+        grid: optional LakeGrid
+        fitness: optional (T, D) fitness aligned with grid
+        trajectories: optional dictionary name -> EnsembleResult, StrategyResult, OracleResult or Trajectories
+        meta: optional json serialisable dictionary, should hold META_KEYS (lake, year, resolution, model, seed)
+        format: 'npz' or 'parquet'
+    """
+    if format not in FORMATS:
+        raise ValueError('unknown format %r, choose from %s' % (format, FORMATS))
+    trajectories = dict((name, Trajectories.fromResult(result, grid)) for name, result in (trajectories or {}).items())
+    meta = dict(meta or {}, bundleVersion=BUNDLE_VERSION)
+    if fitness is not None and (grid is None or np.shape(fitness) != grid.shape):
+        raise ValueError('fitness must come with the LakeGrid it is aligned with')
+    if format == 'parquet':
+        _writeParquet(filename, grid, fitness, trajectories, meta)
+        return
+
+    arrays = {'meta': np.array(json.dumps(meta, default=str))}
+    if grid is not None:
+        arrays.update(('grid.' + name, getattr(grid, name)) for name in GRID_ARRAYS)
+        arrays['grid.qualityLabels'] = np.array(grid.qualityLabels)
+    if fitness is not None:
+        arrays['fitness'] = np.asarray(fitness)
+    for name, trajectory in trajectories.items():
+        arrays.update(('trajectory.%s.%s' % (name, key), value) for key, value in trajectory.arrays().items())
+    with open(filename, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+
+def readBundle(filename):
+    """Reads a bundle written by writeBundle, in either format.
+
+    Returns:
+        Bundle
+    """
+    if os.path.isdir(filename):
+        return _readParquet(filename)
+    with np.load(filename) as data:
+        bundle = Bundle(meta=json.loads(str(data['meta'])))
+        if 'grid.times' in data.files:
+            bundle.grid = LakeGrid(*[data['grid.' + name] for name in GRID_ARRAYS],
+                                   qualityLabels=data['grid.qualityLabels'].tolist())
+        if 'fitness' in data.files:
+            bundle.fitness = data['fitness']
+        names = sorted(set(key[len('trajectory.'):key.rindex('.')] for key in data.files if key.startswith('trajectory.')))
+        for name in names:
+            get = lambda key: data['trajectory.%s.%s' % (name, key)]
+            bundle.trajectories[name] = Trajectories(get('times'), get('depthAxis'), get('depthIndex'), get('fitness'))
+    return bundle
+
+## incremental output ##
+
+class TrajectoryWriter(object):
+    """Writes strategy results to a directory as they are produced, one compressed part per
+    append, so long ensembles and streaming runs never hold every trajectory in memory and a
+    crash keeps everything written so far. The manifest is replaced atomically after each part.
+
+    Args:
+        directory: the output directory, created if needed
+        meta: optional json serialisable dictionary, see META_KEYS
+        resume: keep appending to the parts already in the directory instead of starting over
+    """
+    def __init__(self, directory, meta=None, resume=False):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        manifestFile = os.path.join(directory, 'manifest.json')
+        if resume and os.path.isfile(manifestFile):
+            with open(manifestFile) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'meta': dict(meta or {}, bundleVersion=BUNDLE_VERSION), 'parts': []}
+            self._writeManifest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, name, result, lakeGrid=None):
+        """Writes the next stretch of a named trajectory, eg. one StreamChunk's result of a strategy.
+
+        Args:
+            name: the strategy (or run) name, parts of the same name are joined in time by readTrajectories
+            result: EnsembleResult, StrategyResult, OracleResult or Trajectories
+            lakeGrid: the grid the result was run on, needed by StrategyResult and OracleResult
+        """
+        trajectory = Trajectories.fromResult(result, lakeGrid)
+        self._writePart({'kind': 'trajectory', 'name': name}, trajectory.arrays())
+
+    def appendRun(self, result):
+        """Writes one result dictionary of runSweep (the run settings go into the manifest)."""
+        arrays = dict((key, np.asarray(value)) for key, value in result.items() if key not in ('run', 'error'))
+        self._writePart({'kind': 'run', 'run': result.get('run'), 'error': result.get('error')}, arrays)
+
+    def truncate(self, count):
+        """Drops every part after the first count, eg. the parts written after the last checkpoint of a run."""
+        dropped, self.manifest['parts'] = self.manifest['parts'][count:], self.manifest['parts'][:count]
+        self._writeManifest()
+        for entry in dropped:
+            path = os.path.join(self.directory, entry['file'])
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def close(self):
+        self._writeManifest()
+
+    def _writePart(self, entry, arrays):
+        entry['file'] = 'part-%05d.npz' % len(self.manifest['parts'])
+        with open(os.path.join(self.directory, entry['file']), 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        self.manifest['parts'].append(entry)
+        self._writeManifest()
+
+    def _writeManifest(self):
+        staging = os.path.join(self.directory, '.manifest.json')
+        with open(staging, 'w') as f:
+            json.dump(self.manifest, f, default=str)
+        os.replace(staging, os.path.join(self.directory, 'manifest.json'))
+
+def readTrajectories(directory):
+    """Reads a directory written by TrajectoryWriter.
+
+    Returns:
+        trajectories: dictionary name -> Trajectories, parts joined in the order they were written
+        runs: list of runSweep result dictionaries
+        meta: the metadata
+    """
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    parts, runs = {}, []
+    for entry in manifest['parts']:
+        with np.load(os.path.join(directory, entry['file'])) as data:
+            arrays = dict((key, data[key]) for key in data.files)
+        if entry['kind'] == 'trajectory':
+            parts.setdefault(entry['name'], []).append(
+                Trajectories(arrays['times'], arrays['depthAxis'], arrays['depthIndex'], arrays['fitness']))
+        else:
+            arrays['run'] = entry['run']
+            if entry.get('error') is not None:
+                arrays['error'] = entry['error']
+            runs.append(arrays)
+    trajectories = dict((name, Trajectories.concatenate(chunks)) for name, chunks in parts.items())
+    return trajectories, runs, manifest['meta']
+
+## helper functions ##
+
+def _requirePyarrow():
+    if pyarrow is None:
+        raise ImportError("format='parquet' needs pyarrow, use format='npz' or install pyarrow")
+
+def _writeParquet(directory, grid, fitness, trajectories, meta):
+    _requirePyarrow()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    schemaMeta = {b'meta': json.dumps(meta, default=str).encode('utf-8')}
+    if grid is not None:
+        rows, cols = np.nonzero(grid.flags != 0) if grid.temps.size else (np.zeros(0, int), np.zeros(0, int))
+        columns = {'time': grid.times[rows].astype(PARQUET_TIME), 'depth': grid.depths[cols], 'temp': grid.temps[rows, cols],
+                   'flag': grid.flags[rows, cols], 'quality': np.array(grid.qualityLabels)[grid.quality[rows, cols]]}
+        if fitness is not None:
+            columns['fitness'] = np.asarray(fitness)[rows, cols]
+        _writeTable(os.path.join(directory, 'grid.parquet'), columns, schemaMeta)
+    for name, trajectory in trajectories.items():
+        nAgents, nTimes = trajectory.depthIndex.shape
+        columns = {'agent': np.repeat(np.arange(nAgents), nTimes), 'time': np.tile(trajectory.times.astype(PARQUET_TIME), nAgents),
+                   'depth': trajectory.depths.reshape(-1), 'fitness': trajectory.fitness.reshape(-1)}
+        _writeTable(os.path.join(directory, 'trajectory.%s.parquet' % name), columns, schemaMeta)
+
+def _writeTable(filename, columns, schemaMeta):
+    table = pyarrow.table(columns)
+    pyarrow.parquet.write_table(table.replace_schema_metadata(schemaMeta), filename, compression='zstd')
+
+def _readParquet(directory):
+    _requirePyarrow()
+    bundle = Bundle()
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.parquet'):
+            continue
+        table = pyarrow.parquet.read_table(os.path.join(directory, filename))
+        bundle.meta = json.loads(table.schema.metadata[b'meta'].decode('utf-8'))
+        columns = dict((name, table.column(name).to_numpy()) for name in table.column_names)
+        if filename == 'grid.parquet':
+            bundle.grid, bundle.fitness = _gridFromColumns(columns)
+        else:
+            name = filename[len('trajectory.'):-len('.parquet')]
+            agents, agentIndex = np.unique(columns['agent'], return_inverse=True)
+            times = columns['time'][agentIndex == 0]
+            depthAxis, depthIndex = np.unique(columns['depth'], return_inverse=True)
+            shape = (len(agents), len(times))
+            bundle.trajectories[name] = Trajectories(times, depthAxis, depthIndex.reshape(shape),
+                                                     columns['fitness'].reshape(shape))
+    return bundle
+
+def _gridFromColumns(columns):
+    times, rows = np.unique(columns['time'].astype(TIME_UNIT), return_inverse=True)
+    depths, cols = np.unique(columns['depth'], return_inverse=True)
+    uniqueLabels, quality = np.unique(columns['quality'].astype(str), return_inverse=True)
+    labels = [''] + [label for label in uniqueLabels.tolist() if label != '']
+    codes = np.array([labels.index(label) for label in uniqueLabels.tolist()], dtype=np.uint8)
+    shape = (len(times), len(depths))
+    temps = np.full(shape, np.nan, dtype=np.float32)
+    flags = np.zeros(shape, dtype=np.uint8)
+    qualityGrid = np.zeros(shape, dtype=np.uint8)
+    temps[rows, cols] = columns['temp']
+    flags[rows, cols] = columns['flag']
+    qualityGrid[rows, cols] = codes[quality]
+    fitness = None
+    if 'fitness' in columns:
+        fitness = np.full(shape, np.nan, dtype=columns['fitness'].dtype)
+        fitness[rows, cols] = columns['fitness']
+    return LakeGrid(times, depths, temps, flags, qualityGrid, labels), fitness
@@ -0,0 +1,281 @@
+import numpy as np
+
+from lakeGrid import TIME_UNIT, DEPTH_DECIMALS
+
+DAY_SLOTS = 366 #one slot per month-day of a leap year, so 02-29 has a slot of its own
+FEB_28 = 58
+FEB_29 = 59
+MINUTES_PER_DAY = 1440
+
+class ClimatologyAccumulator(object):
+    """Running statistics of temperature for every (month-day, hour, depth), the incremental
+    replacement for groupAllDates + averageOverYears. With stepsPerDay other than 24 the slots are
+    steps of the day instead of hours, eg. 144 for a 10 minute climatology of hires data.
+
+    Only counts, means and (optionally) the spread are kept, so memory does not grow with the
+    length of the record. Accumulators built from separate years or separate worker processes
+    can be merged, and they can be saved to and loaded from disk.
+
+    Args:
+        depths: initial depth axis, grows as new depths are added
+        trackSpread: also keep the variance, minimum and maximum
+        stepsPerDay: number of time slots per day, must divide 1440 minutes
+    """
+    def __init__(self, depths=(), trackSpread=False, stepsPerDay=24):
+        if MINUTES_PER_DAY % stepsPerDay:
+            raise ValueError('stepsPerDay must divide %d minutes, got %r' % (MINUTES_PER_DAY, stepsPerDay))
+        self.depths = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        self.trackSpread = trackSpread
+        self.stepsPerDay = stepsPerDay
+        shape = (DAY_SLOTS, stepsPerDay, len(self.depths))
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.total = np.zeros(shape, dtype=np.float64) #sum of temperatures
+        if trackSpread:
+            self.m2 = np.zeros(shape, dtype=np.float64) #sum of squared differences from the mean
+            self.minimum = np.full(shape, np.inf, dtype=np.float32)
+            self.maximum = np.full(shape, -np.inf, dtype=np.float32)
+
+    @classmethod
+    def fromGrid(cls, lakeGrid, trackSpread=False, stepsPerDay=24):
+        """Returns an accumulator holding every value of a LakeGrid."""
+        accumulator = cls(lakeGrid.depths, trackSpread, stepsPerDay)
+        accumulator.addGrid(lakeGrid)
+        return accumulator
+
+    ## updates ##
+
+    def addGrid(self, lakeGrid, rows=None):
+        """Adds the temperatures of a LakeGrid (or some of its rows).
+
+        Args:
+            lakeGrid: LakeGrid
+            rows: optional row selection, eg. only the newly arrived hours
+        """
+        times, temps = lakeGrid.times, lakeGrid.temps
+        if rows is not None:
+            times, temps = times[rows], temps[rows]
+        self.add(times, lakeGrid.depths, temps)
+
+    def add(self, times, depths, temps):
+        """Adds a (T, D) block of temperatures. The cost is proportional to the new data only.
+
+        Args:
+            times: (T,) datetime64 times
+            depths: (D,) depths
+            temps: (T, D) temperatures, NaN where there is no value
+        """
+        if len(times) == 0:
+            return
+        cols = self._columns(depths)
+        key, starts, cells, temps, valid, values, count, total = self._group(times, temps)
+
+        flatCount = self.count.reshape(self._cells, -1)
+        flatTotal = self.total.reshape(self._cells, -1)
+        if self.trackSpread:
+            groupSizes = np.diff(np.append(starts, len(key)))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                batchMean = np.repeat(total / count, groupSizes, axis=0)
+            deviation = np.where(valid, values - batchMean, 0)
+            m2 = np.add.reduceat(deviation ** 2, starts, axis=0)
+            minimum = np.minimum.reduceat(np.where(valid, temps, np.inf), starts, axis=0)
+            maximum = np.maximum.reduceat(np.where(valid, temps, -np.inf), starts, axis=0)
+            self._mergeSpread(cells, cols, count, total, m2, minimum, maximum)
+        flatCount[np.ix_(cells, cols)] += count
+        flatTotal[np.ix_(cells, cols)] += total
+
+    def remove(self, times, depths, temps):
+        """Takes back a block that was added before, eg. a step of the newest data that was still
+        filling up when it was added. Only counts and totals can be taken back.
+
+        Args:
+            times: (T,) datetime64 times
+            depths: (D,) depths
+            temps: (T, D) temperatures, exactly as they were added
+        """
+        if self.trackSpread:
+            raise ValueError('values cannot be removed from an accumulator that tracks the spread')
+        if len(times) == 0:
+            return
+        cols = self._columns(depths)
+        _, _, cells, _, _, _, count, total = self._group(times, temps)
+        self.count.reshape(self._cells, -1)[np.ix_(cells, cols)] -= count
+        self.total.reshape(self._cells, -1)[np.ix_(cells, cols)] -= total
+
+    def slots(self, times):
+        """The flat (month-day, step) slot of each time, the index into mean().reshape(-1, D)."""
+        return dayOfYearSlot(times) * self.stepsPerDay + stepOfDay(times, self.stepsPerDay)
+
+    def merge(self, other):
+        """Adds the statistics of another accumulator (eg. another year or another worker) in place.
+
+        Args:
+            other: ClimatologyAccumulator
+        Returns:
+            self
+        """
+        if other.stepsPerDay != self.stepsPerDay:
+            raise ValueError('cannot merge accumulators with %d and %d steps per day' % (self.stepsPerDay, other.stepsPerDay))
+        cols = self._columns(other.depths)
+        cells = np.arange(self._cells)
+        otherCount = other.count.reshape(self._cells, -1)
+        otherTotal = other.total.reshape(self._cells, -1)
+        if self.trackSpread:
+            if not other.trackSpread:
+                raise ValueError('cannot merge an accumulator without spread into one that tracks it')
+            self._mergeSpread(cells, cols, otherCount, otherTotal, other.m2.reshape(self._cells, -1),
+                              other.minimum.reshape(self._cells, -1), other.maximum.reshape(self._cells, -1))
+        self.count.reshape(self._cells, -1)[:, cols] += otherCount
+        self.total.reshape(self._cells, -1)[:, cols] += otherTotal
+        return self
+
+    ## results ##
+
+    def mean(self, depths=None, leapFallback=True):
+        """The average temperature of every (month-day, hour, depth).
+
+        Args:
+            depths: optional depth axis to return the averages on (eg. a LakeGrid's depths),
+                depths the accumulator has never seen come out as NaN
+            leapFallback: use 02-28 where 02-29 has no data
+
+        Returns:
+            (366, stepsPerDay, D) float32 array, NaN where there is no data
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(self.count > 0, self.total / self.count, np.nan).astype(np.float32)
+        if leapFallback:
+            missing = np.isnan(mean[FEB_29])
+            mean[FEB_29][missing] = mean[FEB_28][missing]
+        return self._onDepths(mean, depths)
+
+    def variance(self, depths=None):
+        """The population variance of every (month-day, hour, depth), NaN where there is no data."""
+        self._requireSpread()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = np.where(self.count > 0, self.m2 / self.count, np.nan).astype(np.float32)
+        return self._onDepths(variance, depths)
+
+    def range(self, depths=None):
+        """The minimum and maximum of every (month-day, hour, depth), NaN where there is no data."""
+        self._requireSpread()
+        empty = self.count == 0
+        minimum = np.where(empty, np.nan, self.minimum).astype(np.float32)
+        maximum = np.where(empty, np.nan, self.maximum).astype(np.float32)
+        return self._onDepths(minimum, depths), self._onDepths(maximum, depths)
+
+    ## persistence ##
+
+    def save(self, filename):
+        """Writes the accumulator to a .npz file."""
+        arrays = {'depths': self.depths, 'count': self.count, 'total': self.total, 'stepsPerDay': self.stepsPerDay}
+        if self.trackSpread:
+            arrays.update({'m2': self.m2, 'minimum': self.minimum, 'maximum': self.maximum})
+        with open(filename, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        """Reads an accumulator written by save()."""
+        with np.load(filename) as data:
+            stepsPerDay = int(data['stepsPerDay']) if 'stepsPerDay' in data.files else 24
+            accumulator = cls(data['depths'], 'm2' in data.files, stepsPerDay)
+            accumulator.count = data['count']
+            accumulator.total = data['total']
+            if accumulator.trackSpread:
+                accumulator.m2 = data['m2']
+                accumulator.minimum = data['minimum']
+                accumulator.maximum = data['maximum']
+        return accumulator
+
+    ## helper functions ##
+
+    def _columns(self, depths):
+        """Column of each depth, growing the depth axis for depths not seen before."""
+        depths = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        new = np.setdiff1d(depths, self.depths)
+        if len(new):
+            axis = np.union1d(self.depths, new)
+            old = np.searchsorted(axis, self.depths)
+            for name, fill in self._arrays():
+                grown = np.full((DAY_SLOTS, self.stepsPerDay, len(axis)), fill, dtype=getattr(self, name).dtype)
+                grown[:, :, old] = getattr(self, name)
+                setattr(self, name, grown)
+            self.depths = axis
+        return np.searchsorted(self.depths, depths)
+
+    def _group(self, times, temps):
+        """Sorts a block by slot and sums it per slot."""
+        key = self.slots(times)
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        starts = np.flatnonzero(np.concatenate([[True], key[1:] != key[:-1]]))
+        temps = np.asarray(temps)[order]
+        valid = ~np.isnan(temps)
+        values = np.where(valid, temps, 0).astype(np.float64)
+        count = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+        total = np.add.reduceat(values, starts, axis=0)
+        return key, starts, key[starts], temps, valid, values, count, total
+
+    @property
+    def _cells(self):
+        return DAY_SLOTS * self.stepsPerDay
+
+    def _arrays(self):
+        arrays = [('count', 0), ('total', 0)]
+        if self.trackSpread:
+            arrays += [('m2', 0), ('minimum', np.inf), ('maximum', -np.inf)]
+        return arrays
+
+    def _mergeSpread(self, cells, cols, count, total, m2, minimum, maximum):
+        """Combines the spread of new statistics into the stored ones (Chan et al. parallel variance).
+        Must be called before count and total are updated.
+        """
+        block = np.ix_(cells, cols)
+        flat = lambda name: getattr(self, name).reshape(self._cells, -1)
+        oldCount, oldTotal = flat('count')[block], flat('total')[block]
+        combined = oldCount + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = np.where(count > 0, total / np.maximum(count, 1), 0) - np.where(oldCount > 0, oldTotal / np.maximum(oldCount, 1), 0)
+            correction = np.where(combined > 0, delta ** 2 * oldCount * count / np.maximum(combined, 1), 0)
+        flat('m2')[block] += np.where(count > 0, m2, 0) + correction
+        flat('minimum')[block] = np.minimum(flat('minimum')[block], minimum)
+        flat('maximum')[block] = np.maximum(flat('maximum')[block], maximum)
+
+    def _onDepths(self, values, depths):
+        if depths is None:
+            return values
+        depths = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        out = np.full(values.shape[:2] + (len(depths),), np.nan, dtype=values.dtype)
+        known = np.isin(depths, self.depths)
+        out[:, :, known] = values[:, :, np.searchsorted(self.depths, depths[known])]
+        return out
+
+    def _requireSpread(self):
+        if not self.trackSpread:
+            raise ValueError('this accumulator was created with trackSpread=False')
+
+def dayOfYearSlot(times):
+    """Maps times onto month-day slots 0..365, the array equivalent of strftime('%m-%d').
+    Every year uses the leap year numbering, so 03-01 is slot 60 in all years.
+
+    Args:
+        times: datetime64 array
+    Returns:
+        int array of slots
+    """
+    times = np.asarray(times).astype(TIME_UNIT)
+    days = times.astype('datetime64[D]')
+    years = times.astype('datetime64[Y]')
+    dayOfYear = (days - years.astype('datetime64[D]')).astype(np.int64)
+    yearNumber = years.astype(np.int64) + 1970
+    leap = (yearNumber % 4 == 0) & ((yearNumber % 100 != 0) | (yearNumber % 400 == 0))
+    return np.where(~leap & (dayOfYear >= FEB_29), dayOfYear + 1, dayOfYear)
+
+def hourOfDay(times):
+    """Returns the hour (0..23) of each time."""
+    return stepOfDay(times, 24)
+
+def stepOfDay(times, stepsPerDay=24):
+    """Returns the step of the day (0..stepsPerDay - 1) each time falls in."""
+    times = np.asarray(times).astype(TIME_UNIT)
+    return (times - times.astype('datetime64[D]')).astype(np.int64) // (MINUTES_PER_DAY // stepsPerDay)
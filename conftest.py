@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from benchmark import WAUSAU, _legacyModules, syntheticLake, writeSyntheticFile
+from fitness import createFitnessGrid
+from gapFill import fillGaps, hourlyClimatology
+from interpolation import interpolateGrid
+from solar import computeSolarTable
+
+LAKE_YEARS = (2005, 2006)
+
+@pytest.fixture(scope='session')
+def legacy():
+    """(movementStrategies, formatData), the original dictionary code the array versions must match."""
+    try:
+        return _legacyModules()
+    except (ImportError, SyntaxError) as error:
+        pytest.skip('the original modules cannot be imported: %s' % error)
+
+@pytest.fixture(scope='session')
+def lakeYears():
+    return list(LAKE_YEARS)
+
+@pytest.fixture(scope='session')
+def lakeRecords():
+    """Two years of a small synthetic lake, with whole-day outages and single missing readings."""
+    return syntheticLake(years=len(LAKE_YEARS), nDepths=8, seed=11, startYear=LAKE_YEARS[0])
+
+@pytest.fixture(scope='session')
+def lakeFile(lakeRecords, tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp('lake') / 'lake.txt')
+    writeSyntheticFile(filename, lakeRecords)
+    return filename
+
+@pytest.fixture(scope='session')
+def monthFile(lakeRecords, tmp_path_factory):
+    """January of the first year, small enough for the original dictionary code."""
+    january = lakeRecords.times < np.datetime64('%d-02-01' % LAKE_YEARS[0], 'm')
+    filename = str(tmp_path_factory.mktemp('month') / 'january.txt')
+    writeSyntheticFile(filename, lakeRecords.take(january))
+    return filename
+
+@pytest.fixture(scope='session')
+def solarTable():
+    return computeSolarTable(WAUSAU[0], WAUSAU[1], LAKE_YEARS[0], LAKE_YEARS[-1], WAUSAU[2])
+
+@pytest.fixture(scope='session')
+def filledYear(lakeRecords):
+    """The gap filled sensor grid of the first year."""
+    measured = lakeRecords.toGrid()
+    filled, _ = fillGaps(measured, hourlyClimatology(measured), LAKE_YEARS[0])
+    return filled
+
+@pytest.fixture(scope='session')
+def lakeYear(filledYear, solarTable):
+    """(lakeGrid, fitness, daylight) of the first year on a 0.5 m grid."""
+    grid = interpolateGrid(filledYear, 0.5)
+    return grid, createFitnessGrid(grid), solarTable.isDaylight(grid.times)
@@ -0,0 +1,141 @@
+import json
+import os
+import numpy as np
+
+from bundle import Trajectories, TrajectoryWriter
+from ensemble import makeKernel
+from metrics import nullMetrics
+from strategyEngine import DenseSource, EngineState, runStrategy
+
+CHECKPOINT_VERSION = 1
+
+def runContinuous(lakes, strategy, directory, nAgents=1, seed=None, years=None, checkpointHours=720,
+                  probabilityFactor=0.5, speed='slow', blockSize=720, metrics=None):
+    """Runs a strategy without interruption over several consecutive years, checkpointing as it goes.
+
+    Instead of restarting at a random depth every year (the start/end window of dateString), the
+    agents carry their depth, random streams and accumulated fitness from one year into the next,
+    and are snapped onto the new year's depths like onto any other hour. Every checkpointHours
+    rows of the grid, the trajectory written so far and the engine state are committed to the
+    directory. Calling runContinuous again with the same arguments, eg. after the node running it
+    was preempted, continues from the last checkpoint, and gives the same trajectories as a run
+    that was never interrupted. A finished run is just read back.
+
+    Args:
+        lakes: dictionary year -> (lakeGrid, fitness, daylight), or a LakeStore. Every year must
+            share the same depth axis.
+        strategy: one of ensemble.STRATEGIES
+        directory: the output and checkpoint directory
+        nAgents: the number of agents
+        seed: seed of the per-agent random streams, a random one is drawn (and kept in the
+            checkpoint) when None
+        years: the years to run through, in order, defaults to every year of lakes
+        checkpointHours: rows of the grid simulated between checkpoints
+        probabilityFactor: the weight of the coin flipped by randomWalkDirectional
+        speed: 'slow' or 'fast', the circadian migration speed
+        blockSize: hours of random numbers drawn per agent at a time
+        metrics: optional Metrics
+
+    Returns:
+        Trajectories of the whole run (see readContinuous)
+    """
+    if checkpointHours < 1:
+        raise ValueError('checkpointHours must be at least 1, got %r' % (checkpointHours,))
+    metrics = nullMetrics(metrics)
+    years = sorted(lakes.keys()) if years is None else [int(year) for year in years]
+    settings = {'strategy': strategy, 'nAgents': nAgents, 'seed': seed, 'years': years,
+                'probabilityFactor': probabilityFactor, 'speed': speed, 'blockSize': blockSize}
+    kernel = makeKernel(strategy, probabilityFactor, speed)
+
+    checkpoint = readCheckpoint(directory)
+    if checkpoint is not None:
+        previous = checkpoint['settings']
+        if seed is None:
+            settings['seed'] = previous['seed']
+        if previous != settings:
+            raise ValueError('%s holds a run with other settings: %s' % (directory, previous))
+        if checkpoint['done']:
+            return readContinuous(directory)
+        state = EngineState.load(os.path.join(directory, checkpoint['state']))
+        writer = TrajectoryWriter(directory, resume=True)
+        writer.truncate(checkpoint['parts']) #parts written after the checkpoint are simulated again
+        year, row = checkpoint['year'], checkpoint['row']
+    else:
+        if seed is None:
+            settings['seed'] = np.random.SeedSequence().entropy
+        state = EngineState.fresh(nAgents, settings['seed'])
+        writer = TrajectoryWriter(directory, {'strategy': strategy, 'seed': settings['seed'], 'nAgents': nAgents})
+        year, row = years[0], 0
+        checkpoint = {'version': CHECKPOINT_VERSION, 'settings': settings, 'state': None, 'year': year, 'row': row,
+                      'parts': 0, 'done': False}
+
+    depthAxis = None
+    for current in years[years.index(year):]:
+        lakeGrid, fitness, daylight = lakes[current]
+        if depthAxis is None:
+            depthAxis = lakeGrid.depths
+        elif not np.array_equal(depthAxis, lakeGrid.depths):
+            raise ValueError('%d has another depth axis than the years before it' % current)
+        source = DenseSource(lakeGrid, fitness)
+        start = row if current == year else 0
+        for lo in range(start, len(source), checkpointHours):
+            hi = min(lo + checkpointHours, len(source))
+            with metrics.timed('strategies', rows=hi - lo):
+                result = runStrategy(source, kernel, daylight=daylight, rows=np.arange(lo, hi), state=state,
+                                     blockSize=blockSize)
+            metrics.update(result.counters, 'strategy.%s.' % strategy)
+            writer.append(strategy, result, lakeGrid)
+            checkpoint = _commit(directory, checkpoint, state, current, hi, len(writer.manifest['parts']))
+        if hasattr(lakes, 'release'):
+            lakes.release(current)
+
+    checkpoint['done'] = True
+    _writeCheckpoint(directory, checkpoint)
+    return readContinuous(directory)
+
+def readCheckpoint(directory):
+    """The checkpoint of a run: its settings, the year and row it reached, the number of
+    trajectory parts it covers, its state file and whether it is done. None if there is none.
+    """
+    checkpointFile = os.path.join(directory, 'checkpoint.json')
+    if not os.path.isfile(checkpointFile):
+        return None
+    with open(checkpointFile) as f:
+        return json.load(f)
+
+def readContinuous(directory):
+    """The trajectories of a (possibly unfinished) run, up to its last checkpoint.
+
+    Returns:
+        Trajectories
+    """
+    checkpoint = readCheckpoint(directory)
+    if checkpoint is None:
+        raise ValueError('%s holds no checkpoint' % directory)
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        parts = json.load(f)['parts'][:checkpoint['parts']]
+    chunks = []
+    for entry in parts:
+        with np.load(os.path.join(directory, entry['file'])) as data:
+            chunks.append(Trajectories(data['times'], data['depthAxis'], data['depthIndex'], data['fitness']))
+    return Trajectories.concatenate(chunks)
+
+## helper functions ##
+
+def _commit(directory, checkpoint, state, year, row, parts):
+    """Saves the state under a new name, then points the checkpoint at it."""
+    stateFile = 'state-%05d.npz' % parts
+    state.save(os.path.join(directory, stateFile))
+    old = checkpoint['state']
+    checkpoint = dict(checkpoint, state=stateFile, year=year, row=row, parts=parts, done=False,
+                      steps=state.steps, totalFitness=state.totalFitness.tolist())
+    _writeCheckpoint(directory, checkpoint)
+    if old is not None and old != stateFile:
+        os.remove(os.path.join(directory, old))
+    return checkpoint
+
+def _writeCheckpoint(directory, checkpoint):
+    staging = os.path.join(directory, '.checkpoint.json')
+    with open(staging, 'w') as f:
+        json.dump(checkpoint, f, indent=1)
+    os.replace(staging, os.path.join(directory, 'checkpoint.json'))
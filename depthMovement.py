@@ -0,0 +1,331 @@
+import abc
+import numpy as np
+
+from fitness import getGrowthModel
+from interpolation import METHODS, interpolateProfiles
+from strategyEngine import EngineState, agentStreams
+
+#m/h, the index distances of circadianMovement (2 and 4 per hour) on the default 0.1 m grid
+CIRCADIAN_SPEED = {'slow': 0.2, 'fast': 0.4}
+DEFAULT_SPEED = 0.1 #m/h, one index per hour on the default 0.1 m grid
+
+## profile source ##
+
+class ProfileSource(object):
+    """Temperature and fitness at any real depth, read by interpolating each hour's profile.
+
+    Works on any LakeGrid: the gap filled sensor grid is the cheapest, and an interpolated grid of
+    any resolution gives the same values with 'linear' (its axis holds the sensor depths).
+
+    Args:
+        lakeGrid: LakeGrid, usually the gap filled sensor grid
+        method: 'linear', 'density' or 'spline', see interpolateGrid
+        model: the name of a registered growth model
+        params: optional parameter overrides for the model
+    """
+    def __init__(self, lakeGrid, method='linear', model='synechococcus', params=None):
+        if method not in METHODS:
+            raise ValueError('unknown interpolation method %r, choose from %s' % (method, METHODS))
+        self.lakeGrid = lakeGrid
+        self.times = lakeGrid.times
+        self.method = method
+        self._growth, self._parameters = getGrowthModel(model, params)
+        first, last = lakeGrid.validRange()
+        self.hasData = first >= 0
+        self.top = np.where(self.hasData, lakeGrid.depths[np.maximum(first, 0)], np.nan)
+        self.bottom = np.where(self.hasData, lakeGrid.depths[np.maximum(last, 0)], np.nan)
+
+    def __len__(self):
+        return len(self.times)
+
+    def temperatureAt(self, t, depths):
+        """Temperature at row t and any array of depths, which are clamped to the profile."""
+        depths = np.asarray(depths, dtype=np.float64)
+        profile = self.lakeGrid.temps[t]
+        sensors = np.flatnonzero(~np.isnan(profile))
+        x = self.lakeGrid.depths[sensors]
+        target = np.clip(depths, x[0], x[-1]).reshape(-1)
+        y = profile[sensors][None, :].astype(np.float64)
+        return interpolateProfiles(x, y, target, self.method)[0].reshape(depths.shape)
+
+    def fitnessAt(self, t, depths):
+        """Fitness at row t and any array of depths."""
+        return self.growth(self.temperatureAt(t, depths))
+
+    def growth(self, temps):
+        """The growth model evaluated at the given temperatures."""
+        return self._growth(temps, **self._parameters)
+
+## movement models ##
+
+class DepthContext(object):
+    """What a movement model sees at one hour: the agents' depths, the top and bottom of this
+    hour's profile, the hours since the last step, this step's random numbers and day/night.
+    """
+    def __init__(self, source, t, depths, top, bottom, hours, uniforms, daylight):
+        self.source = source
+        self.t = t
+        self.depths = depths
+        self.top = top
+        self.bottom = bottom
+        self.hours = hours
+        self.uniforms = uniforms
+        self.daylight = daylight
+
+    def randomDepth(self):
+        return self.top + self.uniforms * (self.bottom - self.top)
+
+    def fitnessAt(self, depths):
+        """(N, ...) fitness at the given depths, -inf outside this hour's profile."""
+        depths = np.asarray(depths)
+        inside = (depths >= self.top) & (depths <= self.bottom)
+        return np.where(inside, self.source.fitnessAt(self.t, depths), -np.inf)
+
+class DepthStrategy(abc.ABC):
+    """A movement strategy on real depths. Moves that would leave the lake stop at the surface
+    or the bottom of this hour's profile. Subclasses implement step, and set needsDaylight when
+    they read context.daylight.
+
+    Args:
+        speed: swimming speed in m/h
+    """
+    needsDaylight = False
+
+    def __init__(self, speed=DEFAULT_SPEED):
+        if speed <= 0:
+            raise ValueError('speed must be positive, got %r' % (speed,))
+        self.speed = speed
+
+    def start(self, context):
+        """Initial depth of every agent, uniform over the first profile."""
+        return context.randomDepth()
+
+    @abc.abstractmethod
+    def step(self, context):
+        """Proposed depth of every agent for this hour."""
+
+class DepthRandomWalk(DepthStrategy):
+    """randomWalk: a random depth every hour, wherever it is."""
+    def step(self, context):
+        return context.randomDepth()
+
+class DepthRandomWalkDirectional(DepthStrategy):
+    """randomWalkDirectional: speed shallower when the coin comes up above probabilityFactor,
+    otherwise speed deeper.
+    """
+    def __init__(self, speed=DEFAULT_SPEED, probabilityFactor=0.5):
+        super(DepthRandomWalkDirectional, self).__init__(speed)
+        self.probabilityFactor = probabilityFactor
+
+    def step(self, context):
+        distance = self.speed * context.hours
+        return np.where(context.uniforms > self.probabilityFactor, context.depths - distance, context.depths + distance)
+
+class DepthHillClimbing(DepthStrategy):
+    """hillClimbingMovement: swim deeper if the water one step deeper is fitter, then shallower
+    if the water one step up beats the best so far. A step is what the speed covers in the hour.
+    """
+    def step(self, context):
+        distance = self.speed * context.hours
+        probes = context.depths[:, None] + np.array([0.0, distance, -distance])[None, :]
+        here, deeper, shallower = context.fitnessAt(probes).T
+        better = deeper > here
+        moved = np.where(better, context.depths + distance, context.depths)
+        best = np.where(better, deeper, here)
+        return np.where(shallower > best, context.depths - distance, moved)
+
+class DepthCircadian(DepthStrategy):
+    """circadianMovement: up by day and down by night at speed, 'slow' and 'fast' being the
+    speeds of the original on the default 0.1 m grid.
+    """
+    needsDaylight = True
+
+    def __init__(self, speed='slow'):
+        if isinstance(speed, str):
+            if speed not in CIRCADIAN_SPEED:
+                raise ValueError('incorrect speed %r, choose from %s or m/h' % (speed, sorted(CIRCADIAN_SPEED)))
+            speed = CIRCADIAN_SPEED[speed]
+        super(DepthCircadian, self).__init__(speed)
+
+    def step(self, context):
+        distance = self.speed * context.hours
+        return context.depths - distance if context.daylight else context.depths + distance
+
+DEPTH_STRATEGIES = {}
+
+def registerDepthStrategy(name, model):
+    """Makes a DepthStrategy subclass available to makeDepthStrategy by name."""
+    DEPTH_STRATEGIES[name] = model
+
+def makeDepthStrategy(name, **settings):
+    """Builds a registered movement model, eg. makeDepthStrategy('circadian', speed=0.3)."""
+    if name not in DEPTH_STRATEGIES:
+        raise ValueError('unknown strategy %r, choose from %s' % (name, sorted(DEPTH_STRATEGIES)))
+    return DEPTH_STRATEGIES[name](**settings)
+
+registerDepthStrategy('randomWalk', DepthRandomWalk)
+registerDepthStrategy('randomWalkDirectional', DepthRandomWalkDirectional)
+registerDepthStrategy('hillClimbing', DepthHillClimbing)
+registerDepthStrategy('circadian', DepthCircadian)
+
+## engine ##
+
+class DepthState(EngineState):
+    """EngineState of a run on real depths: columns holds the depth of every agent in meters,
+    and lastTime the time of the last simulated hour, from which the next step's duration is taken.
+    """
+    def __init__(self, streams, columns=None, buffer=None, totalFitness=None, steps=0, lastTime=None):
+        super(DepthState, self).__init__(streams, columns, buffer, totalFitness, steps)
+        self.lastTime = lastTime
+
+    @classmethod
+    def fresh(cls, nAgents, seed=None):
+        return cls(agentStreams(nAgents, seed))
+
+    @property
+    def depths(self):
+        return self.columns
+
+    def _arrays(self):
+        arrays = super(DepthState, self)._arrays()
+        if self.lastTime is not None:
+            arrays['lastTime'] = self.lastTime
+        return arrays
+
+    @classmethod
+    def _fromArrays(cls, streams, arrays):
+        lastTime = arrays['lastTime'][()] if 'lastTime' in arrays else None
+        return cls(streams, arrays.get('columns'), arrays['buffer'], arrays['totalFitness'], int(arrays['steps']),
+                   lastTime)
+
+class DepthResult(object):
+    """Collected output of runDepthStrategy.
+
+    Args:
+        rows: the source rows simulated (the hours with data)
+        times: their times
+        depths: (N, T) depth in meters of every agent at every simulated hour
+        temps: (N, T) temperature at the agent
+        fitness: (N, T) fitness at the agent
+        counters: dictionary with the number of boundary 'clamps'
+        state: DepthState to continue the run from
+    """
+    def __init__(self, rows, times, depths, temps, fitness, counters, state):
+        self.rows = rows
+        self.times = times
+        self.depths = depths
+        self.temps = temps
+        self.fitness = fitness
+        self.counters = counters
+        self.state = state
+
+    @property
+    def totalFitness(self):
+        """(N,) fitness of every agent summed over the simulation."""
+        return np.nansum(self.fitness, axis=1, dtype=np.float64)
+
+def runDepthStrategy(source, strategy, nAgents=1, seed=None, daylight=None, rows=None, state=None, blockSize=720):
+    """Runs a movement model for nAgents agents whose depth is a real number, so the distance
+    covered per hour is set by the speed and not by the resolution of the grid.
+
+    Like runStrategy, only the hours with data are simulated, and a step covers the time since
+    the previous simulated hour, so speeds also hold across gaps and on 10 minute grids.
+    Depths outside this hour's profile (eg. after the deepest sensor went missing) are brought
+    back to its top or bottom.
+
+    Args:
+        source: ProfileSource
+        strategy: DepthStrategy instance (see makeDepthStrategy)
+        nAgents: number of agents, ignored when state is given
+        seed: seed for the per-agent random streams, ignored when state is given
+        daylight: optional (T,) booleans aligned with the source rows
+        rows: optional rows of the source to run over, defaults to all of them
+        state: optional DepthState to continue from
+        blockSize: random numbers drawn per agent at a time
+
+    Returns:
+        DepthResult
+    """
+    if strategy.needsDaylight and daylight is None:
+        raise ValueError('%s needs the daylight vector' % type(strategy).__name__)
+    if state is None:
+        state = DepthState.fresh(nAgents, seed)
+    nAgents = len(state.streams)
+    rows = np.arange(len(source)) if rows is None else np.asarray(rows)
+
+    simulated = []
+    depths = np.empty((len(rows), nAgents), dtype=np.float32)
+    temps = np.empty((len(rows), nAgents), dtype=np.float32)
+    fitness = np.empty((len(rows), nAgents), dtype=np.float32)
+    counters = {'clamps': 0}
+    uniforms = np.zeros((0, nAgents))
+
+    for t in rows:
+        if not source.hasData[t]:
+            continue
+        if len(uniforms) == 0:
+            uniforms = state.uniforms(blockSize, blockSize)
+        top, bottom = source.top[t], source.bottom[t]
+        now = source.times[t]
+        hours = 0.0 if state.lastTime is None else (now - state.lastTime) / np.timedelta64(60, 'm')
+        context = DepthContext(source, t, None, top, bottom, hours, uniforms[0],
+                               None if daylight is None else daylight[t])
+        uniforms = uniforms[1:]
+
+        if state.columns is None:
+            position = np.asarray(strategy.start(context), dtype=np.float64)
+        else:
+            context.depths = np.clip(state.columns, top, bottom)
+            proposed = np.asarray(strategy.step(context), dtype=np.float64)
+            outside = (proposed < top) | (proposed > bottom)
+            counters['clamps'] += int(outside.sum())
+            position = np.clip(proposed, top, bottom)
+
+        state.columns = position
+        state.lastTime = now
+        state.steps += 1
+        here = source.temperatureAt(t, position)
+        values = source.growth(here)
+        state.totalFitness = state.totalFitness + values
+        depths[len(simulated)] = position
+        temps[len(simulated)] = here
+        fitness[len(simulated)] = values
+        simulated.append(t)
+
+    #random numbers drawn but not used go back to the state, so a continued run sees them next
+    state.buffer = np.concatenate([uniforms.T, state.buffer], axis=1)
+    simulated = np.asarray(simulated, dtype=np.int64)
+    count = len(simulated)
+    return DepthResult(simulated, source.times[simulated], depths[:count].T, temps[:count].T, fitness[:count].T,
+                       counters, state)
+
+def runDepthEnsemble(lakeGrid, strategy, nAgents, seed=None, speed=None, probabilityFactor=0.5, daylight=None,
+                     method='linear', model='synechococcus', params=None, blockSize=720):
+    """runEnsemble for movement in meters: simulates nAgents agents of a strategy on any LakeGrid,
+    typically the gap filled sensor grid, with no interpolated grid needed.
+
+    Args:
+        lakeGrid: LakeGrid, eg. the output of fillGaps
+        strategy: a registered name, see DEPTH_STRATEGIES
+        nAgents: the number of agents
+        seed: seed for the per-agent random streams (see agentStreams)
+        speed: swimming speed in m/h ('slow' or 'fast' also work for circadian), defaults to the
+            speed of the original strategy on the default 0.1 m grid
+        probabilityFactor: the weight of the coin flipped by randomWalkDirectional
+        daylight: (T,) booleans aligned with lakeGrid, needed by circadian
+        method: 'linear', 'density' or 'spline' interpolation of the profiles
+        model: the name of a registered growth model
+        params: optional parameter overrides for the model
+        blockSize: hours of random numbers drawn per agent at a time
+
+    Returns:
+        DepthResult
+    """
+    settings = {}
+    if speed is not None:
+        settings['speed'] = speed
+    if strategy == 'randomWalkDirectional':
+        settings['probabilityFactor'] = probabilityFactor
+    kernel = makeDepthStrategy(strategy, **settings)
+    source = ProfileSource(lakeGrid, method, model, params)
+    return runDepthStrategy(source, kernel, nAgents, seed, daylight, blockSize=blockSize)
@@ -0,0 +1,79 @@
+import numpy as np
+
+from strategyEngine import DenseSource, makeStrategy, runStrategy
+
+STRATEGIES = ('randomWalk', 'randomWalkDirectional', 'hillClimbing', 'circadian')
+
+class EnsembleResult(object):
+    """Trajectories of an ensemble of agents.
+
+    Args:
+        times: (T,) datetime64 times simulated (the hours with data, like the dateList of the strategies)
+        depthAxis: the depth axis of the grid
+        depthIndex: (N, T) column of every agent at every hour
+        fitness: (N, T) fitness of every agent at every hour
+    """
+    def __init__(self, times, depthAxis, depthIndex, fitness):
+        self.times = times
+        self.depthAxis = depthAxis
+        self.depthIndex = depthIndex
+        self.fitness = fitness
+
+    @property
+    def depths(self):
+        """(N, T) depth in meters of every agent at every hour."""
+        return self.depthAxis[self.depthIndex].astype(np.float32)
+
+    @property
+    def totalFitness(self):
+        """(N,) fitness of every agent summed over the simulation."""
+        return np.nansum(self.fitness, axis=1, dtype=np.float64)
+
+def runEnsemble(lakeGrid, fitness, strategy, nAgents, seed=None, probabilityFactor=0.5, daylight=None, speed='slow',
+                blockSize=720):
+    """Simulates nAgents copies of a movement strategy at once, advancing an (N,) array of
+    depth indices per hour instead of one agent per Python loop.
+
+    The strategies follow randomWalk, randomWalkDirectional, hillClimbingMovement and
+    circadianMovement: each agent starts at a random depth and moves within the depths that have
+    data that hour. The hourly bookkeeping is done by strategyEngine.runStrategy.
+
+    Args:
+        lakeGrid: interpolated LakeGrid, or a source with the DenseSource interface such as
+            lazySource.LazySource, in which case fitness is None
+        fitness: (T, D) fitness aligned with lakeGrid
+        strategy: one of STRATEGIES
+        nAgents: the number of agents
+        seed: seed for the per-agent random streams (see agentStreams)
+        probabilityFactor: the weight of the coin flipped by randomWalkDirectional
+        daylight: (T,) booleans aligned with lakeGrid, needed by circadian (see SolarTable.isDaylight)
+        speed: 'slow' or 'fast', the circadian migration speed
+        blockSize: hours of random numbers drawn per agent at a time, bounds memory
+
+    Returns:
+        EnsembleResult
+    """
+    kernel = makeKernel(strategy, probabilityFactor, speed)
+    source = lakeGrid if fitness is None else DenseSource(lakeGrid, fitness)
+    result = runStrategy(source, kernel, nAgents, seed, daylight, blockSize=blockSize)
+    indexType = np.int16 if len(source.depths) < np.iinfo(np.int16).max else np.int32
+    return EnsembleResult(result.times, source.depths, result.depthIndex.astype(indexType), result.fitness)
+
+def makeKernel(strategy, probabilityFactor=0.5, speed='slow'):
+    """The engine kernel of one of STRATEGIES with its settings.
+
+    Args:
+        strategy: one of STRATEGIES
+        probabilityFactor: the weight of the coin flipped by randomWalkDirectional
+        speed: 'slow' or 'fast', the circadian migration speed
+
+    Returns:
+        Strategy
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError('unknown strategy %r, choose from %s' % (strategy, STRATEGIES))
+    if strategy == 'circadian':
+        return makeStrategy(strategy, speed=speed)
+    if strategy == 'randomWalkDirectional':
+        return makeStrategy(strategy, probabilityFactor=probabilityFactor)
+    return makeStrategy(strategy)
@@ -0,0 +1,126 @@
+import numpy as np
+
+## growth models ##
+
+GROWTH_MODELS = {}
+
+def registerGrowthModel(name, function, defaults):
+    """Registers a vectorized growth model so it can be selected by name.
+
+    Args:
+        name: the name used to select the model
+        function: function(temps, **params) returning growth rates for an array of temperatures
+        defaults: dictionary of default parameters
+    """
+    GROWTH_MODELS[name] = (function, dict(defaults))
+
+def getGrowthModel(name, params=None):
+    """Looks up a registered growth model.
+
+    Args:
+        name: the registered name
+        params: optional dictionary overriding some or all of the default parameters
+
+    Returns:
+        function, parameters
+    """
+    if name not in GROWTH_MODELS:
+        raise KeyError('unknown growth model %r, choose from %s' % (name, sorted(GROWTH_MODELS)))
+    function, defaults = GROWTH_MODELS[name]
+    parameters = dict(defaults)
+    if params:
+        unknown = set(params) - set(defaults)
+        if unknown:
+            raise KeyError('unknown parameters for %s: %s' % (name, sorted(unknown)))
+        parameters.update(params)
+    return function, parameters
+
+def synechococcusGrowth(temps, b1, b2, d0, d2, tOpt):
+    """Vectorized version of fitnessFunction.
+
+    Args:
+        temps: array of temperatures
+        b1: birth rate at 0C
+        b2: change in birth rate due to T
+        d0: temperature-independent mortality constant
+        d2: exp. changes to mortality due to incr. T
+        tOpt: the temperature at which growth rate is maximized
+
+    Returns:
+        growth rates with the same shape as temps
+    """
+    temps, real = _floatArray(temps)
+    mortality = real(d0) + real(((b1 * b2) / d2) * np.exp((b2 - d2) * tOpt)) * np.exp(real(d2) * temps)
+    return real(b1) * np.exp(real(b2) * temps) - mortality
+
+def doubleExponentialGrowth(temps, b1, b2, d0, d1, d2, scale):
+    """Vectorized version of doubleExponentialGrowthRate.
+
+    Args:
+        temps: array of temperatures
+        b1: birth rate at 0C
+        b2: change in birth rate due to T
+        d0: temperature-independent mortality constant
+        d1, d2: exp. changes to mortality due to incr. T
+        scale: the growth rate is divided by this
+
+    Returns:
+        growth rates with the same shape as temps
+    """
+    temps, real = _floatArray(temps)
+    return (real(b1) * np.exp(real(b2) * temps) - (real(d0) + real(d1) * np.exp(real(d2) * temps))) / real(scale)
+
+#these parameters come from Colin Kramer, for Cyanobacteria Synechococcus (which are in high abundance in Sparkling Lake)
+registerGrowthModel('synechococcus', synechococcusGrowth,
+                    {'b1': 14.59829888, 'b2': 0.008383057, 'd0': 9.301242586, 'd2': 0.016661372, 'tOpt': 33.95619378})
+#original version of fitness function used in thesis
+registerGrowthModel('doubleExponential', doubleExponentialGrowth,
+                    {'b1': 1.174, 'b2': 0.064, 'd0': 1.119, 'd1': 0.267, 'd2': 0.103, 'scale': 1.2})
+
+## fitness grids ##
+
+def fitnessGrid(temps, model='synechococcus', params=None, chunkRows=1024):
+    """Evaluates a growth model over a whole temperature array in one pass.
+
+    Args:
+        temps: (T, D) temperatures, NaN where there is no value
+        model: the name of a registered growth model
+        params: optional parameter overrides for the model
+        chunkRows: rows evaluated at a time, bounds the scratch memory
+
+    Returns:
+        fitness: float32 array aligned with temps, NaN where temps is NaN
+    """
+    function, parameters = getGrowthModel(model, params)
+    temps = np.asarray(temps)
+    fitness = np.empty(temps.shape, dtype=np.float32)
+    if temps.ndim < 2:
+        fitness[...] = function(temps, **parameters)
+        return fitness
+    for lo in range(0, temps.shape[0], chunkRows):
+        fitness[lo:lo + chunkRows] = function(temps[lo:lo + chunkRows], **parameters)
+    return fitness
+
+def createFitnessGrid(lakeGrid, model='synechococcus', params=None):
+    """Array version of createFitnessDict.
+
+    Args:
+        lakeGrid: LakeGrid of temperatures
+        model: the name of a registered growth model
+        params: optional parameter overrides for the model
+
+    Returns:
+        fitness: float32 (T, D) array aligned with lakeGrid.temps
+    """
+    return fitnessGrid(lakeGrid.temps, model, params)
+
+## helper functions ##
+
+def _floatArray(temps):
+    """Returns temps as a floating point array and its scalar type, so float32 grids are
+    evaluated in float32 (several times faster than upcasting) and parameters are cast to match.
+    """
+    temps = np.asarray(temps)
+    if temps.dtype.kind != 'f':
+        temps = temps.astype(np.float64)
+    return temps, temps.dtype.type
@@ -0,0 +1,148 @@
+import numpy as np
+
+from lakeGrid import TIME_UNIT, DEPTH_DECIMALS
+
+class FitnessIndex(object):
+    """Cumulative fitness along the time axis of a fitness grid, so the integrated or mean fitness
+    of any depth over any time window is two lookups, whatever the length of the window.
+
+    Replaces fitnessAtStableDepth for questions like "cumulative growth at 4 m from June 1 to
+    August 15" or "the best fixed depth of each week". Cells without data count as zero fitness
+    and are left out of the means.
+
+    Args:
+        times: sorted datetime64 time axis of the grid
+        depths: sorted depth axis
+        fitness: (T, D) fitness, NaN where there is no data
+    """
+    def __init__(self, times, depths, fitness):
+        self.times = np.asarray(times).astype(TIME_UNIT)
+        self.depths = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        fitness = np.asarray(fitness, dtype=np.float64)
+        if fitness.shape != (len(self.times), len(self.depths)):
+            raise ValueError('fitness has shape %s, expected %s' % (fitness.shape, (len(self.times), len(self.depths))))
+        valid = ~np.isnan(fitness)
+        #row r holds the sums over rows [0, r), so any window [a, b) is cumulative[b] - cumulative[a]
+        self.cumulative = np.zeros((len(self.times) + 1, len(self.depths)))
+        np.cumsum(np.where(valid, fitness, 0.0), axis=0, out=self.cumulative[1:])
+        self.counts = np.zeros((len(self.times) + 1, len(self.depths)), dtype=np.int64)
+        np.cumsum(valid, axis=0, out=self.counts[1:])
+
+    @classmethod
+    def fromGrid(cls, lakeGrid, fitness):
+        """Builds the index of a fitness grid aligned with a LakeGrid (see createFitnessGrid)."""
+        return cls(lakeGrid.times, lakeGrid.depths, fitness)
+
+    ## queries ##
+
+    def total(self, start, end, depths):
+        """Integrated fitness between start and end (inclusive) at each depth.
+
+        Args:
+            start: the start date, or an array of start dates
+            end: the end date, or an array of end dates (broadcast against start)
+            depths: a depth, or an array of depths (broadcast against the dates)
+
+        Returns:
+            float, or an array with the broadcast shape of the arguments
+        """
+        lo, hi, cols = self._query(start, end, depths)
+        return self._result(self.cumulative[hi, cols] - self.cumulative[lo, cols])
+
+    def hours(self, start, end, depths):
+        """Number of rows with data between start and end (inclusive) at each depth, same arguments as total()."""
+        lo, hi, cols = self._query(start, end, depths)
+        return self._result(self.counts[hi, cols] - self.counts[lo, cols])
+
+    def mean(self, start, end, depths):
+        """Mean fitness between start and end (inclusive) at each depth, NaN where there is no data.
+        Same arguments as total().
+        """
+        lo, hi, cols = self._query(start, end, depths)
+        count = self.counts[hi, cols] - self.counts[lo, cols]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, (self.cumulative[hi, cols] - self.cumulative[lo, cols]) / count, np.nan)
+        return self._result(mean)
+
+    def rankDepths(self, starts, ends, by='total'):
+        """Ranks every constant-depth strategy over each window.
+
+        Args:
+            starts: the start date of each window (or a single date)
+            ends: the end date of each window (inclusive)
+            by: 'total' (integrated fitness) or 'mean' (fitness per hour with data)
+
+        Returns:
+            order: (W, D) columns from best to worst, depths without data in a window last
+            scores: (W, D) score of each column, in depth order
+        """
+        if by not in ('total', 'mean'):
+            raise ValueError("by must be 'total' or 'mean', got %r" % (by,))
+        lo, hi = self._rows(np.atleast_1d(starts), np.atleast_1d(ends))
+        lo, hi = np.broadcast_arrays(lo, hi)
+        totals = self.cumulative[hi] - self.cumulative[lo]
+        count = self.counts[hi] - self.counts[lo]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = totals if by == 'total' else totals / count
+        scores = np.where(count > 0, scores, np.nan)
+        order = np.argsort(np.where(np.isnan(scores), np.inf, -scores), axis=1, kind='stable')
+        return order, scores
+
+    def bestDepth(self, starts, ends, by='total'):
+        """The best fixed depth of each window, NaN for windows without any data.
+
+        Returns:
+            depths: (W,) best depth of each window
+            scores: (W,) its score
+        """
+        order, scores = self.rankDepths(starts, ends, by)
+        best = order[:, 0]
+        score = scores[np.arange(len(best)), best]
+        return np.where(np.isnan(score), np.nan, self.depths[best]), score
+
+    def periods(self, unit='W'):
+        """Consecutive windows covering the index, eg. unit='W' for weeks or 'M' for months,
+        for use with rankDepths and bestDepth.
+
+        Returns:
+            starts, ends: datetime64 arrays, each end is the last minute of its window
+        """
+        if len(self.times) == 0:
+            empty = np.zeros(0, dtype=TIME_UNIT)
+            return empty, empty
+        if unit == 'W':
+            #numpy weeks start on Thursday (the epoch), shift so that they start on Monday like isocalendar
+            monday = np.datetime64('1970-01-05', 'D')
+            weeks = np.unique((self.times.astype('datetime64[D]') - monday).astype(np.int64) // 7)
+            starts = (monday + weeks * 7).astype(TIME_UNIT)
+            ends = starts + np.timedelta64(7, 'D')
+        else:
+            periods = np.unique(self.times.astype('datetime64[%s]' % unit))
+            starts, ends = periods.astype(TIME_UNIT), (periods + 1).astype(TIME_UNIT)
+        return starts, ends - np.timedelta64(1, 'm')
+
+    ## helper functions ##
+
+    def _rows(self, start, end):
+        """Cumulative rows bounding the inclusive window [start, end]."""
+        lo = np.searchsorted(self.times, np.asarray(start).astype(TIME_UNIT), side='left')
+        hi = np.searchsorted(self.times, np.asarray(end).astype(TIME_UNIT), side='right')
+        return lo, np.maximum(hi, lo)
+
+    def _columns(self, depths):
+        values = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        if len(self.depths) == 0:
+            raise ValueError('the fitness grid has no depths')
+        cols = np.clip(np.searchsorted(self.depths, values), 0, len(self.depths) - 1)
+        missing = self.depths[cols] != values
+        if np.any(missing):
+            raise ValueError('depths not on the fitness grid: %s' % np.unique(values[missing]).tolist())
+        return cols
+
+    def _query(self, start, end, depths):
+        lo, hi = self._rows(start, end)
+        cols = self._columns(depths)
+        return np.broadcast_arrays(lo, hi, cols)
+
+    def _result(self, values):
+        return values.item() if values.ndim == 0 else values
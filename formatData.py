@@ -7,6 +7,7 @@ from movementStrategies import getDatesBetweenRange
 ## Read in files ##
 def createDataMatrix(filename, resolution):
     """Transforms text file into usable matrix. Text files downloaded from https://lter.limnology.wisc.edu/
+    This parses one row at a time, temperatureLoader.loadTemperatureFile is the columnar equivalent.
 
     Args:
         filename: the text file 
@@ -38,7 +39,7 @@ def createDataMatrix(filename, resolution):
                 elif resolution == 'daily':
                     #These are the headers:
                     #sampledate,year4,month,daynum,depth,wtemp,flag_wtemp
-                    sampleDate = dateString(row[0]) #sampledate, this sets fake hour & min
+                    sampleDate = formateDateDaily(row[0]) #sampledate
 
                     savedData.append(sampleDate)
                     savedData.append(float(row[4])) # depth
@@ -50,15 +51,14 @@ def createDataMatrix(filename, resolution):
                     #These are the headers:
                     #sampledate,year4,month,daynum,sample_time,data_freq,depth,wtemp,flag_wtemp
                     sampleDate = formatDateHourly(row[0]) #sampleDate
-                    sampleTime = row[4] #sample_time
-                    sampleHour = sampleTime[:2]
-                    sampleMin = sampleTime[2:]
+                    sampleHour, sampleMin = divmod(int(float(row[4])), 100) #sample_time, eg. 1330 -> 13, 30
 
-                    savedData.append(sampleDate.replace(hour = sampleHour, min = sampleMin)) #sets to correct time
+                    savedData.append(sampleDate.replace(hour = sampleHour, minute = sampleMin)) #sets to correct time
                     savedData.append(float(row[6])) #depth
                     savedData.append(float(row[7])) #wtemp
                     savedData.append(row[8]) #flag_wtemp
                     savedData.append(row[5]) #data_freq
+                    dataMatrix.append(savedData)
 
             except:
                 f.write(','.join(row)+'\n')
@@ -160,13 +160,15 @@ def averageOverYears(dateDictionary):
 
     return dateDictionary
 
-def fillGapsInData(dataMatrixDict, dateDictionary, singleYear):
+def fillGapsInData(dataMatrixDict, dateDictionary, singleYear, step=datetime.timedelta(hours=1), metrics=None):
     """Fills each gap in time with an averaged value across all years.
     
     Args: 
         dataMatrixDict: the dictionary of depths and temperatures
         dateDictionary: grouped dictionary with lists of real temps replaced with single mean temp
         singleYear: the year of interest
+        step: the time step of the data, eg. datetime.timedelta(minutes=10) for resampled hires data
+        metrics: optional metrics.Metrics, counts the hours visited and the missing hours and depths filled
     
     Returns:
         dataMatrixDict: final dictionary with gaps filled
@@ -177,18 +179,14 @@ def fillGapsInData(dataMatrixDict, dateDictionary, singleYear):
 
     allDepths = set()
 
-    first, last = dateString(singleYear, True)
+    first, last = dateString(singleYear, True, step)
 
-    allDays = getDatesBetweenRange(first, last, True)
+    allDays = getDatesBetweenRange(first, last, step)
     for date in dataMatrixDict.keys():
         if date in allDays:
             allDepths.update(set(dataMatrixDict[date].keys()))
 
-    counter = 0
     for date in allDays:
-        counter += 1
-        if counter%500 == 0:
-            print '%d of %d'%(counter,len(allDays))
         dateKey = date.strftime('%m-%d %H:%M:%S')
         if dateKey not in dateDictionary:
             continue #because we don't have an average for it
@@ -204,23 +202,33 @@ def fillGapsInData(dataMatrixDict, dateDictionary, singleYear):
                     missingDepths += 1
                     dataMatrixDict[date][depth] = [dateDictionary[dateKey][depth]]
 
-    print "missing Hours: %d \nmissing Depths: %d"%(missingHours, missingDepths)
+    if metrics is not None:
+        metrics.count('fillGapsInData.hours', len(allDays))
+        metrics.count('fillGapsInData.missingHours', missingHours)
+        metrics.count('fillGapsInData.missingDepths', missingDepths)
     return dataMatrixDict
 
-def extendDataMatrix(dataMatrixDict, startDate, endDate, resolution=0.1,verbose=False):
+def extendDataMatrix(dataMatrixDict, startDate, endDate, resolution=0.1,verbose=False, step=datetime.timedelta(hours=1), metrics=None):
     """Handles data interpolation. 
 
     Args:
         dataMatrixDict: nested dictionary 
         startDate: the start date
         endDate: the end date
+        verbose: no longer prints, pass metrics to see how many hours were skipped
+        step: the time step of the data, one hour by default
+        metrics: optional metrics.Metrics, counts the hours interpolated and skipped and the cells added
     Returns: 
         dataMatrixDict: interpolated nested dictionary
     """
     myDate = startDate
+    skipped = 0
+    interpolated = 0
 
     while myDate <= endDate:
-        if myDate in dataMatrixDict:
+        if myDate not in dataMatrixDict:
+            skipped += 1
+        else:
             actualDepths = sorted(dataMatrixDict[myDate].keys())
 
             for index in range(len(actualDepths)-1):
@@ -236,14 +244,15 @@ def extendDataMatrix(dataMatrixDict, startDate, endDate, resolution=0.1,verbose=
                     if (depth != loDepth) and (depth != hiDepth):
                         interTemp = findPoint(m,hiDepth,hiTemp,depth)
                         dataMatrixDict[myDate][round(depth,3)] = [interTemp, '']
+                        interpolated += 1
 
-        myDate += datetime.timedelta(hours=1) #TODO: replace with actualDates, all the dates between my end and start date
+        myDate += step #TODO: replace with actualDates, all the dates between my end and start date
         
-        #TODO: add verbose parameter that says how many you skipped
         #TODO: write to file, so next time they don't have to run this again
         #TODO: should we give the interpolated data points a flag?
-    if verbose:
-        print findGaps(dataMatrixDict, startDate, endDate) #TODO: when you have CLI running, you should make a helper function for printing errors/messages
+    if metrics is not None:
+        metrics.count('extendDataMatrix.skippedHours', skipped)
+        metrics.count('extendDataMatrix.interpolatedCells', interpolated)
     return dataMatrixDict     
 
 def sunriseToDateTime(sunriseData):
@@ -349,16 +358,17 @@ def formateDateDaily(dateString):
     Returns: datetime object 
 
     """
-    formattedDate = datetime.datetime.strptime(dateString, '%Y-%m-%d ')
+    formattedDate = datetime.datetime.strptime(dateString.strip(), '%Y-%m-%d')
 
     return formattedDate
 
-def dateString(date, year=False):
+def dateString(date, year=False, step=datetime.timedelta(hours=1)):
     """ Converts year/date into a start and end datetime objects. 
 
     Args:
         date: date string
         year: boolean representing whether the date is a single year or a year/month/day string.
+        step: the time step of the data, end is the last step of the last day (23:00 for hourly data)
     
     Returns:
         start, end: the start and end datetime objects
@@ -366,10 +376,10 @@ def dateString(date, year=False):
     dateString = str(date)
     if year:
         start = formatDateHourly(dateString+'-01-01 00:00:00') #this can be modified to isolate a season
-        end = formatDateHourly(dateString+'-12-31 23:00:00')
+        end = formatDateHourly(dateString+'-12-31 00:00:00') + datetime.timedelta(days=1) - step
     else:
         start = formatDateHourly(dateString+' 00:00:00')
-        end = formatDateHourly(dateString+' 23:00:00')
+        end = start + datetime.timedelta(days=1) - step
 
     return start, end
 
@@ -391,7 +401,8 @@ def getDates(startYear, endYear):
     return dates
 
 def writeCSV(dictionary, nameString):
-    """Writes a dictionary into a csv (excel) file.
+    """Writes a dictionary into a csv (excel) file, sorted by date and depth.
+    This is the slow, text path; bundle.writeBundle writes the same data as typed columns.
     
     Args:
         dictionary: the dictionary to be written
@@ -400,17 +411,12 @@ def writeCSV(dictionary, nameString):
     Returns:
         writes a file to <nameString>.csv in the current directory.
     """
-    w = csv.writer(open(nameString+".csv","w"))
-    for date in dictionary.keys():
-        for depth in dictionary[date]:
-            ls = dictionary[date][depth]
-            if isinstance(ls, (list,)):   
-                temp = dictionary[date][depth][0]
-                flag = dictionary[date][depth][1]
-                if len(ls) == 3:
-                    frequency = dictionary[date][depth][2]
-                    w.writerow([date, depth, temp, flag, frequency])
+    with open(nameString+".csv","w") as f:
+        w = csv.writer(f)
+        for date in sorted(dictionary.keys()):
+            for depth in sorted(dictionary[date].keys()):
+                ls = dictionary[date][depth]
+                if isinstance(ls, (list,)):   
+                    w.writerow([date, depth] + list(ls[:3]))
                 else:
-                    w.writerow([date, depth, temp, flag])
-            else:
-                w.writerow([date, depth, dictionary[date][depth]])
+                    w.writerow([date, depth, ls])
\ No newline at end of file
@@ -0,0 +1,90 @@
+import numpy as np
+
+from climatology import ClimatologyAccumulator, MINUTES_PER_DAY, dayOfYearSlot, stepOfDay
+from lakeGrid import LakeGrid, FILLED
+
+def hourlyClimatology(lakeGrid, stepsPerDay=24):
+    """Array version of groupAllDates + averageOverYears: the mean temperature of every
+    (month-day, hour, depth) over all years. 02-29 falls back to 02-28 where it has no data.
+
+    Args:
+        lakeGrid: LakeGrid of measured temperatures
+        stepsPerDay: slots per day, eg. 144 to fill a 10 minute grid
+    Returns:
+        (366, stepsPerDay, D) float32 array on the grid's depth axis, NaN where no year has data
+    """
+    return ClimatologyAccumulator.fromGrid(lakeGrid, stepsPerDay=stepsPerDay).mean(lakeGrid.depths)
+
+def fillGaps(lakeGrid, climatology, years):
+    """Array version of fillGapsInData. Puts every hour of each year on the grid and fills
+    missing hours and missing depths from the climatology with one masked assignment per year.
+    The time step follows the climatology: a (366, 144, D) climatology gives a 10 minute axis.
+
+    As in fillGapsInData only depths seen at some point during the year are filled, and cells
+    whose climatology is undefined stay empty. Filled cells are flagged FILLED.
+
+    Args:
+        lakeGrid: LakeGrid of measured temperatures (any time span)
+        climatology: (366, stepsPerDay, D) array from hourlyClimatology or ClimatologyAccumulator.mean(),
+            on the same depth axis
+        years: a year or list of years to fill
+
+    Returns:
+        filled: LakeGrid with a regular axis covering the years
+        counts: dictionary year -> {'missingHours', 'filledHourCells', 'missingDepths'}, where an
+            hour is one step of the axis
+    """
+    if np.isscalar(years):
+        years = [years]
+    grids, counts = [], {}
+    for year in years:
+        grid, counts[year] = fillWindow(lakeGrid, climatology, np.datetime64('%d-01-01T00:00' % year),
+                                        np.datetime64('%d-01-01T00:00' % (year + 1)))
+        grids.append(grid)
+
+    filled = LakeGrid(np.concatenate([g.times for g in grids]), lakeGrid.depths,
+                      np.concatenate([g.temps for g in grids]), np.concatenate([g.flags for g in grids]),
+                      np.concatenate([g.quality for g in grids]), lakeGrid.qualityLabels)
+    return filled, counts
+
+def fillWindow(lakeGrid, climatology, start, end, fillDepths=None):
+    """Fills every hour of the window [start, end) the way fillGaps fills a year, so a long
+    record can be filled a month at a time.
+
+    Args:
+        lakeGrid: LakeGrid of measured temperatures covering the window
+        climatology: (366, stepsPerDay, D) array on the same depth axis
+        start: the first hour of the window
+        end: the hour after the window
+        fillDepths: optional (D,) booleans, the depths to fill. Defaults to the depths seen in
+            the window; pass the depths seen during the whole year to match fillGaps.
+
+    Returns:
+        filled: LakeGrid with a regular axis covering the window
+        counts: dictionary with 'missingHours', 'filledHourCells' and 'missingDepths'
+    """
+    stepsPerDay = climatology.shape[1]
+    hours = np.arange(np.datetime64(start, 'm'), np.datetime64(end, 'm'), np.timedelta64(MINUTES_PER_DAY // stepsPerDay, 'm'))
+    rows = lakeGrid.rows(hours)
+    present = rows >= 0
+    #a resampled grid has a row for every step, an hour is only present if it holds a reading
+    present[present] = ~np.isnan(lakeGrid.temps[rows[present]]).all(axis=1)
+
+    temps = np.full((len(hours), len(lakeGrid.depths)), np.nan, dtype=np.float32)
+    flags = np.zeros(temps.shape, dtype=np.uint8)
+    quality = np.zeros(temps.shape, dtype=np.uint8)
+    temps[present] = lakeGrid.temps[rows[present]]
+    flags[present] = lakeGrid.flags[rows[present]]
+    quality[present] = lakeGrid.quality[rows[present]]
+
+    if fillDepths is None:
+        fillDepths = ~np.isnan(temps).all(axis=0)
+    average = climatology[dayOfYearSlot(hours), stepOfDay(hours, stepsPerDay)]
+    need = np.isnan(temps) & np.asarray(fillDepths, dtype=bool)[None, :] & ~np.isnan(average)
+    temps[need] = average[need]
+    flags[need] = FILLED
+
+    counts = {'missingHours': int((~present).sum()),
+              'filledHourCells': int((need & ~present[:, None]).sum()),
+              'missingDepths': int((need & present[:, None]).sum())}
+    return LakeGrid(hours, lakeGrid.depths, temps, flags, quality, lakeGrid.qualityLabels), counts
@@ -0,0 +1,172 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from lakeGrid import LakeGrid
+
+class GridCache(object):
+    """Content addressed on-disk cache of processed lake grids and the arrays derived from them.
+
+    Every entry is a directory of .npy files named after a hash of the source file contents and
+    the parameters that produced it, so changing the data, the year, the resolution or the pipeline
+    version simply misses the cache. Entries are loaded memory-mapped.
+
+    Args:
+        directory: where the entries are kept, created if needed
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, sourceFiles, **params):
+        """Builds the cache key for a set of source files and parameters.
+
+        Args:
+            sourceFiles: a filename or list of filenames the entry is derived from
+            params: every other setting that changes the result (year, resolution, version, ...)
+
+        Returns:
+            hex digest
+        """
+        if isinstance(sourceFiles, str):
+            sourceFiles = [sourceFiles]
+        description = {'sources': [fileHash(f, self.directory) for f in sourceFiles], 'params': params}
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return os.path.isfile(os.path.join(self.path(key), 'entry.json'))
+
+    def load(self, key, mmap=True):
+        """Loads an entry.
+
+        Args:
+            key: the cache key
+            mmap: memory-map the arrays instead of reading them
+
+        Returns:
+            grid, arrays (dictionary of name -> array), meta; or None if the entry does not exist
+        """
+        if key not in self:
+            return None
+        entryPath = self.path(key)
+        with open(os.path.join(entryPath, 'entry.json')) as f:
+            entry = json.load(f)
+        mode = 'r' if mmap else None
+        arrays = dict((name, np.load(os.path.join(entryPath, name + '.npy'), mmap_mode=mode)) for name in entry['arrays'])
+        return LakeGrid.load(os.path.join(entryPath, 'grid'), mmap), arrays, entry['meta']
+
+    def store(self, key, grid, arrays=None, meta=None):
+        """Writes an entry. The entry is assembled in a temporary directory and renamed into
+        place, so a crash never leaves a half written entry behind. Entries are content addressed,
+        so an entry that already exists (eg. stored meanwhile by another process building the
+        same key) is already right and is left alone, and readers never see it disappear.
+
+        Args:
+            key: the cache key
+            grid: the LakeGrid
+            arrays: optional dictionary of name -> array aligned with the grid (eg. fitness)
+            meta: optional json serialisable dictionary
+        """
+        arrays = arrays or {}
+        if key in self:
+            return
+        staging = tempfile.mkdtemp(prefix='.' + key[:8], dir=self.directory)
+        try:
+            grid.save(os.path.join(staging, 'grid'))
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, name + '.npy'), np.ascontiguousarray(array))
+            with open(os.path.join(staging, 'entry.json'), 'w') as f:
+                json.dump({'arrays': sorted(arrays), 'meta': meta or {}}, f, default=str)
+            try:
+                os.rename(staging, self.path(key))
+            except OSError as error:
+                if error.errno not in (errno.ENOTEMPTY, errno.EEXIST) or key not in self:
+                    raise
+                shutil.rmtree(staging) #another process won the race
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def getOrBuild(self, key, build, mmap=True):
+        """Returns the cached entry for key, calling build() and storing its result on a miss.
+
+        Args:
+            key: the cache key
+            build: function returning grid, arrays, meta
+            mmap: memory-map the arrays of the returned entry
+
+        Returns:
+            grid, arrays, meta
+        """
+        cached = self.load(key, mmap)
+        if cached is not None:
+            return cached
+        grid, arrays, meta = build()
+        self.store(key, grid, arrays, meta)
+        return self.load(key, mmap)
+
+    def clear(self):
+        """Removes every entry."""
+        for name in os.listdir(self.directory):
+            entryPath = os.path.join(self.directory, name)
+            if os.path.isdir(entryPath):
+                shutil.rmtree(entryPath)
+            else:
+                os.remove(entryPath)
+
+def fileHash(filename, memoDirectory=None):
+    """Returns the sha256 of a file's contents. When memoDirectory is given, hashes are remembered
+    against the file's path, size and modification time so large files are only read once.
+
+    Args:
+        filename: the file to hash
+        memoDirectory: optional directory holding the hash memo
+
+    Returns:
+        hex digest
+    """
+    stat = os.stat(filename)
+    signature = '%s:%d:%d' % (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+    memoFile = os.path.join(memoDirectory, 'hashes.json') if memoDirectory else None
+    memo = _readMemo(memoFile) if memoFile else {}
+    if signature in memo:
+        return memo[signature]
+
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest = digest.hexdigest()
+
+    if memoFile:
+        #sweep and batch workers hash concurrently: each writes a private file and swaps it in
+        memo = _readMemo(memoFile)
+        memo[signature] = digest
+        handle, staging = tempfile.mkstemp(prefix='.hashes', suffix='.json', dir=memoDirectory)
+        try:
+            with os.fdopen(handle, 'w') as f:
+                json.dump(memo, f)
+            os.replace(staging, memoFile)
+        except Exception:
+            os.remove(staging)
+            raise
+    return digest
+
+## helper functions ##
+
+def _readMemo(memoFile):
+    """The hash memo, empty when it is missing or unreadable (it is only a shortcut)."""
+    try:
+        with open(memoFile) as f:
+            memo = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return memo if isinstance(memo, dict) else {}
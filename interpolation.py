@@ -0,0 +1,181 @@
+import numpy as np
+
+from lakeGrid import LakeGrid, MISSING, INTERPOLATED, DEPTH_DECIMALS
+
+METHODS = ('linear', 'density', 'spline')
+
+TEMP_MAX_DENSITY = 3.9863 #freshwater is densest at this temperature (C)
+
+def interpolateGrid(lakeGrid, resolution=0.1, method='linear', depths=None):
+    """Vectorized replacement for extendDataMatrix. Fills a target depth axis for every hour at once.
+
+    Rows are grouped by which sensors reported that hour, so every group shares its interpolation
+    weights and is filled with a handful of array operations. Cells at a sensor depth keep their
+    flag (MEASURED or FILLED), cells between two sensors are flagged INTERPOLATED and cells above the
+    shallowest or below the deepest sensor of that hour stay MISSING, as in extendDataMatrix.
+
+    Args:
+        lakeGrid: LakeGrid at the sensor depths
+        resolution: spacing of the target depth axis in meters
+        method: 'linear' in temperature, 'density' (linear in water density) or 'spline' (natural cubic)
+        depths: optional explicit target depth axis, overrides resolution
+
+    Returns:
+        LakeGrid on the target depth axis
+    """
+    if method not in METHODS:
+        raise ValueError('unknown interpolation method %r, choose from %s' % (method, METHODS))
+    if depths is None:
+        depths = depthAxis(lakeGrid.depths, resolution)
+    depths = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+
+    shape = (len(lakeGrid.times), len(depths))
+    temps = np.full(shape, np.nan, dtype=np.float32)
+    flags = np.full(shape, MISSING, dtype=np.uint8)
+    quality = np.zeros(shape, dtype=np.uint8)
+
+    mask = lakeGrid.mask
+    if mask.size:
+        patterns, patternIndex = np.unique(mask, axis=0, return_inverse=True)
+        patternIndex = patternIndex.reshape(-1)
+        for p, pattern in enumerate(patterns):
+            sensors = np.flatnonzero(pattern)
+            if len(sensors) == 0:
+                continue
+            rows = np.flatnonzero(patternIndex == p)
+            _fillRows(lakeGrid, rows, sensors, depths, method, temps, flags)
+
+    #cells that sit exactly on a sensor depth keep the sensor's value, flag and LTER quality code
+    targetCols = np.flatnonzero(np.isin(depths, lakeGrid.depths))
+    sourceCols = lakeGrid.columns(depths[targetCols])
+    onSensor = ~np.isnan(lakeGrid.temps[:, sourceCols])
+    temps[:, targetCols] = np.where(onSensor, lakeGrid.temps[:, sourceCols], temps[:, targetCols])
+    flags[:, targetCols] = np.where(onSensor, lakeGrid.flags[:, sourceCols], flags[:, targetCols])
+    quality[:, targetCols] = np.where(onSensor, lakeGrid.quality[:, sourceCols], 0)
+
+    return LakeGrid(lakeGrid.times, depths, temps, flags, quality, lakeGrid.qualityLabels)
+
+def depthAxis(sensorDepths, resolution):
+    """Builds the target depth axis like extendDataMatrix: between every pair of neighbouring
+    sensors, steps of resolution starting at the shallower one, plus the sensor depths themselves.
+    The steps restart at each sensor, so with sensors at 0, 2.5 and 5 m and 1 m steps the axis is
+    0, 1, 2, 2.5, 3.5, 4.5, 5.
+
+    extendDataMatrix builds this axis from the sensors that reported each hour, while the grid has
+    one axis for all hours, built from every sensor. In an hour with a missing sensor the two
+    differ: the original steps on from the sensor above the gap, the grid keeps the axis of the
+    full set of sensors and interpolates across the gap onto it.
+
+    Args:
+        sensorDepths: the depths of the sensors
+        resolution: spacing in meters
+
+    Returns:
+        sorted array of depths rounded like the keys of extendDataMatrix
+    """
+    sensorDepths = np.unique(np.asarray(sensorDepths, dtype=np.float64))
+    if len(sensorDepths) == 0:
+        return sensorDepths
+    steps = [np.arange(lo, hi, resolution) for lo, hi in zip(sensorDepths[:-1], sensorDepths[1:])]
+    return np.unique(np.round(np.concatenate(steps + [sensorDepths]), DEPTH_DECIMALS))
+
+def waterDensity(temps):
+    """Density of fresh water (kg/m^3) from temperature (C), after Martin & McCutcheon (1999).
+
+    Args:
+        temps: array of temperatures
+    Returns:
+        array of densities
+    """
+    temps = np.asarray(temps, dtype=np.float64)
+    return 1000.0 * (1 - (temps + 288.9414) / (508929.2 * (temps + 68.12963)) * (temps - TEMP_MAX_DENSITY) ** 2)
+
+def interpolateProfiles(x, y, target, method='linear'):
+    """Interpolates profiles that share their sensor depths onto target depths between the sensors.
+
+    Args:
+        x: (S,) sorted sensor depths
+        y: (R, S) temperatures of R profiles at those depths
+        target: depths between x[0] and x[-1]
+        method: 'linear', 'density' or 'spline', see interpolateGrid
+
+    Returns:
+        (R, len(target)) float64 temperatures
+    """
+    if len(x) == 1:
+        return np.repeat(y, len(target), axis=1)
+    segment = np.clip(np.searchsorted(x, target, side='right') - 1, 0, len(x) - 2)
+    h = x[segment + 1] - x[segment]
+    w = (target - x[segment]) / h
+    yLo, yHi = y[:, segment], y[:, segment + 1]
+
+    if method == 'linear' or (method == 'spline' and len(x) < 3):
+        return yLo + (yHi - yLo) * w
+    if method == 'density':
+        rho = waterDensity(yLo) * (1 - w) + waterDensity(yHi) * w
+        return _temperatureFromDensity(rho, yLo, yHi, yLo + (yHi - yLo) * w)
+    m = _splineSecondDerivatives(x, y)
+    a, b = 1 - w, w
+    return a * yLo + b * yHi + ((a ** 3 - a) * m[:, segment] + (b ** 3 - b) * m[:, segment + 1]) * h ** 2 / 6.0
+
+## helper functions ##
+
+def _fillRows(lakeGrid, rows, sensors, depths, method, temps, flags):
+    """Interpolates the rows of one sensor pattern onto the target depths, in place."""
+    x = lakeGrid.depths[sensors]
+    y = lakeGrid.temps[np.ix_(rows, sensors)].astype(np.float64)
+
+    inside = np.flatnonzero((depths >= x[0]) & (depths <= x[-1]))
+    block = np.ix_(rows, inside)
+    temps[block] = interpolateProfiles(x, y, depths[inside], method)
+    flags[block] = INTERPOLATED
+
+def _splineSecondDerivatives(x, y):
+    """Second derivatives of the natural cubic splines through (x, y[k]) for every row k at once.
+    All rows share the same knots, so the tridiagonal system is solved once for all right hand sides.
+    """
+    h = np.diff(x)
+    n = len(x)
+    system = np.zeros((n - 2, n - 2))
+    interior = np.arange(n - 2)
+    system[interior, interior] = 2 * (h[:-1] + h[1:])
+    system[interior[1:], interior[:-1]] = h[1:-1]
+    system[interior[:-1], interior[1:]] = h[1:-1]
+    slopes = np.diff(y, axis=1) / h
+    rhs = 6 * (slopes[:, 1:] - slopes[:, :-1])
+
+    m = np.zeros(y.shape)
+    m[:, 1:-1] = np.linalg.solve(system, rhs.T).T
+    return m
+
+def _temperatureFromDensity(rho, tLo, tHi, guess, iterations=24):
+    """Inverts waterDensity between the two bracketing sensor temperatures by vectorized bisection.
+    Density peaks near 4C and is monotone on either side, so a bracket that straddles the peak is
+    split there and both halves are searched. A half can only hold the answer if rho is at least
+    the density at its far end; when both can, the root nearer the linear estimate is kept.
+    """
+    a, b = np.minimum(tLo, tHi), np.maximum(tLo, tHi)
+    straddles = (a < TEMP_MAX_DENSITY) & (b > TEMP_MAX_DENSITY)
+    cold = _bisectDensity(rho, a, np.where(straddles, TEMP_MAX_DENSITY, b), iterations)
+    if not straddles.any():
+        return cold
+    rho, a, b, guess = rho[straddles], a[straddles], b[straddles], guess[straddles]
+    warm = _bisectDensity(rho, np.full(rho.shape, TEMP_MAX_DENSITY), b, iterations)
+    tolerance = 1e-9 * rho
+    coldFits = rho >= waterDensity(a) - tolerance
+    warmFits = rho >= waterDensity(b) - tolerance
+    useWarm = ~coldFits | (warmFits & (np.abs(warm - guess) < np.abs(cold[straddles] - guess)))
+    cold[straddles] = np.where(useWarm, warm, cold[straddles])
+    return cold
+
+def _bisectDensity(rho, a, b, iterations):
+    """The temperature in [a, b] with density rho, on an interval where density is monotone."""
+    fa = waterDensity(a) - rho
+    for _ in range(iterations):
+        mid = (a + b) / 2
+        fm = waterDensity(mid) - rho
+        left = fm * fa <= 0 #the root is in [a, mid], also when it is a itself
+        b = np.where(left, mid, b)
+        a = np.where(left, a, mid)
+        fa = np.where(left, fa, fm)
+    return (a + b) / 2
@@ -0,0 +1,399 @@
+import datetime
+import json
+import os
+import numpy as np
+
+## cell provenance flags ##
+MISSING = 0 #no value for this hour/depth
+MEASURED = 1 #value read from the sensor file
+FILLED = 2 #value taken from the average over all years
+INTERPOLATED = 3 #value interpolated between two sensor depths
+
+FLAG_NAMES = {MISSING: 'missing', MEASURED: 'measured', FILLED: 'filled', INTERPOLATED: 'interpolated'}
+
+TIME_UNIT = 'datetime64[m]' #minutes, so the hires files fit on the same axis as hourly ones
+DEPTH_DECIMALS = 3 #depth keys are rounded the same way extendDataMatrix rounds them
+GRID_ARRAYS = ('times', 'depths', 'temps', 'flags', 'quality')
+
+class LakeGrid(object):
+    """Array backed replacement for the nested date -> depth -> [temp, flag] dictionary.
+
+    Temperatures are stored as a float32 (T, D) array with NaN where there is no value.
+    Each cell also carries a provenance flag (MEASURED, FILLED, INTERPOLATED or MISSING) and an
+    index into qualityLabels, which holds the LTER flag_wtemp strings.
+
+    Args:
+        times: sorted datetime64 time axis (or anything numpy can convert)
+        depths: sorted depth axis in meters
+        temps: (T, D) temperatures
+        flags: optional (T, D) provenance flags, defaults to MEASURED wherever temps is not NaN
+        quality: optional (T, D) indices into qualityLabels
+        qualityLabels: the LTER flag strings, index 0 is the empty flag
+    """
+    def __init__(self, times, depths, temps, flags=None, quality=None, qualityLabels=('',)):
+        self.times = np.asarray(times).astype(TIME_UNIT, copy=False)
+        self.depths = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        self.temps = np.asarray(temps, dtype=np.float32)
+        shape = (len(self.times), len(self.depths))
+        if self.temps.shape != shape:
+            raise ValueError('temps has shape %s, expected %s' % (self.temps.shape, shape))
+        if flags is None:
+            flags = np.where(np.isnan(self.temps), MISSING, MEASURED)
+        self.flags = np.asarray(flags, dtype=np.uint8)
+        if quality is None:
+            quality = np.zeros(shape, dtype=np.uint8)
+        self.quality = np.asarray(quality, dtype=np.uint8)
+        self.qualityLabels = tuple(qualityLabels)
+
+        self.step = _regularStep(self.times)
+        self._rowLookup = None
+        self._columnLookup = None
+
+    ## constructors ##
+
+    @classmethod
+    def fromArrays(cls, times, depths, temps, flags=None, qualityLabels=None):
+        """Builds a grid from flat observation arrays, one entry per (time, depth) reading.
+        Like createDictionary, the first reading of a repeated (time, depth) pair wins.
+
+        Args:
+            times: observation times
+            depths: observation depths
+            temps: observation temperatures
+            flags: optional LTER flag strings for each observation
+            qualityLabels: optional list of known flag strings, so indices stay stable across calls
+
+        Returns:
+            LakeGrid
+        """
+        times = np.asarray(times).astype(TIME_UNIT)
+        depths = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        temps = np.asarray(temps, dtype=np.float32)
+
+        timeAxis, timeIndex = np.unique(times, return_inverse=True)
+        depthAxis, depthIndex = np.unique(depths, return_inverse=True)
+        cellKey = timeIndex.astype(np.int64) * len(depthAxis) + depthIndex
+        cellKey, first = np.unique(cellKey, return_index=True)
+        rows, cols = np.divmod(cellKey, len(depthAxis))
+
+        grid = np.full((len(timeAxis), len(depthAxis)), np.nan, dtype=np.float32)
+        grid[rows, cols] = temps[first]
+
+        quality = np.zeros(grid.shape, dtype=np.uint8)
+        labels = [''] if qualityLabels is None else list(qualityLabels)
+        if flags is not None:
+            uniqueFlags, flagIndex = np.unique(np.asarray(flags).astype(str)[first], return_inverse=True)
+            for label in uniqueFlags.tolist():
+                if label not in labels:
+                    labels.append(label)
+            codes = np.array([labels.index(label) for label in uniqueFlags.tolist()], dtype=np.uint8)
+            quality[rows, cols] = codes[flagIndex]
+
+        cellFlags = np.where(np.isnan(grid), MISSING, MEASURED)
+        cellFlags[rows, cols] = np.where(np.isnan(temps[first]), MISSING, MEASURED)
+        return cls(timeAxis, depthAxis, grid, cellFlags, quality, tuple(labels))
+
+    @classmethod
+    def fromRecords(cls, dataMatrix):
+        """Builds a grid from the list of [date, depth, temp, flag] rows made by createDataMatrix.
+
+        Args:
+            dataMatrix: list of lists
+        Returns:
+            LakeGrid
+        """
+        if len(dataMatrix) == 0:
+            return cls.empty()
+        times = [row[0] for row in dataMatrix]
+        depths = [row[1] for row in dataMatrix]
+        temps = [row[2] for row in dataMatrix]
+        flags = [row[3] if len(row) > 3 else '' for row in dataMatrix]
+        return cls.fromArrays(times, depths, temps, flags)
+
+    @classmethod
+    def fromDict(cls, dataMatrixDict):
+        """Builds a grid from the nested dictionary used by the original pipeline.
+        Entries without a flag (as written by fillGapsInData) are marked as FILLED,
+        entries written by extendDataMatrix (flag '') between sensor depths are not distinguishable
+        from sensor readings and are kept as MEASURED.
+
+        Args:
+            dataMatrixDict: nested dictionary date -> depth -> [temp, flag]
+        Returns:
+            LakeGrid
+        """
+        times, depths, temps, flags, filled = [], [], [], [], []
+        for date in dataMatrixDict:
+            for depth, value in dataMatrixDict[date].items():
+                times.append(date)
+                depths.append(depth)
+                temps.append(value[0])
+                flags.append(value[1] if len(value) > 1 else '')
+                filled.append(len(value) == 1)
+        if len(times) == 0:
+            return cls.empty()
+        grid = cls.fromArrays(times, depths, temps, flags)
+        if any(filled):
+            rows = grid.rows(np.array(times, dtype=TIME_UNIT)[filled])
+            cols = grid.columns(np.array(depths)[filled])
+            grid.flags[rows, cols] = FILLED
+        return grid
+
+    @classmethod
+    def empty(cls, depths=()):
+        """Returns a grid with no hours."""
+        return cls(np.array([], dtype=TIME_UNIT), depths, np.zeros((0, len(depths)), dtype=np.float32))
+
+    ## lookups ##
+
+    @property
+    def shape(self):
+        return self.temps.shape
+
+    @property
+    def mask(self):
+        """Boolean (T, D) array, True where the cell holds a temperature."""
+        return ~np.isnan(self.temps)
+
+    @property
+    def nbytes(self):
+        return self.temps.nbytes + self.flags.nbytes + self.quality.nbytes + self.times.nbytes + self.depths.nbytes
+
+    def row(self, date):
+        """Returns the row index for a date, or None if the hour is not on the grid. O(1).
+
+        Args:
+            date: datetime or datetime64
+        Returns:
+            row index or None
+        """
+        value = _minutes(date)
+        if self.step is not None:
+            offset = value - self._start
+            if offset < 0 or offset % self._stepMinutes != 0:
+                return None
+            index = offset // self._stepMinutes
+            return int(index) if index < len(self.times) else None
+        if self._rowLookup is None:
+            self._rowLookup = dict(zip(self.times.astype(np.int64).tolist(), range(len(self.times))))
+        return self._rowLookup.get(value)
+
+    def column(self, depth):
+        """Returns the column index for a depth, or None if the depth is not on the grid. O(1).
+
+        Args:
+            depth: depth in meters
+        Returns:
+            column index or None
+        """
+        if self._columnLookup is None:
+            self._columnLookup = dict(zip(self.depths.tolist(), range(len(self.depths))))
+        return self._columnLookup.get(round(float(depth), DEPTH_DECIMALS))
+
+    def rows(self, dates):
+        """Vectorized row lookup, -1 where the date is not on the grid."""
+        values = np.asarray(dates).astype(TIME_UNIT)
+        if len(self.times) == 0:
+            return np.full(values.shape, -1, dtype=np.int64)
+        index = np.clip(np.searchsorted(self.times, values), 0, len(self.times) - 1)
+        return np.where(self.times[index] == values, index, -1)
+
+    def columns(self, depths):
+        """Vectorized column lookup, -1 where the depth is not on the grid."""
+        values = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        if len(self.depths) == 0:
+            return np.full(values.shape, -1, dtype=np.int64)
+        index = np.clip(np.searchsorted(self.depths, values), 0, len(self.depths) - 1)
+        return np.where(self.depths[index] == values, index, -1)
+
+    def datetimes(self):
+        """The time axis as a list of datetime objects."""
+        return self.times.astype('datetime64[us]').astype(datetime.datetime).tolist()
+
+    def validRange(self):
+        """First and last valid column of every row, (-1, -1) for rows without data.
+
+        Returns:
+            first, last: int arrays of shape (T,)
+        """
+        mask = self.mask
+        anyValid = mask.any(axis=1)
+        first = np.where(anyValid, mask.argmax(axis=1), -1)
+        last = np.where(anyValid, mask.shape[1] - 1 - mask[:, ::-1].argmax(axis=1), -1)
+        return first, last
+
+    ## slicing ##
+
+    def take(self, rows):
+        """Returns a new grid holding only the given rows."""
+        return LakeGrid(self.times[rows], self.depths, self.temps[rows], self.flags[rows],
+                        self.quality[rows], self.qualityLabels)
+
+    def window(self, start, end):
+        """Returns the rows between start and end (inclusive). Shares memory with this grid.
+
+        Args:
+            start: the start date
+            end: the end date
+        Returns:
+            LakeGrid
+        """
+        lo = np.searchsorted(self.times, np.datetime64(start, 'm'), side='left')
+        hi = np.searchsorted(self.times, np.datetime64(end, 'm'), side='right')
+        return self.take(slice(lo, hi))
+
+    def onDepths(self, depths):
+        """Returns the grid on another depth axis, depths this grid does not have come out MISSING.
+
+        Args:
+            depths: the new depth axis
+        Returns:
+            LakeGrid
+        """
+        depths = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        cols = self.columns(depths)
+        present = cols >= 0
+        shape = (len(self.times), len(depths))
+        temps = np.full(shape, np.nan, dtype=np.float32)
+        flags = np.full(shape, MISSING, dtype=np.uint8)
+        quality = np.zeros(shape, dtype=np.uint8)
+        temps[:, present] = self.temps[:, cols[present]]
+        flags[:, present] = self.flags[:, cols[present]]
+        quality[:, present] = self.quality[:, cols[present]]
+        return LakeGrid(self.times, depths, temps, flags, quality, self.qualityLabels)
+
+    ## persistence ##
+
+    def save(self, directory):
+        """Writes the grid as .npy files (plus a small json file) that load() can memory-map.
+
+        Args:
+            directory: the directory to write to, created if needed
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in GRID_ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(directory, 'grid.json'), 'w') as f:
+            json.dump({'qualityLabels': list(self.qualityLabels)}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Reads a grid written by save().
+
+        Args:
+            directory: the directory written by save()
+            mmap: memory-map the arrays instead of reading them into memory
+
+        Returns:
+            LakeGrid
+        """
+        mode = 'r' if mmap else None
+        arrays = dict((name, np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode)) for name in GRID_ARRAYS)
+        with open(os.path.join(directory, 'grid.json')) as f:
+            meta = json.load(f)
+        return cls(arrays['times'], arrays['depths'], arrays['temps'], arrays['flags'], arrays['quality'],
+                   meta['qualityLabels'])
+
+    ## dictionary compatibility ##
+
+    def asDict(self):
+        """Returns a read only view that behaves like dataMatrixDict, so the strategies in
+        movementStrategies can run on a grid without converting it.
+        """
+        return GridDictView(self)
+
+    def toDict(self):
+        """Materialises the grid as the original nested dictionary (slow, for writeCSV and friends)."""
+        view = self.asDict()
+        return dict((date, dict((depth, view[date][depth]) for depth in view[date].keys())) for date in view.keys())
+
+    @property
+    def _start(self):
+        return int(self.times[0].astype(np.int64))
+
+    @property
+    def _stepMinutes(self):
+        return int(self.step / np.timedelta64(1, 'm'))
+
+class GridDictView(object):
+    """Read only date -> depth -> [temp, flag] view over a LakeGrid. Only hours and depths
+    with a temperature are visible, matching the dictionaries built by createDictionary.
+    keys() returns lists so random.choice(view.keys()) keeps working.
+    """
+    def __init__(self, grid):
+        self.grid = grid
+        self._hasData = grid.mask.any(axis=1)
+
+    def keys(self):
+        return [date for date, ok in zip(self.grid.datetimes(), self._hasData) if ok]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return int(self._hasData.sum())
+
+    def __contains__(self, date):
+        row = self.grid.row(date)
+        return row is not None and bool(self._hasData[row])
+
+    def __getitem__(self, date):
+        row = self.grid.row(date)
+        if row is None or not self._hasData[row]:
+            raise KeyError(date)
+        return ProfileView(self.grid, row)
+
+    def get(self, date, default=None):
+        return self[date] if date in self else default
+
+    def items(self):
+        return [(date, self[date]) for date in self.keys()]
+
+class ProfileView(object):
+    """Read only depth -> [temp, flag] view over one row of a LakeGrid."""
+    def __init__(self, grid, row):
+        self.grid = grid
+        self.row = row
+        self._valid = np.flatnonzero(~np.isnan(grid.temps[row]))
+
+    def keys(self):
+        return self.grid.depths[self._valid].tolist()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._valid)
+
+    def __contains__(self, depth):
+        col = self.grid.column(depth)
+        return col is not None and not np.isnan(self.grid.temps[self.row, col])
+
+    def __getitem__(self, depth):
+        col = self.grid.column(depth)
+        if col is None or np.isnan(self.grid.temps[self.row, col]):
+            raise KeyError(depth)
+        label = self.grid.qualityLabels[self.grid.quality[self.row, col]]
+        return [float(self.grid.temps[self.row, col]), label]
+
+    def get(self, depth, default=None):
+        return self[depth] if depth in self else default
+
+    def items(self):
+        return [(depth, self[depth]) for depth in self.keys()]
+
+## helper functions ##
+
+def _minutes(date):
+    """Converts a datetime or datetime64 into integer minutes since the epoch."""
+    return int(np.datetime64(date, 'm').astype(np.int64))
+
+def _regularStep(times):
+    """Returns the spacing of the time axis if it is constant, otherwise None."""
+    if len(times) < 2:
+        return None
+    steps = np.diff(times)
+    if (steps == steps[0]).all() and steps[0] > np.timedelta64(0, 'm'):
+        return steps[0]
+    return None
@@ -0,0 +1,505 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from climatology import ClimatologyAccumulator, MINUTES_PER_DAY
+from fitness import createFitnessGrid
+from gapFill import fillGaps
+from gridCache import fileHash
+from interpolation import interpolateGrid
+from lakeGrid import LakeGrid, MISSING, MEASURED, FILLED, TIME_UNIT, DEPTH_DECIMALS
+from metrics import nullMetrics
+from resample import nativeStep, resampleRecords, stepMinutes
+from temperatureLoader import TemperatureRecords, loadTemperatureFile, parseLines
+
+STORE_VERSION = 2
+SIGNATURE_BYTES = 1 << 16 #how much of the file before the watermark is hashed to detect rewritten files
+
+class LakeStore(object):
+    """One processed grid per year on disk, memory-mapped and loaded lazily, with a small json
+    catalog describing the source and the years held.
+
+    A store behaves like the lakes dictionary runSweep takes (year -> (lakeGrid, fitness, daylight)),
+    but a year is only mapped when it is first used, and only the pages a strategy touches are ever
+    read. Processes that open the same store share those pages through the OS page cache.
+
+    Args:
+        directory: the store directory, created if needed
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        catalogFile = os.path.join(directory, 'catalog.json')
+        if os.path.isfile(catalogFile):
+            with open(catalogFile) as f:
+                self.catalog = json.load(f)
+        else:
+            self.catalog = {'version': STORE_VERSION, 'source': None, 'params': {}, 'years': {}}
+        self._loaded = {}
+
+    @classmethod
+    def build(cls, directory, filename, years=None, resolution=0.1, layout='hourly', method='linear',
+              model='synechococcus', params=None, step=None, resampling='mean', solarTable=None, metrics=None):
+        """Processes every year of a temperature file into a store, reading the file once.
+
+        The climatology used to fill gaps is built once from the whole record, then each year is
+        gap filled, interpolated, evaluated and written before the next one starts, so only one
+        processed year is in memory at a time. Years already in the store from the same file and
+        settings are skipped; a different file or different settings rebuild the store.
+
+        Args:
+            directory: the store directory
+            filename: the LTER temperature file
+            years: optional list of years, defaults to every year in the file
+            resolution, layout, method, model, params, step, resampling: as in processLakeYear
+            solarTable: optional SolarTable, stores each year's daylight vector for circadian runs
+            metrics: optional Metrics
+
+        Returns:
+            LakeStore
+        """
+        metrics = nullMetrics(metrics)
+        source = {'file': os.path.abspath(filename), 'hash': fileHash(filename)}
+        offset, lines = _fileEnd(filename) #taken before parsing, rows appended meanwhile are picked up by refresh
+        with metrics.timed('ingest'):
+            records = loadTemperatureFile(filename, layout)
+        metrics.addWork('ingest', len(records), len(records))
+        store = cls.fromRecords(directory, records, source, years, resolution, layout, method, model, params, step,
+                                resampling, solarTable, metrics)
+        store.catalog['watermark'] = {'offset': offset, 'line': lines + 1, 'signature': _signature(filename, offset)}
+        store._writeCatalog()
+        return store
+
+    @classmethod
+    def fromRecords(cls, directory, records, source, years=None, resolution=0.1, layout='hourly', method='linear',
+                    model='synechococcus', params=None, step=None, resampling='mean', solarTable=None, metrics=None):
+        """build() for records that were already parsed, eg. on another thread.
+
+        Args:
+            directory: the store directory
+            records: TemperatureRecords of the whole file
+            source: json serialisable description of where the records came from, eg. file and hash.
+                A store built from another source is cleared.
+            the rest: as in build()
+
+        Returns:
+            LakeStore
+        """
+        metrics = nullMetrics(metrics)
+        store = cls(directory)
+        settings = {'resolution': resolution, 'layout': layout, 'method': method, 'model': model, 'params': params,
+                    'step': None if step is None else stepMinutes(step), 'resampling': resampling}
+        held = store.catalog['params'].get('years', [])
+        stored = _withoutYears(store.catalog['params'])
+        if store.catalog['source'] != source or stored != json.loads(json.dumps(settings)):
+            store.clear()
+            store.catalog['source'], held = source, []
+        #the years asked for so far, so that a rebuild processes them again
+        settings['years'] = None if years is None or held is None else sorted(set(held) | set(years))
+        store.catalog['params'] = settings
+
+        minutes = nativeStep(records, layout) if step is None else stepMinutes(step)
+        with metrics.timed('resample', len(records), len(records)):
+            measured = resampleRecords(records, minutes, resampling)
+        with metrics.timed('climatology', len(measured.times), measured.temps.size):
+            accumulator = ClimatologyAccumulator.fromGrid(measured, stepsPerDay=MINUTES_PER_DAY // minutes)
+            climatology = accumulator.mean(measured.depths)
+        if years is None:
+            years = _years(measured.times)
+        for year in years:
+            if year in store:
+                continue
+            with metrics.timed('gapFill', len(measured.times), measured.temps.size):
+                filled, gaps = fillGaps(measured, climatology, year)
+            metrics.update(gaps[year], 'gapFill.')
+            with metrics.timed('interpolate', len(filled.times)):
+                interpolated = interpolateGrid(filled, resolution, method)
+            metrics.addWork('interpolate', cells=interpolated.temps.size)
+            with metrics.timed('fitness', len(interpolated.times), interpolated.temps.size):
+                fitness = createFitnessGrid(interpolated, model, params)
+            daylight = None if solarTable is None else solarTable.isDaylight(interpolated.times)
+            store.add(year, interpolated, fitness, daylight, {'gaps': gaps[year], 'step': minutes}, filled)
+        store._saveState(records, measured, accumulator, minutes)
+        return store
+
+    def refresh(self, filename, solarTable=None, metrics=None):
+        """Brings the store up to date with the rows appended to its temperature file since the
+        last build or refresh, without reprocessing the history.
+
+        Only the lines after the watermark are parsed. They are added to the stored climatology,
+        and in every year only the hours that received new data, or whose climatological average
+        changed, are filled again, re-interpolated and re-evaluated. Years that gain a new year's
+        data are added. The watermark then moves to the end of the file, so refreshing twice is
+        the same as refreshing once. The source hash is chained over the appended lines rather
+        than taken over the whole file again, so build() sees a refreshed store as coming from
+        another source and rebuilds it.
+
+        The store is rebuilt from scratch instead when it has no watermark, when the file was
+        rewritten rather than appended to, when new sensor depths appear (they change the depth
+        axis of every year) or when it was built with 'interpolate' resampling.
+
+        Args:
+            filename: the temperature file the store was built from
+            solarTable: optional SolarTable, for the daylight vector of new years
+            metrics: optional Metrics
+
+        Returns:
+            dictionary with the number of new 'rows', the 'rejected' lines by reason, the 'years'
+            rewritten, the number of climatology 'slots' that changed, the number of grid rows
+            recomputed ('hours') and, when the store had to be rebuilt, the reason as 'rebuilt'
+        """
+        metrics = nullMetrics(metrics)
+        summary = {'rows': 0, 'rejected': {}, 'years': [], 'slots': 0, 'hours': 0, 'rebuilt': None}
+        reason = self._refreshBlocker(filename)
+        if reason is not None:
+            return self._rebuild(filename, solarTable, metrics, reason, summary)
+
+        params, state, watermark = self.catalog['params'], self.catalog['state'], self.catalog['watermark']
+        with metrics.timed('ingest'):
+            lines, offset = _newLines(filename, watermark['offset'])
+            if len(lines) == 0:
+                return summary
+            records = parseLines(lines, params['layout'], watermark['line'])
+        metrics.addWork('ingest', len(records), len(records))
+        summary['rows'], summary['rejected'] = len(records), records.rejectSummary()
+        metrics.update(summary['rejected'], 'rejected.')
+
+        depths = np.asarray(state['depths'])
+        openStart = np.datetime64(state['open'], 'm')
+        fresh = records.take(np.asarray(records.times).astype(TIME_UNIT) >= openStart)
+        if len(np.setdiff1d(np.round(fresh.depths, DEPTH_DECIMALS), depths)):
+            return self._rebuild(filename, solarTable, metrics, 'new sensor depths', summary)
+        tail, openRow = self._loadTail()
+        combined = TemperatureRecords.concatenate([tail, fresh])
+
+        with metrics.timed('resample', len(combined), len(combined)):
+            measured = resampleRecords(combined, state['step'], 'mean', qualityLabels=state['qualityLabels'])
+            measured = measured.onDepths(depths)
+        if len(measured.times):
+            with metrics.timed('climatology', len(measured.times), measured.temps.size):
+                accumulator = ClimatologyAccumulator.load(os.path.join(self._stateDirectory(), 'climatology.npz'))
+                #the open step was added while it was still filling up, it is added again in full
+                accumulator.remove(np.array([openStart]), depths, openRow[None, :])
+                accumulator.addGrid(measured)
+                climatology = accumulator.mean(depths)
+                changed = np.unique(accumulator.slots(measured.times))
+            summary['slots'] = len(changed)
+
+            #a year after the last one held is added if all of it is in the new readings
+            lastYear = max(self.years) if len(self) else None
+            newYears = [year for year in _years(measured.times) if lastYear is not None and year > lastYear
+                        and np.datetime64('%d-01-01' % year, 'm') >= openStart and params.get('years') is None]
+            for year in self.years:
+                hours = self._refreshYear(year, measured, climatology, changed, accumulator, metrics)
+                if hours:
+                    summary['years'].append(year)
+                    summary['hours'] += hours
+            for year in newYears:
+                self._addYear(year, measured, climatology, solarTable, metrics)
+                summary['years'].append(year)
+                summary['hours'] += self.meta(year)['shape'][0]
+            self._saveState(combined, measured, accumulator, state['step'], state['first'])
+
+        self.catalog['watermark'] = {'offset': offset, 'line': watermark['line'] + len(lines),
+                                     'signature': _signature(filename, offset)}
+        self.catalog['source'] = {'file': os.path.abspath(filename),
+                                  'hash': _appendedHash(self.catalog['source']['hash'], lines)}
+        self._writeCatalog()
+        metrics.count('refresh.rows', summary['rows'])
+        metrics.count('refresh.hours', summary['hours'])
+        return summary
+
+    ## mapping interface ##
+
+    @property
+    def years(self):
+        return sorted(int(year) for year in self.catalog['years'])
+
+    def keys(self):
+        return self.years
+
+    def __iter__(self):
+        return iter(self.years)
+
+    def __len__(self):
+        return len(self.catalog['years'])
+
+    def __contains__(self, year):
+        return str(year) in self.catalog['years']
+
+    def __getitem__(self, year):
+        """(lakeGrid, fitness, daylight) of a year, mapped on first use. daylight may be None."""
+        if year not in self._loaded:
+            self._loaded[year] = self.load(year)
+        return self._loaded[year]
+
+    def items(self):
+        """Yields (year, (lakeGrid, fitness, daylight)), mapping each year only when it is reached."""
+        for year in self.years:
+            yield year, self[year]
+
+    def load(self, year, mmap=True):
+        """Maps (or reads, with mmap=False) the arrays of one year.
+
+        Returns:
+            lakeGrid, fitness, daylight (None if the store has no daylight vectors)
+        """
+        if year not in self:
+            raise KeyError(year)
+        path = self._path(year)
+        mode = 'r' if mmap else None
+        grid = LakeGrid.load(os.path.join(path, 'grid'), mmap)
+        fitness = np.load(os.path.join(path, 'fitness.npy'), mmap_mode=mode)
+        daylightFile = os.path.join(path, 'daylight.npy')
+        daylight = np.load(daylightFile, mmap_mode=mode) if os.path.isfile(daylightFile) else None
+        return grid, fitness, daylight
+
+    def meta(self, year):
+        """What the catalog knows about one year: its shape, time span and build details."""
+        return self.catalog['years'][str(year)]
+
+    def release(self, year=None):
+        """Drops the mapping of one year (or of every year), eg. after a sweep has moved on."""
+        if year is None:
+            self._loaded.clear()
+        else:
+            self._loaded.pop(year, None)
+
+    ## writing ##
+
+    def add(self, year, grid, fitness, daylight=None, meta=None, filled=None):
+        """Writes one year. The year is assembled in a temporary directory and renamed into place,
+        and the catalog is replaced atomically, so a crash never leaves a half written year behind.
+
+        Args:
+            year: the year
+            grid: its LakeGrid
+            fitness: (T, D) fitness aligned with grid
+            daylight: optional (T,) booleans aligned with grid
+            meta: optional json serialisable dictionary kept in the catalog
+            filled: optional gap filled LakeGrid at the sensor depths, kept for refresh()
+        """
+        staging = tempfile.mkdtemp(prefix='.%d' % year, dir=self.directory)
+        try:
+            grid.save(os.path.join(staging, 'grid'))
+            np.save(os.path.join(staging, 'fitness.npy'), np.ascontiguousarray(fitness))
+            if daylight is not None:
+                np.save(os.path.join(staging, 'daylight.npy'), np.asarray(daylight, dtype=bool))
+            if filled is not None:
+                filled.save(os.path.join(staging, 'filled'))
+            if os.path.isdir(self._path(year)):
+                shutil.rmtree(self._path(year))
+            os.rename(staging, self._path(year))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        self.release(year)
+        entry = {'shape': list(grid.shape), 'depths': len(grid.depths)}
+        if len(grid.times):
+            entry.update({'start': str(grid.times[0]), 'end': str(grid.times[-1])})
+        entry.update(meta or {})
+        self.catalog['years'][str(year)] = entry
+        self._writeCatalog()
+
+    def clear(self):
+        """Removes every year."""
+        self._loaded.clear()
+        for year in list(self.catalog['years']):
+            shutil.rmtree(self._path(year), ignore_errors=True)
+        if self.catalog.get('state'):
+            shutil.rmtree(self._stateDirectory(), ignore_errors=True)
+        self.catalog['years'] = {}
+        self.catalog.pop('state', None)
+        self.catalog.pop('watermark', None)
+        self._writeCatalog()
+
+    ## helper functions ##
+
+    def _path(self, year):
+        return os.path.join(self.directory, str(year))
+
+    def _stateDirectory(self):
+        return os.path.join(self.directory, self.catalog['state']['directory'])
+
+    def _saveState(self, records, measured, accumulator, minutes, first=None):
+        """Keeps what refresh() needs: the climatology, the raw readings of the last (open) step
+        and the axis settings. The files go to a new directory that the catalog then points to,
+        so the state on disk always matches the catalog.
+        """
+        if len(measured.times) == 0:
+            return
+        openStart = measured.times[-1]
+        old = self.catalog.get('state')
+        directory = tempfile.mkdtemp(prefix='state', dir=self.directory)
+        accumulator.save(os.path.join(directory, 'climatology.npz'))
+        tail = np.asarray(records.times).astype(TIME_UNIT) >= openStart
+        arrays = {'times': np.asarray(records.times)[tail], 'depths': np.asarray(records.depths)[tail],
+                  'temps': np.asarray(records.temps)[tail], 'flags': np.asarray(records.flags).astype(str)[tail],
+                  'openRow': measured.temps[-1]}
+        if records.dataFreq is not None:
+            arrays['dataFreq'] = np.asarray(records.dataFreq)[tail]
+        with open(os.path.join(directory, 'tail.npz'), 'wb') as f:
+            np.savez(f, **arrays)
+        self.catalog['state'] = {'directory': os.path.basename(directory), 'step': minutes,
+                                 'depths': measured.depths.tolist(), 'qualityLabels': list(measured.qualityLabels),
+                                 'first': str(measured.times[0]) if first is None else first, 'open': str(openStart)}
+        self._writeCatalog()
+        if old:
+            shutil.rmtree(os.path.join(self.directory, old['directory']), ignore_errors=True)
+
+    def _loadTail(self):
+        with np.load(os.path.join(self._stateDirectory(), 'tail.npz')) as data:
+            dataFreq = data['dataFreq'] if 'dataFreq' in data.files else None
+            tail = TemperatureRecords(data['times'], data['depths'], data['temps'], data['flags'], dataFreq)
+            return tail, data['openRow']
+
+    def _refreshBlocker(self, filename):
+        """Why the store cannot be refreshed incrementally, None if it can."""
+        watermark = self.catalog.get('watermark')
+        if watermark is None or not self.catalog.get('state'):
+            return 'no watermark'
+        if self.catalog['params'].get('resampling') != 'mean':
+            return 'interpolated resampling depends on the readings around each step'
+        offset = watermark['offset']
+        if os.path.getsize(filename) < offset or _signature(filename, offset) != watermark['signature']:
+            return 'the file was rewritten'
+        return None
+
+    def _rebuild(self, filename, solarTable, metrics, reason, summary):
+        rebuilt = LakeStore.build(self.directory, filename, solarTable=solarTable, metrics=metrics,
+                                  **self.catalog['params'])
+        self.catalog = rebuilt.catalog
+        self._loaded.clear()
+        metrics.count('refresh.rebuilds')
+        summary.update({'rows': None, 'rebuilt': reason, 'years': self.years})
+        return summary
+
+    def _refreshYear(self, year, measured, climatology, changed, accumulator, metrics):
+        """Fills again the hours of one year that got new readings or whose climatology changed,
+        and recomputes the interpolated grid and fitness of the hours whose values moved.
+
+        Returns:
+            the number of hours recomputed
+        """
+        path = self._path(year)
+        if not os.path.isdir(os.path.join(path, 'filled')):
+            return 0
+        stored = LakeGrid.load(os.path.join(path, 'filled'))
+        freshRows = measured.rows(stored.times)
+        isFresh = freshRows >= 0
+        slots = accumulator.slots(stored.times)
+        touched = isFresh | np.isin(slots, changed)
+        if not touched.any():
+            return 0
+
+        with metrics.timed('gapFill', len(stored.times), stored.temps.size):
+            temps, flags, quality = np.array(stored.temps), np.array(stored.flags), np.array(stored.quality)
+            temps[isFresh] = measured.temps[freshRows[isFresh]]
+            flags[isFresh] = measured.flags[freshRows[isFresh]]
+            quality[isFresh] = measured.quality[freshRows[isFresh]]
+            fillDepths = (flags == MEASURED).any(axis=0)
+            if np.any(fillDepths != (stored.flags == MEASURED).any(axis=0)):
+                touched[:] = True #a depth seen for the first time this year is filled on every hour
+            rows = np.flatnonzero(touched)
+            average = climatology.reshape(-1, len(stored.depths))[slots[rows]]
+            blockTemps, blockFlags, blockQuality = temps[rows], flags[rows], quality[rows]
+            gap = blockFlags != MEASURED
+            need = gap & fillDepths[None, :] & ~np.isnan(average)
+            blockTemps[gap], blockFlags[gap], blockQuality[gap] = np.nan, MISSING, 0
+            blockTemps[need], blockFlags[need] = average[need], FILLED
+            temps[rows], flags[rows], quality[rows] = blockTemps, blockFlags, blockQuality
+            before = stored.take(rows)
+            moved = ((blockTemps != before.temps) & ~(np.isnan(blockTemps) & np.isnan(before.temps))).any(axis=1)
+            moved |= (blockFlags != before.flags).any(axis=1) | (blockQuality != before.quality).any(axis=1)
+            rows = rows[moved]
+        if len(rows) == 0:
+            return 0
+        filled = LakeGrid(stored.times, stored.depths, temps, flags, quality, measured.qualityLabels)
+
+        params = self.catalog['params']
+        grid, fitness, daylight = self.load(year)
+        with metrics.timed('interpolate', len(rows), len(rows) * len(grid.depths)):
+            part = interpolateGrid(filled.take(rows), method=params['method'], depths=grid.depths)
+            gridTemps, gridFlags, gridQuality = np.array(grid.temps), np.array(grid.flags), np.array(grid.quality)
+            gridTemps[rows], gridFlags[rows], gridQuality[rows] = part.temps, part.flags, part.quality
+        with metrics.timed('fitness', len(rows), len(rows) * len(grid.depths)):
+            fitness = np.array(fitness)
+            fitness[rows] = createFitnessGrid(part, params['model'], params['params'])
+        interpolated = LakeGrid(grid.times, grid.depths, gridTemps, gridFlags, gridQuality, measured.qualityLabels)
+        daylight = None if daylight is None else np.array(daylight)
+        meta = dict(self.meta(year), gaps=_gapCounts(filled))
+        self.add(year, interpolated, fitness, daylight, meta, filled)
+        return len(rows)
+
+    def _addYear(self, year, measured, climatology, solarTable, metrics):
+        """Processes a year that only exists in the new readings, as build() would."""
+        params = self.catalog['params']
+        with metrics.timed('gapFill', len(measured.times), measured.temps.size):
+            filled, _ = fillGaps(measured, climatology, year)
+        with metrics.timed('interpolate', len(filled.times)):
+            interpolated = interpolateGrid(filled, params['resolution'], params['method'])
+        metrics.addWork('interpolate', cells=interpolated.temps.size)
+        with metrics.timed('fitness', len(interpolated.times), interpolated.temps.size):
+            fitness = createFitnessGrid(interpolated, params['model'], params['params'])
+        daylight = None if solarTable is None else solarTable.isDaylight(interpolated.times)
+        meta = {'gaps': _gapCounts(filled), 'step': self.catalog['state']['step']}
+        self.add(year, interpolated, fitness, daylight, meta, filled)
+
+    def _writeCatalog(self):
+        staging = os.path.join(self.directory, '.catalog.json')
+        with open(staging, 'w') as f:
+            json.dump(self.catalog, f, indent=1, default=str)
+        os.replace(staging, os.path.join(self.directory, 'catalog.json'))
+
+## file helper functions ##
+
+def _fileEnd(filename):
+    """Byte offset just past the last complete line, and the number of complete lines."""
+    offset = lines = position = 0
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            count = block.count(b'\n')
+            if count:
+                lines += count
+                offset = position + block.rindex(b'\n') + 1
+            position += len(block)
+    return offset, lines
+
+def _newLines(filename, offset):
+    """The complete lines after offset, and the offset just past them."""
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    return data[:end].splitlines(True), offset + end
+
+def _appendedHash(previous, lines):
+    """Hash of a source after lines were appended to it, from the hash it had before."""
+    digest = hashlib.sha256(previous.encode())
+    for line in lines:
+        digest.update(line)
+    return digest.hexdigest()
+
+def _signature(filename, offset):
+    """Hash of the bytes just before offset, to tell an appended file from a rewritten one."""
+    with open(filename, 'rb') as f:
+        f.seek(max(offset - SIGNATURE_BYTES, 0))
+        return hashlib.sha256(f.read(min(offset, SIGNATURE_BYTES))).hexdigest()
+
+def _withoutYears(params):
+    return dict((key, value) for key, value in params.items() if key != 'years')
+
+def _years(times):
+    return np.unique(np.asarray(times).astype('datetime64[Y]').astype(np.int64) + 1970).tolist()
+
+def _gapCounts(filled):
+    """The fillGaps counts of a filled year, read back from its flags: an hour is present if it
+    holds a reading, ie. any cell that is neither FILLED nor MISSING."""
+    present = ((filled.flags != FILLED) & (filled.flags != MISSING)).any(axis=1)
+    isFilled = filled.flags == FILLED
+    return {'missingHours': int((~present).sum()), 'filledHourCells': int((isFilled & ~present[:, None]).sum()),
+            'missingDepths': int((isFilled & present[:, None]).sum())}
@@ -0,0 +1,108 @@
+import collections
+import numpy as np
+
+from fitness import getGrowthModel
+from interpolation import METHODS, depthAxis, interpolateProfiles
+from lakeGrid import DEPTH_DECIMALS
+
+class LazySource(object):
+    """The lookup interface of strategyEngine.DenseSource over the gap filled sensor profiles,
+    without materialising the interpolated grid.
+
+    Temperature and fitness at a depth of the target axis are interpolated and evaluated the
+    first time a strategy asks for them, and kept in a cache of the last cacheRows hours. The
+    local strategies only look at a few depths around each agent, so memory grows with the
+    number of sensors (plus the cache), not with the resolution. The values are the same as
+    those of interpolateGrid and createFitnessGrid.
+
+    Args:
+        lakeGrid: LakeGrid at the sensor depths, eg. the output of fillGaps
+        resolution: spacing of the target depth axis in meters
+        method: 'linear', 'density' or 'spline', see interpolateGrid
+        depths: optional explicit target depth axis, overrides resolution
+        model: the name of a registered growth model
+        params: optional parameter overrides for the model
+        cacheRows: number of hours whose computed cells are kept, at least 1
+    """
+    def __init__(self, lakeGrid, resolution=0.1, method='linear', depths=None, model='synechococcus', params=None,
+                 cacheRows=64):
+        if method not in METHODS:
+            raise ValueError('unknown interpolation method %r, choose from %s' % (method, METHODS))
+        self.lakeGrid = lakeGrid
+        self.times = lakeGrid.times
+        if depths is None:
+            depths = depthAxis(lakeGrid.depths, resolution)
+        self.depths = np.round(np.asarray(depths, dtype=np.float64), DEPTH_DECIMALS)
+        self.method = method
+        self.cacheRows = max(int(cacheRows), 1)
+        self.computedCells = 0
+        self._growth, self._parameters = getGrowthModel(model, params)
+        self._cache = collections.OrderedDict()
+
+        #the target columns between the shallowest and deepest sensor with data at every hour
+        first, last = lakeGrid.validRange()
+        hasData = first >= 0
+        self._lo = np.zeros(len(self.times), dtype=np.int64)
+        self._hi = np.zeros(len(self.times), dtype=np.int64)
+        self._lo[hasData] = np.searchsorted(self.depths, lakeGrid.depths[first[hasData]], side='left')
+        self._hi[hasData] = np.searchsorted(self.depths, lakeGrid.depths[last[hasData]], side='right')
+
+    def __len__(self):
+        return len(self.times)
+
+    def validColumns(self, t):
+        """Sorted columns of the target axis that have a value at row t."""
+        return np.arange(self._lo[t], self._hi[t])
+
+    def fitnessAt(self, t, columns):
+        row = self._row(t, columns)
+        return row['fitness'][columns]
+
+    def temperatureAt(self, t, columns):
+        row = self._row(t, columns)
+        return row['temps'][columns]
+
+    ## helper functions ##
+
+    def _row(self, t, columns):
+        """The cached cells of row t, with the requested columns computed."""
+        row = self._cache.get(t)
+        if row is None:
+            if len(self._cache) >= self.cacheRows:
+                _, row = self._cache.popitem(last=False) #reuse the arrays of the oldest row
+                row['known'][:] = False
+            else:
+                nDepths = len(self.depths)
+                row = {'temps': np.empty(nDepths, dtype=np.float32), 'fitness': np.empty(nDepths, dtype=np.float32),
+                       'known': np.zeros(nDepths, dtype=bool)}
+            self._cache[t] = row
+        else:
+            self._cache.move_to_end(t)
+        columns = np.asarray(columns)
+        missing = ~row['known'][columns]
+        if missing.any():
+            self._compute(t, np.unique(columns[missing]), row)
+        return row
+
+    def _compute(self, t, columns, row):
+        """Interpolates and evaluates the given columns of row t, like interpolateGrid and createFitnessGrid."""
+        profile = self.lakeGrid.temps[t]
+        sensors = np.flatnonzero(~np.isnan(profile))
+        x = self.lakeGrid.depths[sensors]
+        target = self.depths[columns]
+        values = np.full(len(columns), np.nan, dtype=np.float32)
+        inside = (target >= x[0]) & (target <= x[-1]) if len(x) else np.zeros(len(columns), dtype=bool)
+        if inside.any():
+            y = profile[sensors][None, :].astype(np.float64)
+            values[inside] = interpolateProfiles(x, y, target[inside], self.method)[0]
+            #cells that sit exactly on a sensor depth keep the sensor's value
+            onSensor = np.searchsorted(x, target)
+            exact = inside & (onSensor < len(x))
+            exact[exact] = x[onSensor[exact]] == target[exact]
+            values[exact] = profile[sensors[onSensor[exact]]]
+        row['temps'][columns] = values
+        fitness = np.empty(len(columns), dtype=np.float32)
+        fitness[...] = self._growth(values, **self._parameters)
+        row['fitness'][columns] = fitness
+        row['known'][columns] = True
+        self.computedCells += len(columns)
@@ -0,0 +1,182 @@
+import collections
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError: #not available on Windows
+    resource = None
+
+class StageTimer(object):
+    """Wall time and volume processed by each stage of a run.
+
+    Args:
+        stages: optional stage names, reported in this order even if they never ran.
+            Other stages are added the first time they are timed.
+    """
+    def __init__(self, stages=()):
+        self.seconds = collections.OrderedDict((stage, 0.0) for stage in stages)
+        self.rows = collections.defaultdict(int)
+        self.cells = collections.defaultdict(int)
+        self.calls = collections.defaultdict(int)
+
+    @contextlib.contextmanager
+    def timed(self, stage, rows=0, cells=0):
+        """Adds the time spent inside the with block to a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+            self.rows[stage] += rows
+            self.cells[stage] += cells
+            self.calls[stage] += 1
+
+    def addWork(self, stage, rows=0, cells=0):
+        """Adds rows and cells to a stage whose size is only known once it ran, eg. parsing a file."""
+        self.rows[stage] += rows
+        self.cells[stage] += cells
+
+    def merge(self, other):
+        """Adds the stages of another timer, eg. one filled in by a worker process or thread."""
+        for stage, seconds in other.seconds.items():
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.rows[stage] += other.rows[stage]
+            self.cells[stage] += other.cells[stage]
+            self.calls[stage] += other.calls[stage]
+
+    def report(self):
+        """Returns a dictionary stage -> {'seconds', 'calls', 'rows', 'cells', 'rowsPerSecond', 'cellsPerSecond'}."""
+        report = collections.OrderedDict()
+        for stage, seconds in self.seconds.items():
+            report[stage] = {'seconds': seconds, 'calls': self.calls[stage], 'rows': self.rows[stage],
+                             'cells': self.cells[stage],
+                             'rowsPerSecond': self.rows[stage] / seconds if seconds else 0.0,
+                             'cellsPerSecond': self.cells[stage] / seconds if seconds else 0.0}
+        return report
+
+class Metrics(StageTimer):
+    """Instrumentation of a run: per-stage wall time and, optionally, peak memory, named counters
+    (rejected rows, filled hours, interpolated cells, depth snaps, boundary clamps, ...) and an
+    optional cProfile of the timed stages. Everything can be dumped to json.
+
+    Pass one Metrics object down the pipeline; every function that takes metrics=None records into it.
+
+    Args:
+        stages: optional stage names, reported in this order
+        memory: trace the peak Python memory allocated inside each stage with tracemalloc (slows the run)
+        profile: run cProfile inside the timed stages, True for all of them or a collection of stage names
+    """
+    def __init__(self, stages=(), memory=False, profile=False):
+        super(Metrics, self).__init__(stages)
+        self.counters = collections.Counter()
+        self.memory = memory
+        self.peakBytes = collections.defaultdict(int)
+        self.profileStages = profile
+        self.profiler = cProfile.Profile() if profile else None
+        self._depth = 0 #stages nest, memory and the profiler are only switched at the outermost one
+        self._startedTracing = False
+
+    @contextlib.contextmanager
+    def timed(self, stage, rows=0, cells=0):
+        """Adds the wall time (and peak memory) spent inside the with block to a stage."""
+        outermost = self._depth == 0
+        profiling = outermost and self._profiles(stage)
+        if outermost and self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._startedTracing = True
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        if profiling:
+            self.profiler.enable()
+        self._depth += 1
+        try:
+            with super(Metrics, self).timed(stage, rows, cells):
+                yield
+        finally:
+            self._depth -= 1
+            if profiling:
+                self.profiler.disable()
+            if outermost and self.memory:
+                self.peakBytes[stage] = max(self.peakBytes[stage], tracemalloc.get_traced_memory()[1] - before)
+
+    def count(self, name, value=1):
+        """Adds value to a counter."""
+        self.counters[name] += int(value)
+
+    def update(self, counts, prefix=''):
+        """Adds a dictionary of counts, eg. the gap counts of fillGaps or StrategyResult.counters."""
+        for name, value in counts.items():
+            self.count(prefix + name, value)
+
+    def merge(self, other):
+        """Adds the stages, counters and peak memory of another Metrics object."""
+        super(Metrics, self).merge(other)
+        self.counters.update(getattr(other, 'counters', {}))
+        for stage, peak in getattr(other, 'peakBytes', {}).items():
+            self.peakBytes[stage] = max(self.peakBytes[stage], peak)
+
+    def report(self):
+        report = super(Metrics, self).report()
+        if self.memory:
+            for stage in report:
+                report[stage]['peakBytes'] = self.peakBytes[stage]
+        return report
+
+    def profileStats(self, limit=20, sort='cumulative'):
+        """The most expensive functions seen by the profiler as a list of dictionaries."""
+        if self.profiler is None:
+            return []
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, function), (calls, primitive, own, total, _) in stats.stats.items():
+            rows.append({'function': '%s:%d(%s)' % (filename, line, function), 'calls': calls,
+                         'ownSeconds': own, 'totalSeconds': total})
+        key = 'ownSeconds' if sort in ('tottime', 'time', 'own') else 'totalSeconds'
+        return sorted(rows, key=lambda row: -row[key])[:limit]
+
+    def dumpProfile(self, filename):
+        """Writes the raw profile for pstats or snakeviz."""
+        if self.profiler is not None:
+            self.profiler.dump_stats(filename)
+
+    def toDict(self, profileLimit=20):
+        """Everything recorded so far as plain json-able values."""
+        data = {'stages': self.report(), 'counters': dict(self.counters), 'maxRssBytes': maxRss()}
+        if self.profiler is not None:
+            data['profile'] = self.profileStats(profileLimit)
+        return data
+
+    def dump(self, filename, profileLimit=20):
+        """Writes toDict() as json."""
+        with open(filename, 'w') as f:
+            json.dump(self.toDict(profileLimit), f, indent=2)
+
+    def close(self):
+        """Stops tracemalloc if this object started it."""
+        if self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+
+    def _profiles(self, stage):
+        if self.profiler is None:
+            return False
+        return self.profileStages is True or stage in self.profileStages
+
+def maxRss():
+    """Peak resident memory of the process in bytes, None where the platform does not report it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 #kilobytes everywhere but macOS
+
+def nullMetrics(metrics):
+    """Returns metrics, or a throwaway Metrics object when it is None, so callers can always record."""
+    return Metrics() if metrics is None else metrics
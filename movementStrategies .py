@@ -62,6 +62,7 @@ def fitnessAtStableDepth(dataMatrixDict, fitnessDict, targetDepth, start, end, h
         end: the end date
     Returns: 
         dateList = list of each date where fitness was calculated
+        tempList = the temperature at each of those dates
         fitnessList = each fitness found 
     """
     dateList = sorted(getCommonElements(getDatesBetweenRange(start, end, hourly), dataMatrixDict.keys()))
@@ -69,12 +70,12 @@ def fitnessAtStableDepth(dataMatrixDict, fitnessDict, targetDepth, start, end, h
     for date in dateList:
         for depth in dataMatrixDict[date].keys():
             if depth == targetDepth:
-                temp = dataMatrixDict[date][depth][0]
+                tempList.append(dataMatrixDict[date][depth][0])
                 fitnessList.append(fitnessDict[date][depth])
 
     return dateList, tempList, fitnessList 
 
-def circadianMovement(dataMatrixDict, fitnessDict, sunsetMatrix, start, end, speed, seed=False):
+def circadianMovement(dataMatrixDict, fitnessDict, sunsetMatrix, start, end, speed, seed=False, metrics=None):
     """Simulates Diel Vertical Migration, finds fitness.
 
     Args:
@@ -84,6 +85,7 @@ def circadianMovement(dataMatrixDict, fitnessDict, sunsetMatrix, start, end, spe
         start: the start date
         end: the end date
         speed: the speed of movement, representing upper and lower bounds of observed speeds
+        metrics: optional metrics.Metrics, counts the depth snaps and the moves that would leave the lake
     Returns: 
         dateList, depthList, tempList, fitnessList
     """
@@ -92,8 +94,7 @@ def circadianMovement(dataMatrixDict, fitnessDict, sunsetMatrix, start, end, spe
     elif speed == 'slow':
         distance = 2
     else:
-        print "Error: incorrect parameters" 
-        sys.exit()
+        raise ValueError('incorrect speed %r, choose from fast, slow' % (speed,))
     if seed: 
         random.seed(2)
 
@@ -113,8 +114,9 @@ def circadianMovement(dataMatrixDict, fitnessDict, sunsetMatrix, start, end, spe
             if previousLocation in allDepths:
                 index = allDepths.index(previousLocation) 
             else:
-                #TODO: break (count how often this happens)
                 #TODO: separate checking for jumps and handling hitting bottom/surface
+                if metrics is not None:
+                    metrics.count('circadian.snaps')
                 previousLocation = min(allDepths, key=lambda x:abs(x-previousLocation))
                 index = allDepths.index(previousLocation) 
 
@@ -125,6 +127,8 @@ def circadianMovement(dataMatrixDict, fitnessDict, sunsetMatrix, start, end, spe
             
             if index in depthsNum:
                 previousLocation = allDepths[index]
+            elif metrics is not None:
+                metrics.count('circadian.clamps')
         depthList.append(previousLocation)
         tempList.append(dataMatrixDict[date][previousLocation][0])
         fitnessList.append(fitnessDict[date][previousLocation])
@@ -342,23 +346,23 @@ def getDatesBetweenRange(start, end, hourly):
     Args:
         start: the start date
         end: the end date
-        hourly: boolean representing the resolution of the data (hourly or daily)
+        hourly: boolean representing the resolution of the data (hourly or daily),
+            or a datetime.timedelta for any other step, eg. datetime.timedelta(minutes=10)
     Returns: 
        dateList
     """
-    dateList = []
-    if hourly:
-        currentDate = start
-        dateList.append(start)
-        while currentDate < end:
-            currentDate = currentDate + datetime.timedelta(hours = 1)
-            dateList.append(currentDate)
-
+    if isinstance(hourly, datetime.timedelta):
+        step = hourly
+    elif hourly:
+        step = datetime.timedelta(hours = 1)
     else:
-        currentDate = start
-        dateList.append(start)
-        while currentDate < end:
-            currentDate = currentDate + datetime.timedelta(days = 1)
-            dateList.append(currentDate)
+        step = datetime.timedelta(days = 1)
+
+    dateList = []
+    currentDate = start
+    dateList.append(start)
+    while currentDate < end:
+        currentDate = currentDate + step
+        dateList.append(currentDate)
 
     return dateList
\ No newline at end of file
@@ -0,0 +1,104 @@
+import numpy as np
+
+class OracleResult(object):
+    """The trajectory chosen by an oracle.
+
+    Args:
+        rows: the grid rows simulated (the hours with data)
+        depthIndex: (T,) column chosen at each of those rows
+        fitness: (T,) fitness at the chosen cells
+        restarts: rows where no cell could be reached within the speed limit and the
+            trajectory had to start again (always empty for the unconstrained oracle)
+    """
+    def __init__(self, rows, depthIndex, fitness, restarts=()):
+        self.rows = rows
+        self.depthIndex = depthIndex
+        self.fitness = fitness
+        self.restarts = np.asarray(restarts, dtype=np.int64)
+
+    @property
+    def totalFitness(self):
+        return float(np.sum(self.fitness, dtype=np.float64))
+
+def unconstrainedOracle(fitness):
+    """Vectorized oracleMovement: the best depth at every hour, found with one argmax over the
+    depth axis. The organism may move any distance between hours, so this is a loose upper bound.
+
+    Args:
+        fitness: (T, D) fitness grid, NaN where there is no data
+
+    Returns:
+        OracleResult
+    """
+    fitness = np.asarray(fitness)
+    rows = np.flatnonzero(~np.isnan(fitness).all(axis=1))
+    scores = np.where(np.isnan(fitness[rows]), -np.inf, fitness[rows])
+    best = scores.argmax(axis=1)
+    return OracleResult(rows, best, fitness[rows, best])
+
+def constrainedOracle(fitness, maxStep, startIndex=None):
+    """The trajectory with the highest cumulative fitness that never moves more than maxStep
+    columns per hour, found by dynamic programming over (time, depth).
+
+    For each hour the best reachable total is the fitness of the cell plus the best total within
+    maxStep columns an hour earlier, which is a sliding window maximum computed with 2 * maxStep
+    shifted array comparisons, so the whole solve is O(T * D * maxStep) with vectorized steps.
+
+    Args:
+        fitness: (T, D) fitness grid, NaN where there is no data
+        maxStep: the largest move in columns per hour (eg. 2 or 4, like circadianMovement)
+        startIndex: optional column the organism starts in, otherwise it may start anywhere
+
+    Returns:
+        OracleResult
+    """
+    fitness = np.asarray(fitness)
+    rows = np.flatnonzero(~np.isnan(fitness).all(axis=1))
+    nRows, nDepths = len(rows), fitness.shape[1]
+    if nRows == 0:
+        return OracleResult(rows, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=fitness.dtype))
+
+    moveType = np.int8 if maxStep < 127 else np.int16
+    moves = np.zeros((nRows, nDepths), dtype=moveType) #offset to the previous hour's column
+    restarts = {} #step -> column the trajectory ended in just before restarting at that step
+
+    total = np.where(np.isnan(fitness[rows[0]]), -np.inf, fitness[rows[0]]).astype(np.float64)
+    if startIndex is not None:
+        total = np.where(np.arange(nDepths) == startIndex, total, -np.inf)
+    for t in range(1, nRows):
+        previous = total
+        best, move = _windowMax(total, maxStep)
+        current = np.where(np.isnan(fitness[rows[t]]), -np.inf, fitness[rows[t]])
+        total = best + current
+        moves[t] = move
+        if not np.isfinite(total).any():
+            #nothing valid is reachable (eg. the lake got much shallower), start again from here
+            restarts[t] = int(np.argmax(previous))
+            total = current.astype(np.float64)
+            moves[t] = 0
+
+    depthIndex = np.empty(nRows, dtype=np.int64)
+    depthIndex[-1] = int(np.argmax(total))
+    for t in range(nRows - 1, 0, -1):
+        if t in restarts:
+            depthIndex[t - 1] = restarts[t] #the segment before a restart ends at its best total
+        else:
+            depthIndex[t - 1] = depthIndex[t] + moves[t, depthIndex[t]]
+    return OracleResult(rows, depthIndex, fitness[rows, depthIndex], rows[sorted(restarts)])
+
+## helper functions ##
+
+def _windowMax(values, k):
+    """Maximum of values over the window [i - k, i + k] for every i, and the offset of the maximum."""
+    best = values.copy()
+    move = np.zeros(len(values), dtype=np.int64)
+    for shift in range(1, k + 1):
+        #coming from a shallower column (i - shift)
+        better = values[:-shift] > best[shift:]
+        best[shift:] = np.where(better, values[:-shift], best[shift:])
+        move[shift:] = np.where(better, -shift, move[shift:])
+        #coming from a deeper column (i + shift)
+        better = values[shift:] > best[:-shift]
+        best[:-shift] = np.where(better, values[shift:], best[:-shift])
+        move[:-shift] = np.where(better, shift, move[:-shift])
+    return best, move
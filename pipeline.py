@@ -0,0 +1,92 @@
+import datetime
+import numpy as np
+
+from climatology import MINUTES_PER_DAY
+from fitness import createFitnessGrid
+from gapFill import fillGaps, hourlyClimatology
+from gridCache import GridCache
+from interpolation import interpolateGrid
+from lakeGrid import INTERPOLATED
+from metrics import nullMetrics
+from resample import nativeStep, resampleRecords, stepMinutes
+from temperatureLoader import loadTemperatureFile
+
+PIPELINE_VERSION = 5 #bump whenever a stage changes its output, so cached grids are rebuilt
+STAGES = ('ingest', 'resample', 'climatology', 'gapFill', 'interpolate', 'fitness')
+
+def processLakeYear(filename, singleYear, resolution=0.1, layout='hourly', method='linear',
+                    model='synechococcus', params=None, cache=None, step=None, resampling='mean', metrics=None):
+    """Array version of main(): loads the temperature file, fills gaps in one year from the
+    average over all years, interpolates it and evaluates fitness. With a cache, a warm start
+    skips ingestion entirely and returns memory-mapped arrays.
+
+    Readings are first put on a regular axis with the given time step (see resample.resampleRecords),
+    and the gaps are filled from a climatology at that same step, so a hires file can be run at its
+    native sensor cadence and strategies then move once per step.
+
+    Args:
+        filename: the LTER temperature file
+        singleYear: the year of interest
+        resolution: depth resolution of the interpolated grid in meters
+        layout: 'hourly', 'daily' or 'hires'
+        method: the interpolation method, see interpolation.METHODS
+        model: the name of a registered growth model
+        params: optional parameter overrides for the growth model
+        cache: optional GridCache or cache directory
+        step: time step in minutes (or a timedelta), by default the native data_freq of hires files,
+            one day for daily files and one hour otherwise
+        resampling: 'mean' to aggregate readings into each step, 'interpolate' to sample between them
+        metrics: optional Metrics to record the stage timings, rejected lines, filled and
+            interpolated cells and cache hits into
+
+    Returns:
+        lakeGrid, fitness, meta
+    """
+    metrics = nullMetrics(metrics)
+
+    def build():
+        with metrics.timed('ingest'):
+            records = loadTemperatureFile(filename, layout)
+        metrics.addWork('ingest', len(records), len(records))
+        metrics.update(records.rejectSummary(), 'rejected.')
+        minutes = nativeStep(records, layout) if step is None else stepMinutes(step)
+        with metrics.timed('resample', len(records), len(records)):
+            measured = resampleRecords(records, minutes, resampling)
+        with metrics.timed('climatology', len(measured.times), measured.temps.size):
+            climatology = hourlyClimatology(measured, MINUTES_PER_DAY // minutes)
+        with metrics.timed('gapFill', len(measured.times), measured.temps.size):
+            grid, gaps = fillGaps(measured, climatology, singleYear)
+        metrics.update(gaps[singleYear], 'gapFill.')
+        with metrics.timed('interpolate', len(grid.times)):
+            grid = interpolateGrid(grid, resolution, method)
+        metrics.count('interpolate.interpolatedCells', (grid.flags == INTERPOLATED).sum())
+        with metrics.timed('fitness', len(grid.times), grid.temps.size):
+            fitness = createFitnessGrid(grid, model, params)
+        meta = {'source': filename, 'year': singleYear, 'resolution': resolution, 'step': minutes,
+                'rejected': records.rejectSummary(), 'gaps': gaps[singleYear]}
+        return grid, {'fitness': fitness}, meta
+
+    if cache is None:
+        grid, arrays, meta = build()
+        return grid, arrays['fitness'], meta
+    if not isinstance(cache, GridCache):
+        cache = GridCache(cache)
+    key = cache.key(filename, year=singleYear, resolution=resolution, layout=layout, method=method,
+                    model=model, params=params, step=None if step is None else stepMinutes(step),
+                    resampling=resampling, version=PIPELINE_VERSION)
+    metrics.count('cache.hits' if key in cache else 'cache.misses')
+    grid, arrays, meta = cache.getOrBuild(key, build)
+    return grid, arrays['fitness'], meta
+
+def yearWindow(lakeGrid, singleYear):
+    """Returns the rows of one year, the same window as dateString(singleYear, True).
+
+    Args:
+        lakeGrid: LakeGrid
+        singleYear: the year of interest
+    Returns:
+        LakeGrid
+    """
+    start = datetime.datetime(singleYear, 1, 1)
+    end = datetime.datetime(singleYear, 12, 31, 23, 59)
+    return lakeGrid.window(start, end)
@@ -0,0 +1,168 @@
+import datetime
+import numpy as np
+
+from climatology import MINUTES_PER_DAY
+from lakeGrid import LakeGrid, MISSING, MEASURED, INTERPOLATED, TIME_UNIT, DEPTH_DECIMALS
+
+METHODS = ('mean', 'interpolate')
+
+def resampleRecords(records, step=60, method='mean', maxGap=None, qualityLabels=None):
+    """Puts readings taken at any cadence (eg. the minute level data_freq records of the hires files)
+    on a regular time axis with the given step, for every depth at once.
+
+    'mean' aggregates: every reading goes to the step it falls in and each (step, depth) cell is the
+    mean of its readings, which is how 1 minute data becomes a 10 minute, hourly or daily grid.
+    'interpolate' samples: the value at each step is interpolated in time between the readings on
+    either side of it, which is how coarse readings are put on a finer axis. Two readings are only
+    bridged if they are at most maxGap apart, by default the larger of their data_freq (or the step
+    when the records have no data_freq), so sensor outages are left for the gap filling.
+
+    Steps start at midnight, so grids resampled from separate chunks of a file line up.
+
+    Args:
+        records: TemperatureRecords (or anything with times, depths, temps, flags and dataFreq)
+        step: the target step, in minutes or as a timedelta. Must divide a day.
+        method: 'mean' or 'interpolate'
+        maxGap: optional longest time (minutes or timedelta) bridged by 'interpolate'
+        qualityLabels: optional list of known flag strings, so indices stay stable across calls
+
+    Returns:
+        LakeGrid on a regular axis from the step of the first reading to the step of the last one.
+        Cells holding a mean or an exact reading are MEASURED, cells interpolated in time are
+        INTERPOLATED. The quality code of a cell is the one of its first reading.
+    """
+    if method not in METHODS:
+        raise ValueError('unknown resampling method %r, choose from %s' % (method, METHODS))
+    minutes = stepMinutes(step)
+    times = np.asarray(records.times).astype(TIME_UNIT).astype(np.int64)
+    depths = np.round(np.asarray(records.depths, dtype=np.float64), DEPTH_DECIMALS)
+    temps = np.asarray(records.temps, dtype=np.float64)
+    labels = [''] if qualityLabels is None else list(qualityLabels)
+    valid = ~np.isnan(temps)
+    if not valid.any():
+        return LakeGrid.empty()
+
+    times, depths, temps = times[valid], depths[valid], temps[valid]
+    flags = np.asarray(records.flags).astype(str)[valid]
+    dataFreq = None if records.dataFreq is None else np.asarray(records.dataFreq, dtype=np.float64)[valid]
+
+    depthAxis, cols = np.unique(depths, return_inverse=True)
+    first, last = times.min() // minutes, times.max() // minutes
+    timeAxis = (np.arange(first, last + 1) * minutes).astype(TIME_UNIT)
+    shape = (len(timeAxis), len(depthAxis))
+
+    uniqueFlags, flagIndex = np.unique(flags, return_inverse=True)
+    for label in uniqueFlags.tolist():
+        if label not in labels:
+            labels.append(label)
+    codes = np.array([labels.index(label) for label in uniqueFlags.tolist()], dtype=np.uint8)[flagIndex]
+
+    if method == 'mean':
+        grid, cellFlags, quality = _aggregate(times, cols, temps, codes, minutes, first, shape)
+    else:
+        gap = maxGap if maxGap is None else stepMinutes(maxGap)
+        grid, cellFlags, quality = _sample(times, cols, temps, codes, dataFreq, minutes, timeAxis, shape, gap)
+    return LakeGrid(timeAxis, depthAxis, grid, cellFlags, quality, tuple(labels))
+
+def nativeStep(records, layout='hourly'):
+    """The step the records were logged at: the most common data_freq, rounded down to a step
+    that divides a day. Records without data_freq give the step of their layout, a day for
+    daily files and an hour otherwise.
+
+    Args:
+        records: TemperatureRecords
+        layout: 'hourly', 'daily' or 'hires', the layout the records were read from
+    Returns:
+        step in minutes
+    """
+    default = layoutStep(layout)
+    if records.dataFreq is None or len(records.dataFreq) == 0:
+        return default
+    freq = np.asarray(records.dataFreq, dtype=np.float64)
+    freq = freq[np.isfinite(freq) & (freq >= 1)]
+    if len(freq) == 0:
+        return default
+    values, counts = np.unique(np.floor(freq).astype(np.int64), return_counts=True)
+    common = int(min(values[counts.argmax()], MINUTES_PER_DAY))
+    while MINUTES_PER_DAY % common:
+        common -= 1
+    return common
+
+def layoutStep(layout):
+    """The step in minutes of a file layout without data_freq: a day for 'daily', an hour otherwise."""
+    return MINUTES_PER_DAY if layout == 'daily' else 60
+
+def stepMinutes(step):
+    """Converts a step given in minutes, as a datetime.timedelta or as a numpy timedelta64 into
+    integer minutes, and checks that it divides a day.
+    """
+    if isinstance(step, datetime.timedelta):
+        minutes = step.total_seconds() / 60.0
+    elif isinstance(step, np.timedelta64):
+        minutes = step / np.timedelta64(1, 'm')
+    else:
+        minutes = float(step)
+    if minutes != int(minutes) or minutes < 1 or MINUTES_PER_DAY % int(minutes):
+        raise ValueError('step must be a whole number of minutes dividing %d, got %r' % (MINUTES_PER_DAY, step))
+    return int(minutes)
+
+## helper functions ##
+
+def _aggregate(times, cols, temps, codes, minutes, first, shape):
+    """Mean of the readings in every (step, depth) cell with bincount."""
+    cell = (times // minutes - first) * shape[1] + cols
+    size = shape[0] * shape[1]
+    count = np.bincount(cell, minlength=size)
+    total = np.bincount(cell, weights=temps, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        grid = np.where(count > 0, total / count, np.nan).astype(np.float32).reshape(shape)
+
+    quality = np.zeros(size, dtype=np.uint8)
+    order = np.lexsort((times, cell)) #earliest reading of each cell first
+    firstOfCell = order[np.concatenate([[True], cell[order][1:] != cell[order][:-1]])]
+    quality[cell[firstOfCell]] = codes[firstOfCell]
+    cellFlags = np.where(count > 0, MEASURED, MISSING).astype(np.uint8).reshape(shape)
+    return grid, cellFlags, quality.reshape(shape)
+
+def _sample(times, cols, temps, codes, dataFreq, minutes, timeAxis, shape, maxGap):
+    """Linear interpolation in time for every depth at once. Each depth's readings are shifted onto
+    their own stretch of one sorted axis, so a single searchsorted brackets every target cell.
+    """
+    span = int(max(times.max(), timeAxis[-1].astype(np.int64)) - min(times.min(), timeAxis[0].astype(np.int64))) + 1
+    origin = min(times.min(), timeAxis[0].astype(np.int64))
+    key = cols.astype(np.int64) * span + (times - origin)
+    order = np.argsort(key, kind='stable')
+    key, temps, codes = key[order], temps[order], codes[order]
+    if dataFreq is None:
+        reach = np.full(len(key), minutes, dtype=np.float64)
+    else:
+        reach = np.where(np.isfinite(dataFreq[order]), dataFreq[order], minutes)
+    #on a repeated (time, depth) the first reading wins, like LakeGrid.fromArrays
+    keep = np.concatenate([[True], key[1:] != key[:-1]])
+    key, temps, codes, reach = key[keep], temps[keep], codes[keep], reach[keep]
+
+    target = (np.arange(shape[1], dtype=np.int64)[None, :] * span
+              + (timeAxis.astype(np.int64) - origin)[:, None]).reshape(-1)
+    hi = np.searchsorted(key, target)
+    lo = hi - 1
+    hiIn = np.minimum(hi, len(key) - 1)
+    loIn = np.maximum(lo, 0)
+    exact = (hi < len(key)) & (key[hiIn] == target)
+
+    sameDepth = (lo >= 0) & (hi < len(key)) & (key[loIn] // span == target // span) & (key[hiIn] // span == target // span)
+    gap = (key[hiIn] - key[loIn]).astype(np.float64)
+    limit = np.maximum(reach[loIn], reach[hiIn]) if maxGap is None else maxGap
+    bridged = sameDepth & (gap <= limit) & ~exact
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(bridged, (target - key[loIn]) / gap, 0.0)
+    values = temps[loIn] + weight * (temps[hiIn] - temps[loIn])
+
+    grid = np.full(target.shape, np.nan, dtype=np.float32)
+    cellFlags = np.full(target.shape, MISSING, dtype=np.uint8)
+    quality = np.zeros(target.shape, dtype=np.uint8)
+    grid[bridged] = values[bridged]
+    cellFlags[bridged] = INTERPOLATED
+    grid[exact] = temps[hiIn[exact]]
+    cellFlags[exact] = MEASURED
+    quality[exact] = codes[hiIn[exact]]
+    return grid.reshape(shape), cellFlags.reshape(shape), quality.reshape(shape)
@@ -0,0 +1,191 @@
+import numpy as np
+
+from lakeGrid import TIME_UNIT
+
+WAUSAU = (44.9591, -89.6301, -6) #latitude, longitude, UTC offset of the USNO tables used for Sparkling Lake
+SUN_ZENITH = 90.833 #degrees, accounts for refraction and the radius of the sun, as in the USNO tables
+
+class SolarTable(object):
+    """Sunrise and sunset for a run of consecutive days, indexed by day ordinal.
+
+    Replaces the list scanned by findSunsetTimes: the times of any day are found by subtracting
+    the first day, and day/night for a whole time axis is one vectorized comparison.
+
+    Args:
+        firstDay: the first day of the table (anything np.datetime64 accepts)
+        sunrise: minutes after local midnight of sunrise for each day, NaN if unknown
+        sunset: minutes after local midnight of sunset for each day, NaN if unknown
+    """
+    def __init__(self, firstDay, sunrise, sunset):
+        self.firstDay = np.datetime64(firstDay, 'D')
+        self.sunrise = np.asarray(sunrise, dtype=np.float64)
+        self.sunset = np.asarray(sunset, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.sunrise)
+
+    @property
+    def days(self):
+        return self.firstDay + np.arange(len(self)).astype('timedelta64[D]')
+
+    @classmethod
+    def fromSunsetMatrix(cls, sunsetMatrix):
+        """Builds a table from the sorted [sunrise, sunset] datetime pairs made by sunriseToDateTime."""
+        sunrises = np.array([row[0] for row in sunsetMatrix], dtype=TIME_UNIT)
+        sunsets = np.array([row[1] for row in sunsetMatrix], dtype=TIME_UNIT)
+        return cls._fromTimes(sunrises, sunsets)
+
+    @classmethod
+    def fromUSNO(cls, filename, year):
+        """Reads a USNO sunrise/sunset text file, the same fixed width layout createSunriseData reads.
+        Kept as a validation source for computeSolarTable.
+
+        Args:
+            filename: the text file
+            year: the year of the table
+        Returns:
+            SolarTable
+        """
+        sunrises, sunsets = [], []
+        with open(filename, 'r') as ins:
+            for _ in range(3): #headers
+                next(ins, None)
+            for line in ins:
+                if not line[:2].strip().isdigit():
+                    continue
+                day = int(line[:2])
+                line = line.rstrip('\n')[4:]
+                #11 character blocks, one per month, to account for uneven whitespace when missing values
+                for month, block in enumerate([line[i:i + 11] for i in range(0, len(line), 11)], 1):
+                    times = block.split()
+                    if len(times) != 2 or month > 12:
+                        continue
+                    date = '%04d-%02d-%02d' % (year, month, day)
+                    sunrises.append(np.datetime64(date + 'T%s:%s' % (times[0][-4:-2].zfill(2), times[0][-2:])))
+                    sunsets.append(np.datetime64(date + 'T%s:%s' % (times[1][-4:-2].zfill(2), times[1][-2:])))
+        order = np.argsort(np.array(sunrises, dtype=TIME_UNIT))
+        return cls._fromTimes(np.array(sunrises, dtype=TIME_UNIT)[order], np.array(sunsets, dtype=TIME_UNIT)[order])
+
+    ## lookups ##
+
+    def dayIndex(self, times):
+        """Row of the table for each time, -1 outside the table."""
+        index = (np.asarray(times).astype('datetime64[D]') - self.firstDay).astype(np.int64)
+        return np.where((index >= 0) & (index < len(self)), index, -1)
+
+    def sunTimes(self, date):
+        """Sunrise and sunset of one day as datetime64, the O(1) replacement for findSunsetTimes."""
+        index = self.dayIndex(np.datetime64(date, 'm'))
+        if index < 0 or np.isnan(self.sunrise[index]):
+            return None
+        day = (self.firstDay + np.timedelta64(int(index), 'D')).astype(TIME_UNIT)
+        return (day + np.timedelta64(int(round(self.sunrise[index])), 'm'),
+                day + np.timedelta64(int(round(self.sunset[index])), 'm'))
+
+    def isDaylight(self, times):
+        """Day/night for every time: True when sunrise <= time < sunset, as in circadianMovement.
+        Times on days missing from the table count as night.
+
+        Args:
+            times: datetime64 array, eg. LakeGrid.times
+        Returns:
+            boolean array
+        """
+        times = np.asarray(times).astype(TIME_UNIT)
+        index = self.dayIndex(times)
+        minute = (times - times.astype('datetime64[D]')).astype(np.int64)
+        safe = np.maximum(index, 0)
+        with np.errstate(invalid='ignore'):
+            daylight = (minute >= self.sunrise[safe]) & (minute < self.sunset[safe])
+        return daylight & (index >= 0)
+
+    def daylightVector(self, start, end, step=np.timedelta64(60, 'm')):
+        """Precomputed day/night for every step of a simulation window.
+
+        Args:
+            start: the start date
+            end: the end date (inclusive)
+            step: the time step
+        Returns:
+            times, daylight
+        """
+        times = np.arange(np.datetime64(start, 'm'), np.datetime64(end, 'm') + np.timedelta64(1, 'm'), step)
+        return times, self.isDaylight(times)
+
+    def compare(self, other):
+        """Differences in minutes against another table over the days both tables cover,
+        eg. computeSolarTable against fromUSNO.
+
+        Returns:
+            dictionary with the number of days compared and the mean/max absolute differences
+        """
+        days = np.intersect1d(self.days, other.days)
+        mine, theirs = self.dayIndex(days), other.dayIndex(days)
+        sunrise = np.abs(self.sunrise[mine] - other.sunrise[theirs])
+        sunset = np.abs(self.sunset[mine] - other.sunset[theirs])
+        return {'days': len(days),
+                'sunriseMeanMinutes': float(np.nanmean(sunrise)) if len(days) else 0.0,
+                'sunriseMaxMinutes': float(np.nanmax(sunrise)) if len(days) else 0.0,
+                'sunsetMeanMinutes': float(np.nanmean(sunset)) if len(days) else 0.0,
+                'sunsetMaxMinutes': float(np.nanmax(sunset)) if len(days) else 0.0}
+
+    @classmethod
+    def _fromTimes(cls, sunrises, sunsets):
+        days = sunrises.astype('datetime64[D]')
+        if len(days) == 0:
+            return cls(np.datetime64('1970-01-01'), [], [])
+        firstDay = days.min()
+        table = cls(firstDay, np.full(int((days.max() - firstDay).astype(np.int64)) + 1, np.nan),
+                    np.full(int((days.max() - firstDay).astype(np.int64)) + 1, np.nan))
+        index = (days - firstDay).astype(np.int64)
+        table.sunrise[index] = (sunrises - days.astype(TIME_UNIT)).astype(np.int64)
+        table.sunset[index] = (sunsets - sunsets.astype('datetime64[D]').astype(TIME_UNIT)).astype(np.int64)
+        return table
+
+def computeSolarTable(latitude, longitude, startYear, endYear=None, utcOffset=0):
+    """Astronomical sunrise and sunset for every day of one or more years, using the NOAA solar
+    position equations, so new lakes and years do not need manually collected tables.
+    Times are rounded to the minute, like the USNO tables.
+
+    Args:
+        latitude: degrees north
+        longitude: degrees east (negative in the western hemisphere)
+        startYear: the first year
+        endYear: optional last year (inclusive), defaults to startYear
+        utcOffset: hours from UTC of the local (standard) time the table is given in, eg. -6 for Wisconsin
+
+    Returns:
+        SolarTable
+    """
+    endYear = startYear if endYear is None else endYear
+    firstDay = np.datetime64('%04d-01-01' % startYear, 'D')
+    days = np.arange(firstDay, np.datetime64('%04d-01-01' % (endYear + 1), 'D'))
+
+    #julian day at local noon
+    julianDay = days.astype(np.int64) + 2440587.5 + 0.5 - utcOffset / 24.0
+    century = (julianDay - 2451545.0) / 36525.0
+
+    meanLongitude = np.mod(280.46646 + century * (36000.76983 + century * 0.0003032), 360)
+    meanAnomaly = 357.52911 + century * (35999.05029 - 0.0001537 * century)
+    eccentricity = 0.016708634 - century * (0.000042037 + 0.0000001267 * century)
+    anomaly = np.radians(meanAnomaly)
+    center = (np.sin(anomaly) * (1.914602 - century * (0.004817 + 0.000014 * century))
+              + np.sin(2 * anomaly) * (0.019993 - 0.000101 * century) + np.sin(3 * anomaly) * 0.000289)
+    omega = np.radians(125.04 - 1934.136 * century)
+    apparentLongitude = meanLongitude + center - 0.00569 - 0.00478 * np.sin(omega)
+    meanObliquity = 23 + (26 + (21.448 - century * (46.815 + century * (0.00059 - century * 0.001813))) / 60) / 60
+    obliquity = np.radians(meanObliquity + 0.00256 * np.cos(omega))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(np.radians(apparentLongitude)))
+
+    y = np.tan(obliquity / 2) ** 2
+    longitudeRadians = np.radians(meanLongitude)
+    equationOfTime = 4 * np.degrees(y * np.sin(2 * longitudeRadians) - 2 * eccentricity * np.sin(anomaly)
+                                    + 4 * eccentricity * y * np.sin(anomaly) * np.cos(2 * longitudeRadians)
+                                    - 0.5 * y * y * np.sin(4 * longitudeRadians)
+                                    - 1.25 * eccentricity * eccentricity * np.sin(2 * anomaly))
+
+    lat = np.radians(latitude)
+    cosHourAngle = np.cos(np.radians(SUN_ZENITH)) / (np.cos(lat) * np.cos(declination)) - np.tan(lat) * np.tan(declination)
+    hourAngle = np.degrees(np.arccos(np.clip(cosHourAngle, -1, 1))) #clipped: polar night / midnight sun
+    solarNoon = 720 - 4 * longitude - equationOfTime + utcOffset * 60
+    return SolarTable(firstDay, np.round(solarNoon - 4 * hourAngle), np.round(solarNoon + 4 * hourAngle))
@@ -0,0 +1,98 @@
+import numpy as np
+
+from lakeGrid import MEASURED, FILLED, INTERPOLATED, FLAG_NAMES, DEPTH_DECIMALS
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+class StableDepthBaseline(object):
+    """fitnessAtStableDepth for every depth of the lake at once.
+
+    Args:
+        times: (T,) time axis of the window
+        depths: (D,) depth axis
+        temps: (T, D) temperature of an organism staying at each depth, NaN where excluded or missing
+        fitness: (T, D) its fitness, NaN where excluded or missing
+        percentiles: the percentiles reported in percentileFitness
+    """
+    def __init__(self, times, depths, temps, fitness, percentiles=PERCENTILES):
+        self.times = times
+        self.depths = depths
+        self.temps = temps
+        self.fitness = fitness
+        self.percentiles = tuple(percentiles)
+        valid = ~np.isnan(fitness)
+        self.hours = valid.sum(axis=0)
+        self.totalFitness = np.where(valid, fitness, 0).sum(axis=0, dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.meanFitness = np.where(self.hours > 0, self.totalFitness / self.hours, np.nan)
+        self.percentileFitness = _nanPercentiles(fitness, self.percentiles)
+
+    def rank(self, by='total'):
+        """Columns from best to worst by 'total' or 'mean' fitness, depths without data last."""
+        if by not in ('total', 'mean'):
+            raise ValueError("by must be 'total' or 'mean', got %r" % (by,))
+        scores = np.where(self.hours > 0, self.totalFitness if by == 'total' else self.meanFitness, np.nan)
+        return np.argsort(np.where(np.isnan(scores), np.inf, -scores), kind='stable')
+
+    def column(self, depth):
+        """The fitnessAtStableDepth lists of one depth: its times, temperatures and fitness where it has data."""
+        cols = np.flatnonzero(self.depths == round(float(depth), DEPTH_DECIMALS))
+        if len(cols) == 0:
+            raise ValueError('depth %r is not on the grid' % (depth,))
+        col = int(cols[0])
+        rows = np.flatnonzero(~np.isnan(self.fitness[:, col]))
+        return self.times[rows], self.temps[rows, col], self.fitness[rows, col]
+
+    def summary(self):
+        """Per depth totals, means, hours and percentiles as a dictionary of lists."""
+        summary = {'depths': self.depths.tolist(), 'hours': self.hours.tolist(),
+                   'totalFitness': self.totalFitness.tolist(), 'meanFitness': self.meanFitness.tolist()}
+        for p, values in zip(self.percentiles, self.percentileFitness):
+            summary['p%g' % p] = values.tolist()
+        return summary
+
+def stableDepthBaseline(lakeGrid, fitness, start=None, end=None, include=(MEASURED, FILLED, INTERPOLATED),
+                        percentiles=PERCENTILES):
+    """The fitness of staying at each depth for the whole window, in one pass over the grid.
+
+    Without masking the temperature and fitness arrays are views of the grid's own arrays. With
+    include restricted, eg. include=(MEASURED,) for a baseline on sensor readings only, excluded
+    cells come out NaN and are left out of every statistic.
+
+    Args:
+        lakeGrid: LakeGrid (usually interpolated)
+        fitness: (T, D) fitness aligned with lakeGrid
+        start: optional start date of the window
+        end: optional end date of the window (inclusive)
+        include: provenance flags of the cells to use, see lakeGrid.FLAG_NAMES
+        percentiles: percentiles of the fitness distribution at each depth
+
+    Returns:
+        StableDepthBaseline
+    """
+    unknown = [flag for flag in include if flag not in FLAG_NAMES]
+    if unknown:
+        raise ValueError('unknown provenance flags %s, choose from %s' % (unknown, sorted(FLAG_NAMES)))
+    lo, hi = 0, len(lakeGrid.times)
+    if start is not None:
+        lo = np.searchsorted(lakeGrid.times, np.datetime64(start, 'm'), side='left')
+    if end is not None:
+        hi = np.searchsorted(lakeGrid.times, np.datetime64(end, 'm'), side='right')
+    rows = slice(lo, max(hi, lo))
+    temps = lakeGrid.temps[rows]
+    fitness = np.asarray(fitness)[rows]
+    if set(include) != set((MEASURED, FILLED, INTERPOLATED)):
+        keep = np.isin(lakeGrid.flags[rows], list(include))
+        temps = np.where(keep, temps, np.nan)
+        fitness = np.where(keep, fitness, np.nan)
+    return StableDepthBaseline(lakeGrid.times[rows], lakeGrid.depths, temps, fitness, percentiles)
+
+## helper functions ##
+
+def _nanPercentiles(values, percentiles):
+    """(P, D) percentiles of every column, NaN for columns without data."""
+    out = np.full((len(percentiles), values.shape[1]), np.nan)
+    hasData = ~np.isnan(values).all(axis=0)
+    if len(percentiles) and hasData.any():
+        out[:, hasData] = np.nanpercentile(values[:, hasData], percentiles, axis=0)
+    return out
@@ -0,0 +1,316 @@
+import abc
+import json
+import numpy as np
+
+CIRCADIAN_DISTANCE = {'slow': 2, 'fast': 4} #index hops per hour, as in circadianMovement
+
+## lake sources ##
+
+class DenseSource(object):
+    """The lookup interface the engine reads a lake through, backed by a LakeGrid and its fitness grid.
+
+    Args:
+        lakeGrid: LakeGrid (usually interpolated)
+        fitness: (T, D) fitness aligned with lakeGrid
+    """
+    def __init__(self, lakeGrid, fitness):
+        self.lakeGrid = lakeGrid
+        self.fitness = np.asarray(fitness)
+        self.times = lakeGrid.times
+        self.depths = lakeGrid.depths
+        #the columns with data of every row, flattened once, so a row's columns are a slice
+        mask = lakeGrid.mask
+        self._columns = np.flatnonzero(mask) % max(mask.shape[1], 1)
+        self._offsets = np.concatenate([[0], np.cumsum(mask.sum(axis=1))])
+
+    def __len__(self):
+        return len(self.times)
+
+    def validColumns(self, t):
+        """Sorted columns that hold data at row t (the sorted dataMatrixDict[date].keys())."""
+        return self._columns[self._offsets[t]:self._offsets[t + 1]]
+
+    def fitnessAt(self, t, columns):
+        return self.fitness[t, columns]
+
+    def temperatureAt(self, t, columns):
+        return self.lakeGrid.temps[t, columns]
+
+## strategy kernels ##
+
+class Strategy(abc.ABC):
+    """A movement strategy reduced to its step kernel.
+
+    Kernels work in rank space: rank r is the r-th depth with data this hour, so "one step deeper"
+    is r + 1 whatever the resolution or the set of sensors. The engine does the time iteration,
+    snaps agents onto this hour's depths and clamps (boundary = 'clamp') or cancels
+    (boundary = 'stay') moves that would leave the lake. Subclasses implement step, and set
+    needsDaylight when they read context.daylight.
+    """
+    boundary = 'clamp'
+    needsDaylight = False
+
+    def start(self, context):
+        """Initial rank of every agent, a random depth by default (random.choice in the originals)."""
+        return context.randomRank()
+
+    @abc.abstractmethod
+    def step(self, context):
+        """Proposed rank of every agent for this hour."""
+
+class RandomWalk(Strategy):
+    """randomWalk: a random depth every hour."""
+    def step(self, context):
+        return context.randomRank()
+
+class RandomWalkDirectional(Strategy):
+    """randomWalkDirectional: one step shallower when the coin comes up above probabilityFactor,
+    otherwise one step deeper.
+    """
+    def __init__(self, probabilityFactor=0.5):
+        self.probabilityFactor = probabilityFactor
+
+    def step(self, context):
+        return np.where(context.uniforms > self.probabilityFactor, context.rank - 1, context.rank + 1)
+
+class HillClimbing(Strategy):
+    """hillClimbingMovement: move to the deeper neighbour if it is fitter, then to the shallower one
+    if it beats the best so far.
+    """
+    def step(self, context):
+        here, deeper, shallower = context.neighbourFitness((0, 1, -1)).T
+        better = deeper > here
+        moved = np.where(better, context.rank + 1, context.rank)
+        best = np.where(better, deeper, here)
+        return np.where(shallower > best, context.rank - 1, moved)
+
+class Circadian(Strategy):
+    """circadianMovement: up by day, down by night, distance depths per hour. A move that would
+    leave the lake is not made.
+    """
+    boundary = 'stay'
+    needsDaylight = True
+
+    def __init__(self, speed='slow'):
+        if speed not in CIRCADIAN_DISTANCE:
+            raise ValueError('incorrect speed %r, choose from %s' % (speed, sorted(CIRCADIAN_DISTANCE)))
+        self.distance = CIRCADIAN_DISTANCE[speed]
+
+    def step(self, context):
+        return context.rank - self.distance if context.daylight else context.rank + self.distance
+
+STRATEGY_KERNELS = {}
+
+def registerStrategy(name, kernel):
+    """Makes a Strategy subclass available to makeStrategy by name."""
+    STRATEGY_KERNELS[name] = kernel
+
+def makeStrategy(name, **settings):
+    """Builds a registered strategy, eg. makeStrategy('circadian', speed='fast')."""
+    if name not in STRATEGY_KERNELS:
+        raise ValueError('unknown strategy %r, choose from %s' % (name, sorted(STRATEGY_KERNELS)))
+    return STRATEGY_KERNELS[name](**settings)
+
+registerStrategy('randomWalk', RandomWalk)
+registerStrategy('randomWalkDirectional', RandomWalkDirectional)
+registerStrategy('hillClimbing', HillClimbing)
+registerStrategy('circadian', Circadian)
+
+## engine ##
+
+def agentStreams(nAgents, seed=None):
+    """Independent random streams, one per agent. Agent i always gets the same stream for a given
+    seed, no matter how many agents are simulated or how the ensemble is split across processes.
+
+    Args:
+        nAgents: the number of agents
+        seed: an int or np.random.SeedSequence
+
+    Returns:
+        list of np.random.Generator
+    """
+    sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return [np.random.Generator(np.random.PCG64(child)) for child in sequence.spawn(nAgents)]
+
+class StepContext(object):
+    """What a kernel sees at one hour: the agents' ranks, the number of depths with data,
+    this step's random numbers, day/night and the local fitness neighbourhood.
+    """
+    def __init__(self, source, t, columns, rank, uniforms, daylight):
+        self.source = source
+        self.t = t
+        self.columns = columns
+        self.nValid = len(columns)
+        self.rank = rank
+        self.uniforms = uniforms
+        self.daylight = daylight
+
+    def randomRank(self):
+        return np.minimum((self.uniforms * self.nValid).astype(np.int64), self.nValid - 1)
+
+    def neighbourFitness(self, offsets):
+        """(N, len(offsets)) fitness at rank + offset for every agent, -inf outside the lake."""
+        ranks = self.rank[:, None] + np.asarray(offsets)[None, :]
+        inside = (ranks >= 0) & (ranks < self.nValid)
+        values = self.source.fitnessAt(self.t, self.columns[np.minimum(np.maximum(ranks, 0), self.nValid - 1)])
+        return np.where(inside, values, -np.inf)
+
+class EngineState(object):
+    """Everything needed to continue a run: current columns, random streams, unused random numbers,
+    accumulated fitness and how many hours have been simulated.
+    """
+    def __init__(self, streams, columns=None, buffer=None, totalFitness=None, steps=0):
+        self.streams = streams
+        self.columns = columns
+        self.buffer = np.zeros((len(streams), 0)) if buffer is None else buffer
+        self.totalFitness = np.zeros(len(streams)) if totalFitness is None else totalFitness
+        self.steps = steps
+
+    @classmethod
+    def fresh(cls, nAgents, seed=None):
+        """A new state with one random stream per agent (see agentStreams)."""
+        return cls(agentStreams(nAgents, seed))
+
+    def save(self, filename):
+        """Writes the state to a .npz file, random streams included, so a run can be continued
+        in another process exactly where it stopped.
+        """
+        with open(filename, 'wb') as f:
+            np.savez(f, **self._arrays())
+
+    @classmethod
+    def load(cls, filename):
+        """Reads a state written by save()."""
+        with np.load(filename) as data:
+            streams = []
+            for streamState in json.loads(str(data['streams'])):
+                stream = np.random.Generator(getattr(np.random, streamState['bit_generator'])())
+                stream.bit_generator.state = streamState
+                streams.append(stream)
+            return cls._fromArrays(streams, dict((name, data[name]) for name in data.files))
+
+    def uniforms(self, count, blockSize):
+        """The next count random numbers of every agent as a (count, N) array. Numbers are drawn
+        blockSize at a time and left-overs are kept, so results do not depend on how a run is chunked.
+        """
+        while self.buffer.shape[1] < count:
+            block = np.stack([stream.random(blockSize) for stream in self.streams])
+            self.buffer = np.concatenate([self.buffer, block], axis=1)
+        taken, self.buffer = self.buffer[:, :count], self.buffer[:, count:]
+        return taken.T
+
+    def _arrays(self):
+        arrays = {'streams': np.array(json.dumps([stream.bit_generator.state for stream in self.streams])),
+                  'buffer': self.buffer, 'totalFitness': self.totalFitness, 'steps': self.steps}
+        if self.columns is not None:
+            arrays['columns'] = self.columns
+        return arrays
+
+    @classmethod
+    def _fromArrays(cls, streams, arrays):
+        return cls(streams, arrays.get('columns'), arrays['buffer'], arrays['totalFitness'], int(arrays['steps']))
+
+class StrategyResult(object):
+    """Collected output of runStrategy.
+
+    Args:
+        rows: the source rows simulated (the hours with data)
+        times: their times
+        depthIndex: (N, T) column of every agent at every simulated hour
+        fitness: (N, T) fitness of every agent at every simulated hour
+        counters: dictionary with the number of depth 'snaps' and boundary 'clamps'
+        state: EngineState to continue the run from
+    """
+    def __init__(self, rows, times, depthIndex, fitness, counters, state):
+        self.rows = rows
+        self.times = times
+        self.depthIndex = depthIndex
+        self.fitness = fitness
+        self.counters = counters
+        self.state = state
+
+def runStrategy(source, strategy, nAgents=1, seed=None, daylight=None, rows=None, state=None, blockSize=720):
+    """Runs a strategy kernel for nAgents agents over the hours of a source.
+
+    The engine does what every function in movementStrategies repeated: it walks the hours with
+    data, snaps each agent's previous depth onto the nearest depth with data this hour (searchsorted
+    on that hour's columns), hands the kernel its context, applies the boundary rule and collects
+    depth and fitness.
+
+    Args:
+        source: DenseSource (or anything with the same lookup interface)
+        strategy: Strategy instance (see makeStrategy)
+        nAgents: number of agents, ignored when state is given
+        seed: seed for the per-agent random streams, ignored when state is given
+        daylight: (T,) booleans aligned with the source rows, needed by strategies with needsDaylight
+        rows: optional rows of the source to run over, defaults to all of them
+        state: optional EngineState to continue from
+        blockSize: random numbers drawn per agent at a time
+
+    Returns:
+        StrategyResult
+    """
+    if strategy.needsDaylight and daylight is None:
+        raise ValueError('%s needs the daylight vector' % type(strategy).__name__)
+    if state is None:
+        state = EngineState.fresh(nAgents, seed)
+    nAgents = len(state.streams)
+    rows = np.arange(len(source)) if rows is None else np.asarray(rows)
+
+    simulated = []
+    depthIndex = np.empty((len(rows), nAgents), dtype=np.int32) #(hours, agents): each hour is a contiguous write
+    fitness = np.empty((len(rows), nAgents), dtype=np.float32)
+    counters = {'snaps': 0, 'clamps': 0}
+    uniforms = np.zeros((0, nAgents))
+
+    for t in rows:
+        columns = source.validColumns(t)
+        if len(columns) == 0:
+            continue #no data this hour, like the dateList of the original strategies
+        if len(uniforms) == 0:
+            uniforms = state.uniforms(blockSize, blockSize)
+        context = StepContext(source, t, columns, None, uniforms[0], None if daylight is None else daylight[t])
+        uniforms = uniforms[1:]
+
+        if state.columns is None:
+            rank = np.asarray(strategy.start(context))
+        else:
+            context.rank, snapped = _snap(columns, state.columns, source.depths)
+            counters['snaps'] += int(snapped.sum())
+            proposed = np.asarray(strategy.step(context), dtype=np.int64)
+            outside = (proposed < 0) | (proposed >= len(columns))
+            counters['clamps'] += int(outside.sum())
+            if strategy.boundary == 'stay':
+                rank = np.where(outside, context.rank, proposed)
+            else:
+                rank = np.minimum(np.maximum(proposed, 0), len(columns) - 1)
+
+        state.columns = columns[rank]
+        state.steps += 1
+        values = source.fitnessAt(t, state.columns)
+        state.totalFitness = state.totalFitness + values
+        depthIndex[len(simulated)] = state.columns
+        fitness[len(simulated)] = values
+        simulated.append(t)
+
+    #random numbers drawn but not used go back to the state, so a continued run sees them next
+    state.buffer = np.concatenate([uniforms.T, state.buffer], axis=1)
+    simulated = np.asarray(simulated, dtype=np.int64)
+    return StrategyResult(simulated, source.times[simulated], depthIndex[:len(simulated)].T,
+                          fitness[:len(simulated)].T, counters, state)
+
+## helper functions ##
+
+def _snap(columns, previous, depths):
+    """Rank of the column with data nearest in meters for every agent (the shallower one on a tie,
+    like the original min over allDepths), and which agents had to move to it."""
+    first, last = columns[0], columns[-1]
+    if last - first + 1 == len(columns):
+        #no gaps between the columns (any interpolated grid): the rank is an offset
+        rank = np.minimum(np.maximum(previous - first, 0), last - first)
+        return rank, (previous < first) | (previous > last)
+    position = np.minimum(np.maximum(np.searchsorted(columns, previous), 1), len(columns) - 1)
+    lower, upper = columns[position - 1], columns[position]
+    rank = np.where(np.abs(depths[previous] - depths[lower]) <= np.abs(depths[upper] - depths[previous]),
+                    position - 1, position)
+    return rank, columns[rank] != previous
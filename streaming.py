@@ -0,0 +1,265 @@
+import collections
+import numpy as np
+
+from climatology import ClimatologyAccumulator, MINUTES_PER_DAY
+from fitness import createFitnessGrid
+from gapFill import fillWindow
+from interpolation import depthAxis, interpolateGrid
+from lakeGrid import LakeGrid, INTERPOLATED, TIME_UNIT
+from metrics import Metrics, StageTimer
+from resample import layoutStep, nativeStep, resampleRecords, stepMinutes
+from strategyEngine import DenseSource, EngineState, runStrategy
+from temperatureLoader import TemperatureRecords, iterTemperatureChunks
+
+STAGES = ('survey', 'ingest', 'gapFill', 'interpolate', 'fitness', 'strategies')
+
+class LakeSurvey(object):
+    """What the streaming run needs to know about the whole record before the first chunk:
+    the climatology used to fill gaps, the sensor depths and which depths each year has.
+
+    Args:
+        accumulator: ClimatologyAccumulator over the whole record
+        yearDepths: dictionary year -> set of depths with data that year
+        rejected: dictionary reject reason -> number of lines
+        records: number of readings parsed
+        step: the time step of the run in minutes
+    """
+    def __init__(self, accumulator, yearDepths, rejected, records, step=60):
+        self.step = step
+        self.accumulator = accumulator
+        self.yearDepths = yearDepths
+        self.rejected = rejected
+        self.records = records
+
+    @property
+    def depths(self):
+        return self.accumulator.depths
+
+    def fillDepths(self, start, end):
+        """(D,) booleans, the depths seen during any year overlapping [start, end)."""
+        first = int(np.datetime64(start, 'Y').astype(np.int64)) + 1970
+        last = int((np.datetime64(end, 'm') - np.timedelta64(1, 'm')).astype('datetime64[Y]').astype(np.int64)) + 1970
+        seen = set()
+        for year in range(first, last + 1):
+            seen |= self.yearDepths.get(year, set())
+        return np.isin(self.depths, sorted(seen))
+
+def surveyFile(filename, layout='hourly', chunkSize=500000, timer=None, step=None, resampling='mean'):
+    """First, streaming pass over a temperature file: accumulates the climatology at the run's
+    time step and the depths of every year without holding the record in memory.
+
+    Args:
+        filename: the LTER temperature file
+        layout: 'hourly', 'daily' or 'hires'
+        chunkSize: number of lines parsed at a time
+        timer: optional StageTimer or Metrics, a Metrics also counts the rejected lines
+        step: time step in minutes (or a timedelta), by default the native data_freq of the first
+            chunk of a hires file, one day for daily files and one hour otherwise
+        resampling: 'mean' or 'interpolate', see resample.resampleRecords
+
+    Returns:
+        LakeSurvey
+    """
+    timer = StageTimer(STAGES) if timer is None else timer
+    accumulator = None
+    yearDepths = collections.defaultdict(set)
+    rejected = collections.Counter()
+    records = 0
+    for chunk in iterTemperatureChunks(filename, layout, chunkSize):
+        with timer.timed('survey', len(chunk), len(chunk)):
+            if accumulator is None:
+                step = nativeStep(chunk, layout) if step is None else stepMinutes(step)
+                accumulator = ClimatologyAccumulator(stepsPerDay=MINUTES_PER_DAY // step)
+            grid = resampleRecords(chunk, step, resampling)
+            accumulator.addGrid(grid)
+            years = grid.times.astype('datetime64[Y]').astype(np.int64) + 1970
+            for year in np.unique(years).tolist():
+                seen = ~np.isnan(grid.temps[years == year]).all(axis=0)
+                yearDepths[year].update(grid.depths[seen].tolist())
+            rejected.update(chunk.rejectSummary())
+            if isinstance(timer, Metrics):
+                timer.update(chunk.rejectSummary(), 'rejected.')
+            records += len(chunk)
+    if accumulator is None:
+        step = layoutStep(layout) if step is None else stepMinutes(step)
+        accumulator = ClimatologyAccumulator(stepsPerDay=MINUTES_PER_DAY // step)
+    return LakeSurvey(accumulator, dict(yearDepths), dict(rejected), records, step)
+
+class StreamChunk(object):
+    """One time chunk on its way through the streaming pipeline.
+
+    Args:
+        start: the first minute of the chunk
+        end: the minute after the chunk
+        grid: the chunk's LakeGrid (measured, then filled, then interpolated)
+    """
+    def __init__(self, start, end, grid):
+        self.start = start
+        self.end = end
+        self.grid = grid
+        self.gaps = None
+        self.fitness = None
+        self.results = {}
+
+class StreamingPipeline(object):
+    """ingest -> gap-fill -> interpolate -> fitness -> strategies as a chain of generators over
+    time chunks (a month by default), the streaming counterpart of processLakeYear + main().
+
+    Only one file chunk and one time chunk are held at a time, so peak memory is set by the chunk
+    sizes and not by the length of the record; multi-decade and hires records can be run end to
+    end. Strategy state (depths, random streams, accumulated fitness) is carried across chunk
+    boundaries, so agents move through the whole record as one simulation. Every stage runs on the
+    survey's time step, so a hires record is simulated at its native sensor cadence.
+
+    The file must be sorted by date, like the LTER files. Readings older than a chunk already
+    emitted are dropped and counted in outOfOrder.
+
+    Args:
+        filename: the LTER temperature file
+        strategies: dictionary name -> Strategy kernel (see strategyEngine.makeStrategy)
+        layout: 'hourly', 'daily' or 'hires'
+        chunk: numpy datetime unit of a time chunk, eg. 'M' (month), 'W' or 'Y'
+        resolution: depth resolution of the interpolated grid in meters
+        method: the interpolation method, see interpolation.METHODS
+        model: the name of a registered growth model
+        params: optional parameter overrides for the growth model
+        nAgents: number of agents per strategy
+        seed: seed for the per-agent random streams
+        solarTable: optional SolarTable, needed by circadian strategies
+        survey: optional LakeSurvey from an earlier surveyFile call, skips the first pass
+        chunkSize: number of lines parsed at a time
+        step: time step in minutes (or a timedelta), see surveyFile. Ignored when survey is given.
+        resampling: 'mean' or 'interpolate', see resample.resampleRecords
+        metrics: optional Metrics to record stage timings and counters into
+    """
+    def __init__(self, filename, strategies=None, layout='hourly', chunk='M', resolution=0.1, method='linear',
+                 model='synechococcus', params=None, nAgents=1, seed=None, solarTable=None, survey=None,
+                 chunkSize=500000, step=None, resampling='mean', metrics=None):
+        self.filename = filename
+        self.strategies = {} if strategies is None else strategies
+        self.layout = layout
+        self.unit = 'datetime64[%s]' % chunk
+        self.resolution = resolution
+        self.method = method
+        self.model = model
+        self.params = params
+        self.solarTable = solarTable
+        self.chunkSize = chunkSize
+        self.step = step
+        self.resampling = resampling
+        self.timer = Metrics(STAGES) if metrics is None else metrics
+        self.survey = survey
+        self.states = dict((name, EngineState.fresh(nAgents, seed)) for name in self.strategies)
+        self.gaps = collections.Counter()
+        self.chunks = 0
+        self.outOfOrder = 0
+
+    def run(self):
+        """Yields every StreamChunk once it has been through all the stages."""
+        if self.survey is None:
+            self.survey = surveyFile(self.filename, self.layout, self.chunkSize, self.timer, self.step, self.resampling)
+        self._climatology = self.survey.accumulator.mean(self.survey.depths)
+        self._targetDepths = depthAxis(self.survey.depths, self.resolution)
+        self._qualityLabels = ('',)
+        chunks = self._ingest()
+        chunks = self._gapFill(chunks)
+        chunks = self._interpolate(chunks)
+        chunks = self._fitness(chunks)
+        return self._strategies(chunks)
+
+    def totalFitness(self):
+        """Dictionary strategy -> (N,) fitness of every agent accumulated so far."""
+        return dict((name, state.totalFitness) for name, state in self.states.items())
+
+    def report(self):
+        """Per-stage throughput, counters and totals of the run."""
+        return {'stages': self.timer.report(), 'counters': dict(self.timer.counters), 'chunks': self.chunks,
+                'gaps': dict(self.gaps),
+                'outOfOrder': self.outOfOrder,
+                'rejected': {} if self.survey is None else self.survey.rejected}
+
+    ## stages ##
+
+    def _ingest(self):
+        pending = None
+        emitted = None #key of the last chunk emitted
+        for records in iterTemperatureChunks(self.filename, self.layout, self.chunkSize):
+            with self.timer.timed('ingest', len(records), len(records)):
+                keys = records.times.astype(self.unit)
+                if emitted is not None:
+                    late = keys <= emitted
+                    self.outOfOrder += int(late.sum())
+                    self.timer.count('outOfOrder', late.sum())
+                    records, keys = records.take(~late), keys[~late]
+                if len(records) == 0:
+                    continue
+                if pending is not None:
+                    records = TemperatureRecords.concatenate([pending, records])
+                    keys = records.times.astype(self.unit)
+                #every chunk before the newest one seen is complete since the file is sorted
+                complete = keys < keys.max()
+                ready, emitted = self._split(records.take(complete), keys[complete], emitted)
+                pending = records.take(~complete)
+            for chunk in ready:
+                yield chunk
+        if pending is not None and len(pending):
+            with self.timer.timed('ingest'):
+                ready, emitted = self._split(pending, pending.times.astype(self.unit), emitted)
+            for chunk in ready:
+                yield chunk
+
+    def _gapFill(self, chunks):
+        for chunk in chunks:
+            with self.timer.timed('gapFill', len(chunk.grid.times), chunk.grid.temps.size):
+                chunk.grid, chunk.gaps = fillWindow(chunk.grid, self._climatology, chunk.start, chunk.end,
+                                                    self.survey.fillDepths(chunk.start, chunk.end))
+                self.gaps.update(chunk.gaps)
+                self.timer.update(chunk.gaps, 'gapFill.')
+            yield chunk
+
+    def _interpolate(self, chunks):
+        for chunk in chunks:
+            with self.timer.timed('interpolate', len(chunk.grid.times), len(chunk.grid.times) * len(self._targetDepths)):
+                chunk.grid = interpolateGrid(chunk.grid, method=self.method, depths=self._targetDepths)
+                self.timer.count('interpolate.interpolatedCells', (chunk.grid.flags == INTERPOLATED).sum())
+            yield chunk
+
+    def _fitness(self, chunks):
+        for chunk in chunks:
+            with self.timer.timed('fitness', len(chunk.grid.times), chunk.grid.temps.size):
+                chunk.fitness = createFitnessGrid(chunk.grid, self.model, self.params)
+            yield chunk
+
+    def _strategies(self, chunks):
+        for chunk in chunks:
+            agents = sum(len(state.streams) for state in self.states.values())
+            with self.timer.timed('strategies', len(chunk.grid.times), len(chunk.grid.times) * agents):
+                source = DenseSource(chunk.grid, chunk.fitness)
+                daylight = None if self.solarTable is None else self.solarTable.isDaylight(chunk.grid.times)
+                for name, strategy in self.strategies.items():
+                    chunk.results[name] = runStrategy(source, strategy, daylight=daylight, state=self.states[name])
+                    self.timer.update(chunk.results[name].counters, 'strategy.%s.' % name)
+            self.chunks += 1
+            yield chunk
+
+    ## helper functions ##
+
+    def _split(self, records, keys, emitted):
+        """Builds the StreamChunks of a block of complete records, including empty chunks for
+        stretches of the record without readings, so that they are gap filled too.
+        """
+        ready = []
+        for key in np.unique(keys):
+            first = key if emitted is None else emitted + 1
+            for missing in np.arange(first, key):
+                ready.append(self._chunk(missing, LakeGrid.empty(self.survey.depths)))
+            part = records.take(keys == key)
+            grid = resampleRecords(part, self.survey.step, self.resampling, qualityLabels=self._qualityLabels)
+            self._qualityLabels = grid.qualityLabels #codes stay the same from one chunk to the next
+            ready.append(self._chunk(key, grid.onDepths(self.survey.depths)))
+            emitted = key
+        return ready, emitted
+
+    def _chunk(self, key, grid):
+        start = key.astype(TIME_UNIT)
+        return StreamChunk(start, (key + 1).astype(TIME_UNIT), grid)
@@ -0,0 +1,201 @@
+import itertools
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+from ensemble import runEnsemble
+from lakeGrid import LakeGrid
+from lakeStore import LakeStore
+from oracle import constrainedOracle, unconstrainedOracle
+from strategyEngine import CIRCADIAN_DISTANCE
+
+SWEEP_STRATEGIES = ('randomWalk', 'randomWalkDirectional', 'hillClimbing', 'circadian', 'oracle', 'constrainedOracle')
+
+_LAKES = {} #year -> (lakeGrid, fitness, daylight) inside a worker, attached to shared memory or a LakeStore
+_BLOCKS = [] #the attached SharedMemory objects, kept alive for the life of the worker
+
+def expandSweep(grid):
+    """Expands a declarative sweep into a list of runs, one per combination of values.
+
+    Values that are dictionaries are merged into the run, which lets one axis carry several
+    settings, eg. {'strategy': [{'strategy': 'circadian', 'speed': 'slow'}, {'strategy': 'oracle'}]}.
+
+    Args:
+        grid: dictionary of setting -> list of values
+    Returns:
+        list of run dictionaries
+    """
+    names = sorted(grid)
+    runs = []
+    for values in itertools.product(*[grid[name] for name in names]):
+        run = {}
+        for name, value in zip(names, values):
+            if isinstance(value, dict):
+                run.update(value)
+            else:
+                run[name] = value
+        runs.append(run)
+    return runs
+
+def runSweep(lakes, runs, workers=None, retries=2, nAgents=1, keepTrajectories=False):
+    """Fans a list of runs out over a process pool and yields results as they finish.
+
+    The temperature, fitness and daylight arrays of every year are copied into shared memory once
+    and attached by every worker, instead of being pickled with each task. A run that raises is
+    resubmitted up to retries times, and if a worker process dies the pool is rebuilt and the
+    runs that were in flight are resubmitted, without restarting the sweep.
+
+    When lakes is a LakeStore nothing is copied: every worker opens the store and maps a year the
+    first time one of its runs needs it, so the workers share the pages through the OS page cache.
+
+    Args:
+        lakes: dictionary year -> (lakeGrid, fitness, daylight), daylight may be None, or a LakeStore
+        runs: list of run dictionaries (see expandSweep) with at least 'year' and 'strategy', and
+            optionally 'seed', 'speed', 'probabilityFactor', 'maxStep' and 'nAgents'
+        workers: number of processes, defaults to the number of cores
+        retries: how many times a failing run is retried
+        nAgents: default number of agents per run
+        keepTrajectories: also return the (N, T) depth and fitness arrays
+
+    Yields:
+        result dictionaries with the run, totalFitness (one per agent), meanDepth and, for runs
+        that failed every attempt, the error
+    """
+    if isinstance(lakes, LakeStore):
+        blocks, initializer, initargs = [], _attachStore, (lakes.directory,)
+    else:
+        blocks, descriptors = _share(lakes)
+        initializer, initargs = _attach, (descriptors,)
+    pool = None
+    try:
+        pool = ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+        attempts = {}
+        pending = {}
+        for number, run in enumerate(runs):
+            attempts[number] = 0
+            pending[pool.submit(_runTask, run, nAgents, keepTrajectories)] = number
+
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            resubmit, broken = [], False
+            for future in done:
+                number = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    broken = True
+                    error = 'worker process died'
+                except Exception:
+                    error = traceback.format_exc()
+                else:
+                    yield result
+                    continue
+                attempts[number] += 1
+                if attempts[number] > retries:
+                    yield {'run': runs[number], 'error': error, 'attempts': attempts[number]}
+                else:
+                    resubmit.append(number)
+
+            if broken:
+                #a dead worker breaks the whole pool: rebuild it and resubmit everything that was in flight
+                resubmit += list(pending.values())
+                pending = {}
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+            for number in resubmit:
+                pending[pool.submit(_runTask, runs[number], nAgents, keepTrajectories)] = number
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+def runTask(lakeGrid, fitness, daylight, run, nAgents=1, keepTrajectories=False):
+    """Runs one sweep entry on one lake year (also usable without a pool).
+
+    Args:
+        lakeGrid: interpolated LakeGrid
+        fitness: (T, D) fitness aligned with lakeGrid
+        daylight: (T,) booleans aligned with lakeGrid, or None
+        run: the run dictionary
+        nAgents: default number of agents
+
+    Returns:
+        result dictionary
+    """
+    strategy = run['strategy']
+    if strategy not in SWEEP_STRATEGIES:
+        raise ValueError('unknown strategy %r, choose from %s' % (strategy, SWEEP_STRATEGIES))
+    if strategy in ('oracle', 'constrainedOracle'):
+        if strategy == 'oracle':
+            result = unconstrainedOracle(fitness)
+        else:
+            result = constrainedOracle(fitness, run.get('maxStep', CIRCADIAN_DISTANCE[run.get('speed', 'slow')]))
+        depthIndex, agentFitness = result.depthIndex[None, :], result.fitness[None, :]
+    else:
+        result = runEnsemble(lakeGrid, fitness, strategy, run.get('nAgents', nAgents), run.get('seed'),
+                             run.get('probabilityFactor', 0.5), daylight, run.get('speed', 'slow'))
+        depthIndex, agentFitness = result.depthIndex, result.fitness
+
+    output = {'run': run,
+              'totalFitness': np.nansum(agentFitness, axis=1, dtype=np.float64),
+              'meanDepth': lakeGrid.depths[depthIndex].mean(axis=1)}
+    if keepTrajectories:
+        output['depths'] = lakeGrid.depths[depthIndex].astype(np.float32)
+        output['fitness'] = agentFitness
+    return output
+
+## helper functions ##
+
+def _share(lakes):
+    """Copies the large arrays of every lake year into shared memory.
+
+    Returns:
+        blocks: the SharedMemory objects (owned by the caller, who must unlink them)
+        descriptors: picklable description of every year used by _attach
+    """
+    blocks, descriptors = [], {}
+    try:
+        for year, (lakeGrid, fitness, daylight) in lakes.items():
+            arrays = {'temps': lakeGrid.temps, 'flags': lakeGrid.flags, 'fitness': np.asarray(fitness, dtype=np.float32)}
+            if daylight is not None:
+                arrays['daylight'] = np.asarray(daylight, dtype=bool)
+            shared = {}
+            for name, array in arrays.items():
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+                shared[name] = (block.name, array.shape, array.dtype.str)
+            descriptors[year] = {'times': lakeGrid.times, 'depths': lakeGrid.depths, 'shared': shared}
+    except Exception:
+        for block in blocks:
+            block.close()
+            block.unlink()
+        raise
+    return blocks, descriptors
+
+def _attach(descriptors):
+    """Pool initializer: maps the shared arrays into this worker without copying them."""
+    for year, descriptor in descriptors.items():
+        arrays = {}
+        for name, (blockName, shape, dtype) in descriptor['shared'].items():
+            try:
+                block = shared_memory.SharedMemory(name=blockName, track=False)
+            except TypeError: #python < 3.13 has no track argument
+                block = shared_memory.SharedMemory(name=blockName)
+            _BLOCKS.append(block)
+            arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        lakeGrid = LakeGrid(descriptor['times'], descriptor['depths'], arrays['temps'], arrays['flags'])
+        _LAKES[year] = (lakeGrid, arrays['fitness'], arrays.get('daylight'))
+
+def _attachStore(directory):
+    """Pool initializer: opens the store, its years are mapped lazily by _runTask."""
+    global _LAKES
+    _LAKES = LakeStore(directory)
+
+def _runTask(run, nAgents, keepTrajectories):
+    lakeGrid, fitness, daylight = _LAKES[run['year']]
+    return runTask(lakeGrid, fitness, daylight, run, nAgents, keepTrajectories)
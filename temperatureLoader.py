@@ -0,0 +1,298 @@
+import itertools
+import numpy as np
+
+from lakeGrid import LakeGrid, TIME_UNIT
+
+## file layouts ##
+#column positions of the three LTER temperature layouts, see createDataMatrix
+
+LAYOUTS = {
+    #sampledate,year4,month,daynum,hour,depth,wtemp,flag_wtemp
+    'hourly': {'columns': 8, 'date': 0, 'hour': 4, 'depth': 5, 'temp': 6, 'flag': 7},
+    #sampledate,year4,month,daynum,depth,wtemp,flag_wtemp
+    'daily': {'columns': 7, 'date': 0, 'depth': 4, 'temp': 5, 'flag': 6},
+    #sampledate,year4,month,daynum,sample_time,data_freq,depth,wtemp,flag_wtemp
+    'hires': {'columns': 9, 'date': 0, 'time': 4, 'freq': 5, 'depth': 6, 'temp': 7, 'flag': 8},
+}
+
+## reject reasons ##
+BAD_COLUMNS = 1
+BAD_DATE = 2
+BAD_TIME = 3
+BAD_DEPTH = 4
+BAD_TEMP = 5
+BAD_FREQ = 6
+BAD_FLAG = 7
+
+REJECT_REASONS = {BAD_COLUMNS: 'wrong number of columns', BAD_DATE: 'unparseable sampledate',
+                  BAD_TIME: 'unparseable hour/sample_time', BAD_DEPTH: 'unparseable depth',
+                  BAD_TEMP: 'unparseable wtemp', BAD_FREQ: 'unparseable data_freq',
+                  BAD_FLAG: 'flag too long'}
+
+## byte parsing ##
+COMMA, NEWLINE, RETURN, SPACE, QUOTE = ord(','), ord('\n'), ord('\r'), ord(' '), ord('"')
+DATE_WIDTH = 10 #only the YYYY-MM-DD part of sampledate is used, the hour comes from its own column
+NUMBER_WIDTH = 16
+FLAG_WIDTH = 8 #longer flags are rejected rather than cut
+
+class TemperatureRecords(object):
+    """Typed columns parsed from an LTER temperature file.
+
+    Args:
+        times: datetime64 observation times
+        depths: float64 depths
+        temps: float32 temperatures
+        flags: flag_wtemp strings
+        dataFreq: float32 data_freq (minutes) for hires files, None otherwise
+        rejectLines: line numbers (1 is the header) of the rows that could not be parsed
+        rejectReasons: one of the REJECT_REASONS codes for each rejected line
+    """
+    def __init__(self, times, depths, temps, flags, dataFreq=None, rejectLines=None, rejectReasons=None):
+        self.times = times
+        self.depths = depths
+        self.temps = temps
+        self.flags = flags
+        self.dataFreq = dataFreq
+        self.rejectLines = np.zeros(0, dtype=np.int64) if rejectLines is None else rejectLines
+        self.rejectReasons = np.zeros(0, dtype=np.uint8) if rejectReasons is None else rejectReasons
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def concatenate(cls, chunks):
+        """Joins the chunks yielded by iterTemperatureChunks."""
+        chunks = list(chunks)
+        if len(chunks) == 0:
+            return _emptyRecords(None)
+        dataFreq = None
+        if chunks[0].dataFreq is not None:
+            dataFreq = np.concatenate([c.dataFreq for c in chunks])
+        return cls(np.concatenate([c.times for c in chunks]), np.concatenate([c.depths for c in chunks]),
+                   np.concatenate([c.temps for c in chunks]), np.concatenate([c.flags for c in chunks]), dataFreq,
+                   np.concatenate([c.rejectLines for c in chunks]), np.concatenate([c.rejectReasons for c in chunks]))
+
+    def take(self, index):
+        """Returns the records selected by an index or boolean mask (the rejects are not carried over)."""
+        dataFreq = None if self.dataFreq is None else self.dataFreq[index]
+        return TemperatureRecords(self.times[index], self.depths[index], self.temps[index], self.flags[index], dataFreq)
+
+    def rejectSummary(self):
+        """Returns a dictionary of reject reason -> number of rejected lines."""
+        codes, counts = np.unique(self.rejectReasons, return_counts=True)
+        return dict((REJECT_REASONS[int(code)], int(count)) for code, count in zip(codes, counts))
+
+    def toGrid(self):
+        """Returns the records as a LakeGrid (first reading wins on duplicates, like createDictionary)."""
+        return LakeGrid.fromArrays(self.times, self.depths, self.temps, self.flags)
+
+def loadTemperatureFile(filename, layout='hourly', chunkSize=500000):
+    """Columnar replacement for createDataMatrix. Parses an LTER temperature file into typed arrays.
+
+    Args:
+        filename: the text file
+        layout: 'hourly', 'daily' or 'hires'
+        chunkSize: number of lines parsed at a time
+
+    Returns:
+        TemperatureRecords
+    """
+    return TemperatureRecords.concatenate(iterTemperatureChunks(filename, layout, chunkSize))
+
+def iterTemperatureChunks(filename, layout='hourly', chunkSize=500000):
+    """Streams an LTER temperature file as TemperatureRecords of at most chunkSize lines,
+    so multi-GB hires files can be processed in bounded memory.
+
+    Args:
+        filename: the text file
+        layout: 'hourly', 'daily' or 'hires'
+        chunkSize: number of lines parsed at a time
+
+    Yields:
+        TemperatureRecords for each chunk
+    """
+    if layout not in LAYOUTS:
+        raise ValueError('unknown layout %r, choose from %s' % (layout, sorted(LAYOUTS)))
+    with open(filename, 'rb') as ins:
+        next(ins, None) #header
+        firstLine = 2
+        while True:
+            lines = list(itertools.islice(ins, chunkSize))
+            if len(lines) == 0:
+                break
+            yield parseLines(lines, layout, firstLine)
+            firstLine += len(lines)
+
+def parseLines(lines, layout, firstLine=1):
+    """Parses a block of lines of one LTER layout straight from bytes. Field boundaries, dates,
+    times and numbers are all decoded with array operations, and rows that cannot be parsed are
+    reported through the reject arrays instead of raising.
+
+    Args:
+        lines: list of text lines (bytes or str)
+        layout: 'hourly', 'daily' or 'hires'
+        firstLine: the line number of lines[0], used in the reject report
+
+    Returns:
+        TemperatureRecords
+    """
+    spec = LAYOUTS[layout]
+    nColumns = spec['columns']
+    if len(lines) and not isinstance(lines[0], bytes):
+        lines = [line.encode('utf-8') for line in lines]
+    text = b''.join(lines)
+    if not text.endswith(b'\n'):
+        text += b'\n'
+    buf = np.frombuffer(text, dtype=np.uint8)
+
+    newlines = np.flatnonzero(buf == NEWLINE)
+    delimiters = np.flatnonzero((buf == COMMA) | (buf == NEWLINE))
+    lineStarts = np.concatenate([[0], newlines[:-1] + 1])
+    delimiterEnd = np.searchsorted(delimiters, newlines) + 1 #one past each line's newline in delimiters
+    delimiterCount = np.diff(np.concatenate([[0], delimiterEnd]))
+    lineNumbers = firstLine + np.arange(len(newlines))
+    reasons = np.zeros(len(newlines), dtype=np.uint8)
+
+    goodShape = delimiterCount == nColumns
+    reasons[~goodShape] = BAD_COLUMNS
+    kept = np.flatnonzero(goodShape)
+    ends = delimiters[(delimiterEnd[kept] - nColumns)[:, None] + np.arange(nColumns)]
+    starts = np.concatenate([lineStarts[kept][:, None], ends[:, :-1] + 1], axis=1)
+    starts += (buf[np.minimum(starts, len(buf) - 1)] == QUOTE) & (starts < ends) #skip opening quotes
+
+    def field(name, width, truncate=False):
+        return _gather(buf, starts[:, spec[name]], ends[:, spec[name]], width, truncate)
+
+    days, okDate = _parseDates(field('date', DATE_WIDTH, truncate=True))
+    minutes = np.zeros(len(kept), dtype=np.int64)
+    okTime = np.ones(len(kept), dtype=bool)
+    if 'hour' in spec:
+        value, okTime = _parseNumbers(field('hour', NUMBER_WIDTH))
+        hour = np.where(okTime, value, 0).astype(np.int64) // 100 #corrects for military time eg. 0100 -> 1
+        okTime &= (hour >= 0) & (hour < 24)
+        minutes = hour * 60
+    elif 'time' in spec:
+        value, okTime = _parseNumbers(field('time', NUMBER_WIDTH))
+        hour, minute = np.divmod(np.where(okTime, value, 0).astype(np.int64), 100)
+        okTime &= (hour >= 0) & (hour < 24) & (minute >= 0) & (minute < 60)
+        minutes = hour * 60 + minute
+    depths, okDepth = _parseNumbers(field('depth', NUMBER_WIDTH))
+    temps, okTemp = _parseNumbers(field('temp', NUMBER_WIDTH))
+    okFreq = np.ones(len(kept), dtype=bool)
+    if 'freq' in spec:
+        dataFreq, okFreq = _parseNumbers(field('freq', NUMBER_WIDTH))
+
+    #room for a closing quote and carriage return, which are stripped before the length is checked
+    flagChars = field('flag', FLAG_WIDTH + 2)
+    flags = _parseStrings(flagChars)
+    okFlag = (flagChars != 0).any(axis=1) & (np.char.str_len(flags) <= FLAG_WIDTH)
+
+    #the first failing check decides the reason, in column order
+    for ok, reason in ((okFlag, BAD_FLAG), (okFreq, BAD_FREQ), (okTemp, BAD_TEMP), (okDepth, BAD_DEPTH),
+                       (okTime, BAD_TIME), (okDate, BAD_DATE)):
+        reasons[kept[~ok]] = reason
+    good = okDate & okTime & okDepth & okTemp & okFreq & okFlag
+
+    times = days[good].astype(TIME_UNIT) + minutes[good].astype('timedelta64[m]')
+    records = TemperatureRecords(times, depths[good], temps[good].astype(np.float32), flags[good],
+                                 dataFreq[good].astype(np.float32) if 'freq' in spec else None)
+    rejected = np.flatnonzero(reasons)
+    records.rejectLines = lineNumbers[rejected]
+    records.rejectReasons = reasons[rejected]
+    return records
+
+## helper functions ##
+
+def _gather(buf, starts, ends, width, truncate=False):
+    """Copies each field buf[start:end] into a row of a (n, width) byte matrix padded with spaces.
+    The matrix is only as wide as the longest field. Fields longer than width come out invalid,
+    unless truncate is set, in which case only their first width bytes are kept.
+    """
+    lengths = ends - starts
+    if not truncate:
+        width = int(min(width, max(lengths.max(), 1))) if len(lengths) else 1 #empty flag columns still get one byte
+    out = np.empty((len(starts), width), dtype=np.uint8)
+    last = len(buf) - 1
+    for j in range(width):
+        index = starts + j
+        out[:, j] = np.where(index < ends, buf[np.minimum(index, last)], SPACE)
+    if not truncate:
+        out[lengths > width] = 0 #too long, never valid
+    return out
+
+def _parseNumbers(chars):
+    """Decodes plain decimal numbers ([+-]digits[.digits]) from a padded byte matrix, one byte
+    column at a time. Spaces, quotes and carriage returns around the number are ignored.
+
+    Args:
+        chars: (n, width) uint8 matrix from _gather
+    Returns:
+        values: float64 array, NaN where invalid
+        valid: boolean array
+    """
+    n = len(chars)
+    mantissa = np.zeros(n)
+    decimals = np.zeros(n, dtype=np.int64)
+    valid = np.ones(n, dtype=bool)
+    negative, started, ended, seenDot, seenDigit = [np.zeros(n, dtype=bool) for _ in range(5)]
+    for j in range(chars.shape[1]):
+        c = chars[:, j]
+        pad = (c == SPACE) | (c == QUOTE) | (c == RETURN)
+        digit = (c >= ord('0')) & (c <= ord('9'))
+        dot = c == ord('.')
+        sign = (c == ord('-')) | (c == ord('+'))
+        valid &= pad | digit | dot | sign
+        valid &= ~(ended & ~pad) #no gaps inside the number
+        valid &= ~(sign & started) #sign only in front
+        valid &= ~(dot & seenDot)
+        ended |= pad & started
+        started |= ~pad
+        negative |= c == ord('-')
+        mantissa = np.where(digit, mantissa * 10 + (c.astype(np.int64) - ord('0')), mantissa)
+        decimals += digit & seenDot
+        seenDot |= dot
+        seenDigit |= digit
+    valid &= seenDigit
+    values = mantissa / 10.0 ** decimals
+    values = np.where(negative, -values, values)
+    return np.where(valid, values, np.nan), valid
+
+def _parseDates(chars):
+    """Decodes the leading YYYY-MM-DD of each field into datetime64[D] using byte arithmetic.
+
+    Args:
+        chars: (n, width) uint8 matrix from _gather
+    Returns:
+        days: datetime64[D] array
+        valid: boolean array
+    """
+    raw = chars[:, :10].astype(np.int64)
+    digits = raw - ord('0')
+    digitColumns = [0, 1, 2, 3, 5, 6, 8, 9]
+    valid = ((digits[:, digitColumns] >= 0) & (digits[:, digitColumns] <= 9)).all(axis=1)
+    valid &= (raw[:, 4] == ord('-')) & (raw[:, 7] == ord('-'))
+
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 5] * 10 + digits[:, 6]
+    day = digits[:, 8] * 10 + digits[:, 9]
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+
+    month = np.where(valid, month, 1)
+    day = np.where(valid, day, 1)
+    monthStart = ((np.where(valid, year, 1970) - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = monthStart.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    valid &= days.astype('datetime64[M]') == monthStart #rejects dates like 02-30
+    return days, valid
+
+def _parseStrings(chars):
+    """Decodes short text fields (the LTER flags). Only the distinct values are decoded."""
+    if len(chars) == 0:
+        return np.zeros(0, dtype=str)
+    fixed = np.ascontiguousarray(chars).view('S%d' % chars.shape[1]).reshape(-1)
+    values, inverse = np.unique(fixed, return_inverse=True)
+    cleaned = np.array([value.decode('utf-8', 'replace').strip(' "\r') for value in values.tolist()])
+    return cleaned[inverse.reshape(-1)]
+
+def _emptyRecords(layout):
+    return TemperatureRecords(np.zeros(0, dtype=TIME_UNIT), np.zeros(0), np.zeros(0, dtype=np.float32),
+                              np.zeros(0, dtype=str), np.zeros(0, dtype=np.float32) if layout == 'hires' else None)
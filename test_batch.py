@@ -0,0 +1,65 @@
+import json
+import numpy as np
+import pytest
+
+from batch import BatchStore, STAGES, checkLake, processLake, readManifest, runBatch
+from metrics import Metrics
+from pipeline import processLakeYear
+from solar import WAUSAU
+from sweep import runTask
+from temperatureLoader import loadTemperatureFile
+
+STRATEGIES = ('oracle', 'circadian')
+
+def _lake(name, filename, years=None):
+    return checkLake({'name': name, 'file': filename, 'latitude': WAUSAU[0], 'longitude': WAUSAU[1],
+                      'utcOffset': WAUSAU[2], 'years': years})
+
+def test_processLakeMatchesPipeline(lakeFile, lakeYears, solarTable, tmp_path):
+    records = loadTemperatureFile(lakeFile)
+    metrics = Metrics(STAGES)
+    entry = processLake(_lake('sparkling', lakeFile), {'file': lakeFile}, records, str(tmp_path / 'sparkling'),
+                        {'resolution': 0.5}, STRATEGIES, nAgents=2, seed=5, metrics=metrics)
+    assert entry['years'] == lakeYears
+    results = iter(entry['results'])
+    for year in lakeYears:
+        grid, fitness, _ = processLakeYear(lakeFile, year, resolution=0.5)
+        for strategy in STRATEGIES:
+            expected = runTask(grid, fitness, solarTable.isDaylight(grid.times),
+                               {'year': year, 'strategy': strategy, 'seed': 5}, 2)
+            result = next(results)
+            assert (result['year'], result['strategy']) == (year, strategy)
+            np.testing.assert_allclose(result['totalFitness'], expected['totalFitness'], rtol=1e-5)
+            np.testing.assert_allclose(result['meanDepth'], expected['meanDepth'])
+
+    report = metrics.report()
+    for stage in ('climatology', 'gapFill', 'interpolate', 'fitness', 'strategies'):
+        assert report[stage]['rows'] > 0 and report[stage]['cells'] > 0
+    assert report['fitness']['calls'] == len(lakeYears)
+
+def test_runBatch(lakeFile, lakeYears, tmp_path):
+    broken = str(tmp_path / 'missing.txt')
+    manifest = str(tmp_path / 'lakes.json')
+    with open(manifest, 'w') as f:
+        json.dump({'lakes': [dict(_lake('sparkling', lakeFile, [lakeYears[0]])),
+                             dict(_lake('broken', broken), file='missing.txt')]}, f)
+    lakes = readManifest(manifest)
+    assert lakes[1]['file'] == broken and lakes[0]['layout'] == 'hourly'
+
+    metrics = Metrics(STAGES)
+    entries = dict((entry['name'], entry) for entry in runBatch(lakes, str(tmp_path / 'batch'), STRATEGIES, seed=1,
+                                                                  workers=1, resolution=0.5, metrics=metrics))
+    assert 'error' in entries['broken'] and entries['sparkling']['years'] == [lakeYears[0]]
+    batch = BatchStore(str(tmp_path / 'batch'))
+    assert batch.lakes == ['broken', 'sparkling']
+    assert [result['strategy'] for result in batch.results('sparkling')] == list(STRATEGIES)
+    assert batch.store('sparkling').years == [lakeYears[0]]
+    assert metrics.report()['fitness']['cells'] == np.prod(batch.store('sparkling').meta(lakeYears[0])['shape'])
+
+def test_rejectsBadManifests(lakeFile):
+    with pytest.raises(ValueError, match='missing'):
+        checkLake({'name': 'sparkling', 'file': lakeFile})
+    with pytest.raises(ValueError, match='unknown layout'):
+        checkLake(dict(_lake('sparkling', lakeFile), layout='weekly'))
+    with pytest.raises(ValueError, match='must be unique'):
+        list(runBatch([_lake('sparkling', lakeFile)] * 2, 'unused'))
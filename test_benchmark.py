@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from benchmark import STAGES, STRATEGIES, benchmarkLake, compareReports, scalingExponents, syntheticLake
+from temperatureLoader import loadTemperatureFile
+
+def test_syntheticFileReadsLikeTheOriginal(legacy, monthFile):
+    _, formatData = legacy
+    dataMatrix = formatData.createDataMatrix(monthFile, 'hourly')
+    records = loadTemperatureFile(monthFile)
+    assert len(dataMatrix) == len(records) and len(records.rejectLines) == 0
+    assert [row[0] for row in dataMatrix] == records.times.astype(object).tolist()
+    np.testing.assert_allclose([row[1] for row in dataMatrix], records.depths)
+    np.testing.assert_allclose([row[2] for row in dataMatrix], records.temps, rtol=1e-6)
+
+def test_syntheticLake():
+    lake = syntheticLake(years=1, nDepths=6, gapRate=0.1, seed=4)
+    again = syntheticLake(years=1, nDepths=6, gapRate=0.1, seed=4)
+    assert np.array_equal(lake.temps, again.temps) and np.array_equal(lake.times, again.times)
+    assert 1 - len(lake) / (8760.0 * 6) == pytest.approx(0.1, abs=0.02)
+    assert np.unique(lake.depths).tolist() == np.round(np.linspace(0, 18, 6), 2).tolist()
+    july = lake.times.astype('datetime64[M]') == np.datetime64('2005-07')
+    surface, bottom = lake.temps[july & (lake.depths == 0)], lake.temps[july & (lake.depths == 18)]
+    assert surface.mean() > bottom.mean() + 10 #stratified in summer
+
+def test_benchmarkLake(legacy):
+    point = benchmarkLake(years=1, nDepths=4, resolution=1.0, legacy=True)
+    assert set(point['array']) == set(STAGES + STRATEGIES)
+    assert all(stage['seconds'] > 0 and stage['cells'] > 0 for stage in point['array'].values())
+    assert point['array']['createDataMatrix']['cells'] == point['readings']
+    #every original stage is either timed or says why it could not run under this interpreter
+    for stage in STAGES + STRATEGIES:
+        timing = point['legacy'][stage]
+        assert 'skipped' in timing or timing['seconds'] > 0
+    assert point['legacy']['createDataMatrix']['cells'] == point['readings']
+
+def test_scalingExponents():
+    points = [{'array': {'linear': {'cells': n, 'seconds': 2e-6 * n}, 'square': {'cells': n, 'seconds': 1e-9 * n * n},
+                         'skipped': {'skipped': 'reason'}}} for n in (1000, 4000, 16000)]
+    exponents = scalingExponents(points)
+    assert exponents['linear'] == pytest.approx(1) and exponents['square'] == pytest.approx(2)
+    assert 'skipped' not in exponents
+
+def test_compareReports():
+    def report(seconds):
+        point = {'years': 1, 'nDepths': 8, 'resolution': 0.5, 'array': {'extendDataMatrix': {'seconds': seconds},
+                                                                          'oracle': {'seconds': 0.001}}}
+        return {'curves': {'years': {'points': [point]}}}
+
+    regressions = compareReports(report(1.0), report(1.5))
+    assert [(r['stage'], r['point'], r['ratio']) for r in regressions] == [('extendDataMatrix', '1y-8d-0.5m', 1.5)]
+    assert compareReports(report(1.0), report(1.2)) == []
@@ -0,0 +1,78 @@
+import csv
+import datetime
+import numpy as np
+import pytest
+
+from bundle import Trajectories, TrajectoryWriter, readBundle, readTrajectories, writeBundle
+from ensemble import makeKernel, runEnsemble
+from oracle import unconstrainedOracle
+from strategyEngine import DenseSource, EngineState, runStrategy
+
+META = {'lake': 'synthetic', 'year': 2005, 'resolution': 0.5, 'model': 'synechococcus', 'seed': 3}
+
+@pytest.fixture(scope='module')
+def results(lakeYear):
+    grid, fitness, daylight = lakeYear
+    grid, fitness, daylight = grid.take(np.arange(96)), np.asarray(fitness)[:96], daylight[:96]
+    trajectories = {'circadian': runEnsemble(grid, fitness, 'circadian', 3, seed=3, daylight=daylight),
+                    'oracle': unconstrainedOracle(fitness)}
+    return grid, fitness, trajectories
+
+@pytest.mark.parametrize('format', ['npz', 'parquet'])
+def test_roundTrip(format, results, tmp_path):
+    if format == 'parquet':
+        pytest.importorskip('pyarrow')
+    grid, fitness, trajectories = results
+    filename = str(tmp_path / ('bundle.npz' if format == 'npz' else 'bundle'))
+    writeBundle(filename, grid, fitness, trajectories, META, format=format)
+    bundle = readBundle(filename)
+
+    assert dict((key, bundle.meta[key]) for key in META) == META
+    assert np.array_equal(bundle.grid.times, grid.times) and np.array_equal(bundle.grid.depths, grid.depths)
+    assert np.array_equal(bundle.grid.temps, grid.temps, equal_nan=True)
+    assert np.array_equal(bundle.grid.flags, grid.flags)
+    assert np.array_equal(bundle.fitness, fitness, equal_nan=True)
+    for name, result in trajectories.items():
+        expected = Trajectories.fromResult(result, grid)
+        assert np.array_equal(bundle.trajectories[name].times, expected.times)
+        assert np.array_equal(bundle.trajectories[name].depths, expected.depths)
+        assert np.array_equal(bundle.trajectories[name].fitness, expected.fitness)
+
+def test_matchesWriteCSV(legacy, results, tmp_path):
+    _, formatData = legacy
+    grid, _, _ = results
+    nameString = str(tmp_path / 'grid')
+    formatData.writeCSV(grid.toDict(), nameString)
+    writeBundle(str(tmp_path / 'grid.npz'), grid)
+    bundle = readBundle(str(tmp_path / 'grid.npz'))
+
+    with open(nameString + '.csv') as f:
+        rows = [row for row in csv.reader(f) if row]
+    cells = np.argwhere(~np.isnan(bundle.grid.temps))
+    assert len(rows) == len(cells)
+    for row, (t, d) in zip(rows, cells.tolist()):
+        assert datetime.datetime.fromisoformat(row[0]) == bundle.grid.datetimes()[t]
+        assert float(row[1]) == bundle.grid.depths[d]
+        assert float(row[2]) == pytest.approx(float(bundle.grid.temps[t, d]), rel=1e-6)
+
+def test_writerPartsJoinInTime(results, tmp_path):
+    grid, fitness, _ = results
+    source, kernel = DenseSource(grid, fitness), makeKernel('hillClimbing')
+    whole = runStrategy(source, kernel, 2, seed=8)
+    state = EngineState.fresh(2, 8)
+    with TrajectoryWriter(str(tmp_path / 'run'), META) as writer:
+        for lo in range(0, len(grid.times), 30):
+            part = runStrategy(source, kernel, rows=np.arange(lo, min(lo + 30, len(grid.times))), state=state)
+            writer.append('hillClimbing', part, grid)
+        writer.appendRun({'run': {'strategy': 'oracle'}, 'totalFitness': np.array([1.5])})
+
+    trajectories, runs, meta = readTrajectories(str(tmp_path / 'run'))
+    assert meta['lake'] == 'synthetic' and len(writer.manifest['parts']) == 5
+    assert np.array_equal(trajectories['hillClimbing'].depthIndex, whole.depthIndex)
+    assert np.array_equal(trajectories['hillClimbing'].times, grid.times[whole.rows])
+    assert runs[0]['run'] == {'strategy': 'oracle'} and runs[0]['totalFitness'].tolist() == [1.5]
+
+def test_rejectsUnknownFormat(results, tmp_path):
+    grid, fitness, _ = results
+    with pytest.raises(ValueError, match='unknown format'):
+        writeBundle(str(tmp_path / 'bundle.csv'), grid, fitness, format='csv')
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from climatology import ClimatologyAccumulator, dayOfYearSlot, hourOfDay
+from lakeGrid import LakeGrid
+
+def januaries(lakeRecords):
+    """The measured grid restricted to January of every year, small enough for the dictionary code."""
+    grid = lakeRecords.toGrid()
+    months = grid.times.astype('datetime64[M]').astype(np.int64) % 12
+    return grid.take(np.flatnonzero(months == 0))
+
+def test_matchesAverageOverYears(legacy, lakeRecords):
+    _, formatData = legacy
+    grid = januaries(lakeRecords)
+    expected = formatData.averageOverYears(formatData.groupAllDates(grid.toDict()))
+    mean = ClimatologyAccumulator.fromGrid(grid).mean(grid.depths)
+
+    checked = 0
+    for date in grid.datetimes():
+        key = date.strftime('%m-%d %H:%M:%S')
+        when = np.array([date], dtype='datetime64[m]')
+        slot, hour = dayOfYearSlot(when)[0], hourOfDay(when)[0]
+        for d, depth in enumerate(grid.depths):
+            if depth in expected.get(key, {}):
+                assert mean[slot, hour, d] == pytest.approx(expected[key][depth], abs=1e-4)
+                checked += 1
+            else:
+                assert np.isnan(mean[slot, hour, d])
+    assert checked > 0
+
+def test_mergeMatchesOnePass(lakeRecords, lakeYears):
+    grid = lakeRecords.toGrid()
+    years = grid.times.astype('datetime64[Y]').astype(np.int64) + 1970
+    merged = ClimatologyAccumulator(trackSpread=True)
+    for year in lakeYears:
+        merged.merge(ClimatologyAccumulator.fromGrid(grid.take(np.flatnonzero(years == year)), trackSpread=True))
+    whole = ClimatologyAccumulator.fromGrid(grid, trackSpread=True)
+
+    assert np.array_equal(merged.count, whole.count)
+    np.testing.assert_allclose(merged.mean(), whole.mean(), rtol=1e-6, equal_nan=True)
+    np.testing.assert_allclose(merged.variance(), whole.variance(), rtol=1e-4, atol=1e-5, equal_nan=True)
+    for a, b in zip(merged.range(), whole.range()):
+        assert np.array_equal(a, b, equal_nan=True)
+
+def test_spreadMatchesNumpy():
+    times = np.array(['2004-03-01T05:00', '2005-03-01T05:10', '2006-03-01T05:59'], dtype='datetime64[m]')
+    temps = np.array([[10.0, 4.0], [12.0, np.nan], [17.0, 5.0]], dtype=np.float32)
+    accumulator = ClimatologyAccumulator(trackSpread=True)
+    for t in range(len(times)):
+        accumulator.add(times[t:t + 1], [0.0, 3.0], temps[t:t + 1])
+    slot = dayOfYearSlot(times[:1])[0]
+    assert accumulator.variance()[slot, 5].tolist() == pytest.approx([np.var([10, 12, 17]), np.var([4, 5])])
+    minimum, maximum = accumulator.range()
+    assert minimum[slot, 5].tolist() == [10, 4] and maximum[slot, 5].tolist() == [17, 5]
+
+def test_removeUndoesAdd(lakeRecords, tmp_path):
+    grid = lakeRecords.toGrid()
+    accumulator = ClimatologyAccumulator.fromGrid(grid.take(np.arange(100)))
+    before = accumulator.mean()
+    accumulator.addGrid(grid, np.arange(100, 200))
+    accumulator.remove(grid.times[100:200], grid.depths, grid.temps[100:200])
+    assert np.array_equal(accumulator.mean(), before, equal_nan=True)
+
+    filename = str(tmp_path / 'climatology.npz')
+    accumulator.save(filename)
+    assert np.array_equal(ClimatologyAccumulator.load(filename).mean(), before, equal_nan=True)
+
+def test_leapDayFallsBack():
+    times = np.array(['2005-02-28T00:00'], dtype='datetime64[m]')
+    mean = ClimatologyAccumulator.fromGrid(LakeGrid(times, [0.0], np.array([[3.0]], dtype=np.float32))).mean()
+    assert mean[59, 0, 0] == 3.0 #02-29 borrows 02-28
+    assert dayOfYearSlot(np.array(['2005-03-01', '2004-03-01'], dtype='datetime64[m]')).tolist() == [60, 60]
+
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import continuous
+from continuous import readCheckpoint, runContinuous
+from ensemble import runEnsemble
+from lakeStore import LakeStore
+
+class Preempted(Exception):
+    pass
+
+@pytest.fixture(scope='module')
+def store(lakeFile, solarTable, tmp_path_factory):
+    return LakeStore.build(str(tmp_path_factory.mktemp('store')), lakeFile, resolution=0.5, solarTable=solarTable)
+
+@pytest.mark.parametrize('strategy', ['circadian', 'randomWalk'])
+def test_oneYearMatchesEnsemble(store, tmp_path, strategy):
+    year = store.years[0]
+    grid, fitness, daylight = store[year]
+    expected = runEnsemble(grid, fitness, strategy, 3, seed=4, daylight=daylight)
+    actual = runContinuous(store, strategy, str(tmp_path / 'run'), nAgents=3, seed=4, years=[year],
+                           checkpointHours=500)
+    np.testing.assert_array_equal(actual.times, grid.times)
+    np.testing.assert_array_equal(actual.depthIndex, expected.depthIndex)
+    np.testing.assert_array_equal(actual.fitness, expected.fitness)
+
+@pytest.mark.parametrize('strategy', ['circadian', 'hillClimbing'])
+def test_resumeAfterCrash(store, tmp_path, monkeypatch, strategy):
+    whole = runContinuous(store, strategy, str(tmp_path / 'whole'), nAgents=3, seed=7, checkpointHours=1500)
+    assert whole.depthIndex.shape[1] == sum(len(store[year][0].times) for year in store.years)
+
+    #preempted between writing a part and committing its checkpoint: the part is simulated again
+    commit = continuous._commit
+    calls = []
+    def crashingCommit(*args):
+        calls.append(True)
+        if len(calls) == 8:
+            raise Preempted()
+        return commit(*args)
+    monkeypatch.setattr(continuous, '_commit', crashingCommit)
+    directory = str(tmp_path / 'resumed')
+    with pytest.raises(Preempted):
+        runContinuous(store, strategy, directory, nAgents=3, seed=7, checkpointHours=1500)
+    checkpoint = readCheckpoint(directory)
+    assert not checkpoint['done'] and checkpoint['parts'] == 7 and checkpoint['year'] == store.years[1]
+
+    monkeypatch.setattr(continuous, '_commit', commit)
+    _assertSameRun(whole, runContinuous(store, strategy, directory, nAgents=3, seed=7, checkpointHours=1500))
+    assert readCheckpoint(directory)['done']
+    _assertSameRun(whole, runContinuous(store, strategy, directory, nAgents=3, seed=7, checkpointHours=1500))
+
+def test_checkpointSpacingDoesNotMatter(store, tmp_path):
+    a = runContinuous(store, 'randomWalkDirectional', str(tmp_path / 'a'), nAgents=3, seed=1, checkpointHours=1000)
+    b = runContinuous(store, 'randomWalkDirectional', str(tmp_path / 'b'), nAgents=3, seed=1, checkpointHours=333)
+    _assertSameRun(a, b)
+
+def test_otherSettingsRefused(store, tmp_path):
+    directory = str(tmp_path / 'run')
+    runContinuous(store, 'randomWalk', directory, nAgents=2, seed=1, years=store.years[:1])
+    with pytest.raises(ValueError):
+        runContinuous(store, 'randomWalk', directory, nAgents=3, seed=1, years=store.years[:1])
+
+## helper functions ##
+
+def _assertSameRun(expected, actual):
+    np.testing.assert_array_equal(actual.times, expected.times)
+    np.testing.assert_array_equal(actual.depthIndex, expected.depthIndex)
+    np.testing.assert_array_equal(actual.fitness, expected.fitness)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from depthMovement import (DEPTH_STRATEGIES, DepthState, DepthStrategy, ProfileSource, makeDepthStrategy,
+                           runDepthEnsemble, runDepthStrategy)
+from fitness import createFitnessGrid
+from interpolation import interpolateGrid
+
+@pytest.mark.parametrize('method', ['linear', 'density', 'spline'])
+def test_profileMatchesInterpolatedGrid(method, filledYear):
+    sensors = filledYear.take(np.arange(24 * 14))
+    grid = interpolateGrid(sensors, 0.5, method)
+    fitness = createFitnessGrid(grid)
+    source = ProfileSource(sensors, method)
+    for t in range(len(grid.times)):
+        columns = np.flatnonzero(grid.mask[t])
+        np.testing.assert_allclose(source.temperatureAt(t, grid.depths[columns]), grid.temps[t, columns], rtol=1e-5)
+        np.testing.assert_allclose(source.fitnessAt(t, grid.depths[columns]), fitness[t, columns], rtol=1e-4,
+                                   atol=1e-6)
+
+def test_circadianFollowsDaylight(filledYear, lakeYear):
+    daylight = lakeYear[2]
+    source = ProfileSource(filledYear)
+    result = runDepthStrategy(source, makeDepthStrategy('circadian', speed='fast'), 3, seed=5, daylight=daylight)
+    moved = np.diff(result.depths, axis=1)
+    clamped = np.isclose(result.depths[:, 1:], source.top[1:]) | np.isclose(result.depths[:, 1:], source.bottom[1:])
+    #agents are also moved into the profile when a sensor drops out
+    clamped |= ((source.top[1:] != source.top[:-1]) | (source.bottom[1:] != source.bottom[:-1]))[None, :]
+    expected = np.where(daylight[1:], -0.4, 0.4)[None, :].repeat(3, axis=0)
+    np.testing.assert_allclose(moved[~clamped], expected[~clamped], atol=1e-5)
+    assert clamped.any() and (~clamped).any()
+
+@pytest.mark.parametrize('strategy', sorted(DEPTH_STRATEGIES))
+def test_chunkedRunMatchesSingleRun(strategy, filledYear, lakeYear, tmp_path):
+    daylight = lakeYear[2]
+    source = ProfileSource(filledYear)
+    kernel = makeDepthStrategy(strategy, speed=0.25)
+    whole = runDepthStrategy(source, kernel, 5, seed=9, daylight=daylight, blockSize=100)
+
+    state, parts = DepthState.fresh(5, 9), []
+    for lo in range(0, len(source), 2000):
+        result = runDepthStrategy(source, kernel, daylight=daylight, rows=np.arange(lo, min(lo + 2000, len(source))),
+                                  state=state, blockSize=100)
+        parts.append(result)
+        state.save(str(tmp_path / 'state.npz'))
+        state = DepthState.load(str(tmp_path / 'state.npz'))
+
+    np.testing.assert_array_equal(whole.depths, np.concatenate([part.depths for part in parts], axis=1))
+    np.testing.assert_array_equal(whole.fitness, np.concatenate([part.fitness for part in parts], axis=1))
+    assert whole.state.lastTime == state.lastTime
+    assert whole.counters['clamps'] == sum(part.counters['clamps'] for part in parts)
+
+@pytest.mark.parametrize('strategy', sorted(DEPTH_STRATEGIES))
+def test_resolutionIndependent(strategy, filledYear, lakeYear):
+    daylight = lakeYear[2]
+    sensors = runDepthEnsemble(filledYear, strategy, 4, seed=2, daylight=daylight)
+    interpolated = runDepthEnsemble(interpolateGrid(filledYear, 0.5), strategy, 4, seed=2, daylight=daylight)
+    np.testing.assert_allclose(sensors.depths, interpolated.depths, atol=1e-5)
+    np.testing.assert_allclose(sensors.fitness, interpolated.fitness, rtol=1e-4, atol=1e-5)
+
+def test_depthsStayInTheLake(filledYear):
+    source = ProfileSource(filledYear)
+    result = runDepthStrategy(source, makeDepthStrategy('randomWalkDirectional', speed=3.0), 8, seed=1)
+    assert (result.depths >= source.top[result.rows][None, :] - 1e-6).all()
+    assert (result.depths <= source.bottom[result.rows][None, :] + 1e-6).all()
+    assert result.counters['clamps'] > 0
+
+def test_circadianNeedsDaylight(filledYear):
+    with pytest.raises(ValueError):
+        runDepthEnsemble(filledYear, 'circadian', 2)
+    with pytest.raises(ValueError):
+        makeDepthStrategy('circadian', speed='medium')
+
+def test_strategyIsAbstract():
+    with pytest.raises(TypeError):
+        DepthStrategy()
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from ensemble import STRATEGIES, runEnsemble
+from fitness import createFitnessGrid
+from strategyEngine import agentStreams
+
+HOURS = 24 * 10
+AGENTS = 4
+SEED = 5
+
+class StreamRandom(object):
+    """Stands in for the random module of the original strategies, drawing from an agent's stream
+    the way the engine does: one number per hour, a random depth is int(u * number of depths).
+    """
+    def __init__(self, stream):
+        self.stream = stream
+
+    def random(self):
+        return self.stream.random()
+
+    def choice(self, sequence):
+        return sequence[min(int(self.random() * len(sequence)), len(sequence) - 1)]
+
+@pytest.fixture(scope='module', params=['interpolated', 'sensors'])
+def window(request, lakeYear, filledYear):
+    """Ten days of the interpolated grid, or of the sensor grid where depths come and go."""
+    grid, fitness, daylight = lakeYear
+    if request.param == 'sensors':
+        grid = filledYear
+        fitness = createFitnessGrid(grid)
+    rows = np.arange(HOURS)
+    return grid.take(rows), np.asarray(fitness)[rows], daylight[rows]
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_matchesOriginalStrategies(strategy, window, legacy, solarTable, monkeypatch):
+    movement, _ = legacy
+    grid, fitness, daylight = window
+    result = runEnsemble(grid, fitness, strategy, AGENTS, seed=SEED, probabilityFactor=0.4, daylight=daylight)
+
+    view = grid.asDict()
+    fitnessDict = dict((date, dict((depth, float(fitness[t, grid.column(depth)])) for depth in view[date].keys()))
+                       for t, date in enumerate(grid.datetimes()))
+    start, end = grid.datetimes()[0], grid.datetimes()[-1]
+    sunsetMatrix = [[sunrise.astype(object), sunset.astype(object)]
+                    for sunrise, sunset in map(solarTable.sunTimes, np.unique(grid.times.astype('datetime64[D]')))]
+    #the random walks iterate an unordered set of dates, give them the hours in order as the engine does
+    monkeypatch.setattr(movement, 'getCommonElements', lambda a, b: sorted(set(a).intersection(b)))
+
+    for agent, stream in enumerate(agentStreams(AGENTS, SEED)):
+        monkeypatch.setattr(movement, 'random', StreamRandom(stream))
+        if strategy == 'randomWalk':
+            dates, depths, _, fitnesses = movement.randomWalk(view, fitnessDict, start, end, True)
+        elif strategy == 'randomWalkDirectional':
+            dates, depths, _, fitnesses = movement.randomWalkDirectional(view, fitnessDict, start, end, 0.4, True)
+        elif strategy == 'hillClimbing':
+            dates, depths, _, fitnesses = movement.hillClimbingMovement(view, fitnessDict, start, end, True)
+        else:
+            dates, depths, _, fitnesses = movement.circadianMovement(view, fitnessDict, sunsetMatrix, start, end, 'slow')
+        assert [np.datetime64(date, 'm') for date in dates] == result.times.tolist()
+        hours = _comparable(strategy, grid)
+        np.testing.assert_allclose(result.depths[agent, :hours], depths[:hours], err_msg='agent %d' % agent)
+        np.testing.assert_allclose(result.fitness[agent, :hours], fitnesses[:hours], rtol=1e-6)
+
+def test_directionalSnapsByMeters(window):
+    grid, fitness, daylight = window
+    result = runEnsemble(grid, fitness, 'randomWalkDirectional', AGENTS, seed=SEED, daylight=daylight)
+    for t in range(1, len(grid.times)):
+        columns = np.flatnonzero(grid.mask[t])
+        previous = grid.depths[result.depthIndex[:, t - 1]]
+        nearest = np.abs(grid.depths[columns][None, :] - previous[:, None]).argmin(axis=1)
+        #one depth up or down from the nearest depth with data, never further
+        assert (np.abs(np.searchsorted(columns, result.depthIndex[:, t]) - nearest) <= 1).all()
+
+def test_totalFitness(lakeYear):
+    grid, fitness, daylight = lakeYear
+    result = runEnsemble(grid, fitness, 'hillClimbing', 8, seed=1, daylight=daylight)
+    assert result.depthIndex.shape == result.fitness.shape == (8, len(grid.times))
+    rows = np.arange(len(grid.times))
+    for agent in range(8):
+        assert result.totalFitness[agent] == pytest.approx(np.asarray(fitness, np.float64)[rows, result.depthIndex[agent]].sum())
+
+def test_unknownStrategy(lakeYear):
+    grid, fitness, _ = lakeYear
+    with pytest.raises(ValueError, match='unknown strategy'):
+        runEnsemble(grid, fitness, 'teleport', 2)
+
+## helper functions ##
+
+def _comparable(strategy, grid):
+    """Hours over which the original matches the engine. randomWalkDirectional keeps its index
+    in the list of depths when that list changes, where the engine (like circadianMovement and
+    hillClimbingMovement) moves on from the nearest depth in meters, so it is compared up to the
+    first hour whose depths differ.
+    """
+    if strategy != 'randomWalkDirectional':
+        return len(grid.times)
+    changed = np.flatnonzero((grid.mask != grid.mask[0]).any(axis=1))
+    assert len(changed) == 0 or changed[0] > 24
+    return changed[0] if len(changed) else len(grid.times)
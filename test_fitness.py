@@ -0,0 +1,45 @@
+import datetime
+import numpy as np
+import pytest
+
+from fitness import createFitnessGrid, fitnessGrid, getGrowthModel
+from lakeGrid import LakeGrid
+
+TEMPS = np.array([[0.0, 4.0, 12.5], [19.75, 26.0, np.nan]])
+
+def test_matchesFitnessFunction(legacy):
+    movement, _ = legacy
+    fitness = fitnessGrid(TEMPS.astype(np.float64))
+    for (t, d), temp in np.ndenumerate(TEMPS):
+        if np.isnan(temp):
+            assert np.isnan(fitness[t, d])
+        else:
+            assert fitness[t, d] == pytest.approx(movement.fitnessFunction(temp, None), rel=1e-5)
+
+def test_matchesDoubleExponential(legacy):
+    movement, _ = legacy
+    fitness = fitnessGrid(TEMPS, 'doubleExponential')
+    assert fitness[1, 0] == pytest.approx(movement.doubleExponentialGrowthRate(19.75), rel=1e-5)
+
+def test_matchesCreateFitnessDict(legacy):
+    movement, _ = legacy
+    times = np.array(['2005-06-01T00:00', '2005-06-01T01:00'], dtype='datetime64[m]')
+    grid = LakeGrid(times, [0.0, 1.0, 2.0], TEMPS)
+    start, end = datetime.datetime(2005, 1, 1), datetime.datetime(2005, 12, 31, 23, 59)
+    expected = movement.createFitnessDict(grid.toDict(), None, start, end)
+    fitness = createFitnessGrid(grid)
+    for date, profile in expected.items():
+        row = grid.row(date)
+        for depth, value in profile.items():
+            assert fitness[row, grid.column(depth)] == pytest.approx(value, rel=1e-5)
+
+def test_chunkingAndParams():
+    temps = np.random.default_rng(0).uniform(0, 30, size=(50, 7)).astype(np.float32)
+    np.testing.assert_array_equal(fitnessGrid(temps, chunkRows=7), fitnessGrid(temps))
+    function, parameters = getGrowthModel('synechococcus', {'tOpt': 25.0})
+    assert parameters['tOpt'] == 25.0
+    np.testing.assert_allclose(fitnessGrid(temps, params={'tOpt': 25.0}), function(temps, **parameters), rtol=1e-6)
+    with pytest.raises(KeyError):
+        getGrowthModel('synechococcus', {'speed': 1})
+    with pytest.raises(KeyError):
+        getGrowthModel('plankton')
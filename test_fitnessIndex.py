@@ -0,0 +1,63 @@
+import datetime
+import numpy as np
+import pytest
+
+from fitnessIndex import FitnessIndex
+
+@pytest.fixture(scope='module')
+def index(lakeYear):
+    grid, fitness, _ = lakeYear
+    return FitnessIndex.fromGrid(grid, fitness)
+
+def test_matchesBruteForce(index, lakeYear):
+    grid, fitness, _ = lakeYear
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        a, b = np.sort(rng.integers(0, len(grid.times), 2))
+        #window ends between rows as well as on them
+        start = grid.times[a] - np.timedelta64(int(rng.integers(0, 60)), 'm')
+        end = grid.times[b] + np.timedelta64(int(rng.integers(0, 60)), 'm')
+        depth = grid.depths[rng.integers(len(grid.depths))]
+        rows = (grid.times >= start) & (grid.times <= end)
+        column = fitness[rows, grid.column(depth)].astype(np.float64)
+        assert index.total(start, end, depth) == pytest.approx(np.nansum(column), rel=1e-9, abs=1e-6)
+        assert index.hours(start, end, depth) == (~np.isnan(column)).sum()
+        if (~np.isnan(column)).any():
+            assert index.mean(start, end, depth) == pytest.approx(np.nanmean(column), rel=1e-9, abs=1e-9)
+
+def test_matchesFitnessAtStableDepth(legacy, lakeYear):
+    movement, _ = legacy
+    grid, fitness, _ = lakeYear
+    grid, fitness = grid.take(np.arange(72)), np.asarray(fitness)[:72]
+    view = grid.asDict()
+    fitnessDict = dict((date, dict((depth, float(fitness[t, grid.column(depth)])) for depth in view[date].keys()))
+                       for t, date in enumerate(grid.datetimes()))
+    index = FitnessIndex.fromGrid(grid, fitness)
+    start, end = datetime.datetime(2005, 1, 1, 5), datetime.datetime(2005, 1, 2, 17)
+    for depth in grid.depths[[0, 10, -1]].tolist():
+        _, _, fitnessList = movement.fitnessAtStableDepth(view, fitnessDict, depth, start, end, True)
+        assert index.total(start, end, depth) == pytest.approx(sum(fitnessList), rel=1e-9)
+        assert index.hours(start, end, depth) == len(fitnessList)
+
+def test_bestDepthOfEachWeek(index, lakeYear):
+    grid, fitness, _ = lakeYear
+    starts, ends = index.periods('W')
+    assert all(starts[i + 1] - ends[i] == np.timedelta64(1, 'm') for i in range(len(starts) - 1))
+    assert (starts.astype('datetime64[D]').astype(np.int64) % 7 == 4).all() #mondays
+    depths, scores = index.bestDepth(starts, ends)
+    for week in (0, 20, len(starts) - 1):
+        rows = (grid.times >= starts[week]) & (grid.times <= ends[week])
+        totals = np.nansum(fitness[rows].astype(np.float64), axis=0)
+        assert depths[week] == grid.depths[totals.argmax()]
+        assert scores[week] == pytest.approx(totals.max())
+
+def test_rankDepthsPutsMissingLast():
+    times = np.array(['2005-06-01T00:00', '2005-06-01T01:00', '2005-06-01T02:00'], dtype='datetime64[m]')
+    fitness = np.array([[1.0, np.nan, 3.0], [2.0, np.nan, -1.0], [np.nan, np.nan, 0.5]])
+    index = FitnessIndex(times, [0.0, 1.0, 2.0], fitness)
+    order, scores = index.rankDepths(times[0], times[-1], by='mean')
+    assert order.tolist() == [[0, 2, 1]]
+    np.testing.assert_allclose(scores, [[1.5, np.nan, 2.5 / 3]])
+    assert index.total(times[0], times[1], [0.0, 2.0]).tolist() == [3.0, 2.0]
+    with pytest.raises(ValueError, match='not on the fitness grid'):
+        index.total(times[0], times[1], 0.25)
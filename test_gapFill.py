@@ -0,0 +1,23 @@
+import numpy as np
+
+from gapFill import fillGaps, hourlyClimatology
+from lakeGrid import FILLED, MEASURED, LakeGrid
+
+def test_counts():
+    nan = np.nan
+    #the same day in 2004 and 2005, so the climatology of that day is defined from 00:00 to 03:00
+    times = ['2004-03-01T00:00', '2004-03-01T01:00', '2004-03-01T02:00', '2004-03-01T03:00',
+             '2005-03-01T00:00', '2005-03-01T01:00', '2005-03-01T03:00']
+    temps = [[10, 8, 6], [10, 8, 6], [10, 8, 6], [10, 8, 6],
+             [11, nan, 7], [11, 9, 7], [nan, 9, 7]]
+    measured = LakeGrid(np.array(times, dtype='datetime64[m]'), [0.0, 1.0, 2.0], np.array(temps, dtype=np.float32))
+    filled, counts = fillGaps(measured, hourlyClimatology(measured), 2005)
+
+    assert len(filled.times) == 8760
+    #02:00 is missing: one hour, three cells filled. 00:00 at 1 m and 03:00 at 0 m are missing depths
+    assert counts[2005] == {'missingHours': 8760 - 3, 'filledHourCells': 3, 'missingDepths': 2}
+    day = filled.rows(np.array(['2005-03-01T00:00', '2005-03-01T02:00'], dtype='datetime64[m]'))
+    np.testing.assert_allclose(filled.temps[day[0]], [11, 8, 7]) #only 2004 has 1 m at 00:00
+    np.testing.assert_allclose(filled.temps[day[1]], [10, 8, 6])
+    assert filled.flags[day[0]].tolist() == [MEASURED, FILLED, MEASURED]
+    assert (filled.flags[day[1]] == FILLED).all()
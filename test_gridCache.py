@@ -0,0 +1,63 @@
+import json
+import os
+import numpy as np
+
+import gridCache
+from gridCache import GridCache, fileHash
+from metrics import Metrics
+from pipeline import processLakeYear
+
+def test_roundTrip(tmp_path, filledYear):
+    cache = GridCache(str(tmp_path))
+    fitness = np.arange(filledYear.temps.size, dtype=np.float32).reshape(filledYear.temps.shape)
+    cache.store('abc', filledYear, {'fitness': fitness}, {'year': 2005})
+    grid, arrays, meta = cache.load('abc')
+    assert np.array_equal(grid.times, filledYear.times)
+    assert np.array_equal(grid.temps, filledYear.temps, equal_nan=True)
+    assert np.array_equal(grid.flags, filledYear.flags)
+    assert np.array_equal(arrays['fitness'], fitness)
+    assert meta == {'year': 2005}
+    assert cache.load('missing') is None
+
+def test_storeKeepsExistingEntry(tmp_path, filledYear):
+    cache = GridCache(str(tmp_path))
+    cache.store('abc', filledYear, meta={'writer': 1})
+    first = cache.load('abc')
+    cache.store('abc', filledYear, meta={'writer': 2})
+    assert cache.load('abc')[2] == {'writer': 1}
+    assert np.array_equal(first[0].temps, filledYear.temps, equal_nan=True) #still readable
+    assert sorted(os.listdir(str(tmp_path))) == ['abc']
+
+def test_storeLosingRaceDiscardsStaging(tmp_path, filledYear, monkeypatch):
+    cache = GridCache(str(tmp_path))
+    rename = os.rename
+
+    def otherWriterFirst(source, target):
+        #another process finishes the same entry between our check and our rename
+        monkeypatch.setattr(gridCache.os, 'rename', rename)
+        GridCache(str(tmp_path)).store('abc', filledYear, meta={'writer': 'other'})
+        rename(source, target)
+
+    monkeypatch.setattr(gridCache.os, 'rename', otherWriterFirst)
+    cache.store('abc', filledYear, meta={'writer': 'us'})
+    assert cache.load('abc')[2] == {'writer': 'other'}
+    assert sorted(os.listdir(str(tmp_path))) == ['abc']
+
+def test_fileHashMemo(tmp_path, monthFile):
+    memo = str(tmp_path)
+    digest = fileHash(monthFile, memo)
+    assert digest == fileHash(monthFile)
+    with open(os.path.join(memo, 'hashes.json')) as f:
+        assert list(json.load(f).values()) == [digest]
+    with open(os.path.join(memo, 'hashes.json'), 'w') as f:
+        f.write('{not json')
+    assert fileHash(monthFile, memo) == digest
+
+def test_processLakeYearHit(tmp_path, lakeFile, lakeYears):
+    metrics = Metrics()
+    cold = processLakeYear(lakeFile, lakeYears[0], 0.5, cache=str(tmp_path), metrics=metrics)
+    warm = processLakeYear(lakeFile, lakeYears[0], 0.5, cache=str(tmp_path), metrics=metrics)
+    assert metrics.counters['cache.misses'] == 1 and metrics.counters['cache.hits'] == 1
+    assert isinstance(warm[1], np.memmap)
+    assert np.array_equal(cold[1], warm[1], equal_nan=True)
+    assert cold[2] == warm[2]
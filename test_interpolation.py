@@ -0,0 +1,60 @@
+import datetime
+import numpy as np
+import pytest
+
+from interpolation import depthAxis, interpolateGrid, interpolateProfiles, waterDensity
+from lakeGrid import INTERPOLATED, MEASURED, MISSING, LakeGrid
+
+def test_matchesExtendDataMatrix(legacy, monthFile):
+    _, formatData = legacy
+    dictionary = formatData.createDictionary(formatData.createDataMatrix(monthFile, 'hourly'))
+    grid = interpolateGrid(LakeGrid.fromDict(dictionary), 0.1)
+    nSensors = max(len(profile) for profile in dictionary.values())
+    full = [date for date in sorted(dictionary) if len(dictionary[date]) == nSensors]
+    expected = formatData.extendDataMatrix(dict((date, dict(dictionary[date])) for date in full),
+                                           full[0], full[-1], 0.1)
+    view = grid.asDict()
+    for date in full[::50]:
+        assert sorted(view[date].keys()) == sorted(expected[date].keys())
+        for depth, value in expected[date].items():
+            assert view[date][depth][0] == pytest.approx(value[0], abs=5e-4) #findPoint rounds to 3 decimals
+
+def test_depthAxisRestartsAtEverySensor():
+    assert depthAxis([0.0, 2.5, 5.0], 1.0).tolist() == [0.0, 1.0, 2.0, 2.5, 3.5, 4.5, 5.0]
+    axis = depthAxis([0.0, 2.57, 5.14], 0.1)
+    assert 2.67 in axis and 2.6 not in axis and len(axis) == 53
+
+def test_flags():
+    nan = np.nan
+    times = np.array(['2005-06-01T00:00', '2005-06-01T01:00'], dtype='datetime64[m]')
+    grid = interpolateGrid(LakeGrid(times, [0.0, 1.0, 2.0], [[20.0, 18.0, 10.0], [nan, 18.0, 10.0]]), 0.5)
+    assert grid.depths.tolist() == [0.0, 0.5, 1.0, 1.5, 2.0]
+    assert grid.flags[0].tolist() == [MEASURED, INTERPOLATED, MEASURED, INTERPOLATED, MEASURED]
+    assert grid.flags[1].tolist() == [MISSING, MISSING, MEASURED, INTERPOLATED, MEASURED]
+    np.testing.assert_allclose(grid.temps[0], [20, 19, 18, 14, 10])
+
+@pytest.mark.parametrize('bracket', [(2.0, 10.0), (10.0, 2.0), (0.5, 4.2), (3.9, 25.0), (1.0, 7.0), (12.0, 18.0)])
+def test_densityKeepsTheInterpolatedDensity(bracket):
+    x = np.array([0.0, 1.0])
+    y = np.array([bracket])
+    target = np.linspace(0, 1, 41)
+    temps = interpolateProfiles(x, y, target, 'density')[0]
+    rho = waterDensity(bracket[0]) * (1 - target) + waterDensity(bracket[1]) * target
+    np.testing.assert_allclose(waterDensity(temps), rho, rtol=0, atol=1e-6)
+    assert (temps >= min(bracket) - 1e-9).all() and (temps <= max(bracket) + 1e-9).all()
+    assert temps[0] == pytest.approx(bracket[0], abs=1e-5) and temps[-1] == pytest.approx(bracket[1], abs=1e-5)
+
+def test_splineIsNaturalCubic():
+    interpolate = pytest.importorskip('scipy.interpolate')
+    x = np.array([0.0, 1.0, 2.5, 4.0, 7.0])
+    y = np.array([[22.0, 21.5, 15.0, 9.0, 6.0], [5.0, 4.5, 4.2, 4.0, 4.0]])
+    target = np.linspace(0, 7, 29)
+    expected = [interpolate.CubicSpline(x, row, bc_type='natural')(target) for row in y]
+    np.testing.assert_allclose(interpolateProfiles(x, y, target, 'spline'), expected, atol=1e-9)
+
+def test_splineThroughKnotsAndExactOnLines():
+    x = np.array([0.0, 1.0, 2.5, 4.0, 7.0])
+    y = np.array([[22.0, 21.5, 15.0, 9.0, 6.0], 20.0 - 2.0 * x])
+    np.testing.assert_allclose(interpolateProfiles(x, y, x, 'spline'), y, atol=1e-12)
+    target = np.linspace(0, 7, 29)
+    np.testing.assert_allclose(interpolateProfiles(x, y, target, 'spline')[1], 20.0 - 2.0 * target, atol=1e-12)
@@ -0,0 +1,42 @@
+import datetime
+import numpy as np
+
+from lakeGrid import FILLED, MEASURED, MISSING, LakeGrid
+
+def test_dictionaryMatchesCreateDictionary(legacy, monthFile):
+    _, formatData = legacy
+    dataMatrix = formatData.createDataMatrix(monthFile, 'hourly')
+    expected = formatData.createDictionary(dataMatrix)
+    view = LakeGrid.fromRecords(dataMatrix).asDict()
+    assert sorted(view.keys()) == sorted(expected.keys())
+    for date in list(expected)[::97]:
+        assert sorted(view[date].keys()) == sorted(expected[date].keys())
+        for depth, (temp, flag) in expected[date].items():
+            assert view[date][depth][0] == np.float32(temp)
+            assert view[date][depth][1] == flag
+
+def test_fromDictRoundTrip():
+    first, second = datetime.datetime(2005, 6, 1, 0), datetime.datetime(2005, 6, 1, 1)
+    dictionary = {first: {0.0: [20.5, ''], 1.5: [18.25, 'A']},
+                  second: {0.0: [20.75, ''], 1.5: [18.0]}} #no flag: written by fillGapsInData
+    grid = LakeGrid.fromDict(dictionary)
+    assert grid.depths.tolist() == [0.0, 1.5]
+    assert grid.flags.tolist() == [[MEASURED, MEASURED], [MEASURED, FILLED]]
+    assert grid.toDict()[first] == dictionary[first]
+    assert grid.asDict()[second][1.5] == [18.0, '']
+
+def test_firstReadingWins():
+    times = np.array(['2005-06-01T00:00', '2005-06-01T00:00', '2005-06-01T02:00'], dtype='datetime64[m]')
+    grid = LakeGrid.fromArrays(times, [1.0, 1.0, 2.0], [10.0, 11.0, 9.0], ['', 'B', ''])
+    assert grid.temps[0, 0] == 10.0 and grid.qualityLabels[grid.quality[0, 0]] == ''
+    assert grid.flags[0].tolist() == [MEASURED, MISSING]
+    assert grid.step == np.timedelta64(120, 'm')
+
+def test_saveLoadWindow(tmp_path, filledYear):
+    filledYear.save(str(tmp_path / 'grid'))
+    loaded = LakeGrid.load(str(tmp_path / 'grid'))
+    np.testing.assert_array_equal(loaded.temps, filledYear.temps)
+    np.testing.assert_array_equal(loaded.flags, filledYear.flags)
+    assert loaded.qualityLabels == filledYear.qualityLabels
+    window = loaded.window(datetime.datetime(2005, 3, 1), datetime.datetime(2005, 3, 2))
+    assert window.times[0] == np.datetime64('2005-03-01T00:00') and len(window.times) == 25
@@ -0,0 +1,125 @@
+import shutil
+import numpy as np
+import pytest
+
+from lakeStore import LakeStore
+from metrics import Metrics
+from pipeline import processLakeYear
+
+def test_buildMatchesPipeline(lakeFile, lakeYears, solarTable, tmp_path):
+    store = LakeStore.build(str(tmp_path / 'store'), lakeFile, resolution=0.5, solarTable=solarTable)
+    assert store.years == lakeYears
+    for year in lakeYears:
+        expected, expectedFitness, meta = processLakeYear(lakeFile, year, resolution=0.5)
+        grid, fitness, daylight = store[year]
+        np.testing.assert_array_equal(grid.times, expected.times)
+        np.testing.assert_array_equal(grid.depths, expected.depths)
+        np.testing.assert_allclose(grid.temps, expected.temps, atol=1e-5)
+        np.testing.assert_array_equal(grid.flags, expected.flags)
+        np.testing.assert_allclose(fitness, expectedFitness, atol=1e-5)
+        np.testing.assert_array_equal(daylight, solarTable.isDaylight(expected.times))
+        assert store.meta(year)['gaps'] == meta['gaps'] and store.meta(year)['shape'] == list(expected.shape)
+
+def test_yearsAreMappedLazily(lakeFile, lakeYears, tmp_path):
+    directory = str(tmp_path / 'store')
+    LakeStore.build(directory, lakeFile, resolution=0.5)
+    store = LakeStore(directory)
+    assert len(store) == 2 and lakeYears[0] in store and 2004 not in store
+    assert store._loaded == {}
+    grid, fitness, daylight = store[lakeYears[0]]
+    assert isinstance(fitness, np.memmap) and daylight is None
+    assert list(store._loaded) == [lakeYears[0]] and store[lakeYears[0]][1] is fitness
+    store.release(lakeYears[0])
+    assert store._loaded == {}
+    _, inMemory, _ = store.load(lakeYears[1], mmap=False)
+    assert not isinstance(inMemory, np.memmap)
+    with pytest.raises(KeyError):
+        store.load(2004)
+
+def test_secondBuildSkipsStoredYears(lakeFile, tmp_path):
+    directory = str(tmp_path / 'store')
+    LakeStore.build(directory, lakeFile, resolution=0.5)
+    metrics = Metrics()
+    LakeStore.build(directory, lakeFile, resolution=0.5, metrics=metrics)
+    report = metrics.report()
+    assert 'fitness' not in report or report['fitness']['calls'] == 0
+    #other settings invalidate what is stored
+    store = LakeStore.build(directory, lakeFile, resolution=1.0)
+    assert store[store.years[0]][0].depths[1] - store[store.years[0]][0].depths[0] == pytest.approx(1.0)
+
+@pytest.mark.parametrize('fraction', [0.3, 0.7])
+def test_refreshMatchesRebuild(lakeFile, solarTable, tmp_path, fraction):
+    full = LakeStore.build(str(tmp_path / 'full'), lakeFile, resolution=0.5, solarTable=solarTable)
+    with open(lakeFile, 'rb') as f:
+        lines = f.readlines()
+    growing = str(tmp_path / 'growing.txt')
+    cut = int(len(lines) * fraction)
+    with open(growing, 'wb') as f:
+        f.writelines(lines[:cut])
+    store = LakeStore.build(str(tmp_path / 'part'), growing, resolution=0.5, solarTable=solarTable)
+
+    with open(growing, 'ab') as f:
+        f.writelines(lines[cut:])
+    summary = store.refresh(growing, solarTable)
+    assert summary['rebuilt'] is None
+    assert summary['rows'] == len(lines) - cut
+    _assertSameStore(full, LakeStore(str(tmp_path / 'part')))
+
+    again = store.refresh(growing, solarTable)
+    assert again['rows'] == 0 and again['years'] == []
+
+def test_rewrittenFileIsRebuilt(lakeFile, tmp_path):
+    filename = str(tmp_path / 'lake.txt')
+    shutil.copy(lakeFile, filename)
+    store = LakeStore.build(str(tmp_path / 'store'), filename, resolution=0.5)
+    with open(filename, 'rb') as f:
+        lines = f.readlines()
+    fields = lines[-1].split(b',')
+    fields[6] = b'%.3f' % (float(fields[6]) + 1) #a corrected reading is not an append
+    lines[-1] = b','.join(fields)
+    with open(filename, 'wb') as f:
+        f.writelines(lines)
+    summary = store.refresh(filename)
+    assert summary['rebuilt'] is not None
+    _assertSameStore(LakeStore.build(str(tmp_path / 'fresh'), filename, resolution=0.5), store)
+
+def test_rebuildKeepsTheYearsAskedFor(lakeFile, lakeYears, tmp_path):
+    filename = str(tmp_path / 'lake.txt')
+    shutil.copy(lakeFile, filename)
+    store = LakeStore.build(str(tmp_path / 'store'), filename, years=[lakeYears[1]], resolution=0.5)
+    with open(filename, 'rb') as f:
+        lines = f.readlines()
+    with open(filename, 'wb') as f:
+        f.writelines(lines[:-1]) #dropping a line is a rewrite
+    summary = store.refresh(filename)
+    assert summary['rebuilt'] == 'the file was rewritten' and store.years == [lakeYears[1]]
+    assert store.catalog['params']['years'] == [lakeYears[1]]
+    _assertSameStore(LakeStore.build(str(tmp_path / 'fresh'), filename, years=[lakeYears[1]], resolution=0.5), store)
+
+def test_refreshChainsTheSourceHash(lakeFile, tmp_path, monkeypatch):
+    with open(lakeFile, 'rb') as f:
+        lines = f.readlines()
+    filename = str(tmp_path / 'lake.txt')
+    with open(filename, 'wb') as f:
+        f.writelines(lines[:-10])
+    store = LakeStore.build(str(tmp_path / 'store'), filename, resolution=0.5)
+    built = store.catalog['source']['hash']
+    with open(filename, 'ab') as f:
+        f.writelines(lines[-10:])
+    monkeypatch.setattr('lakeStore.fileHash', None) #the whole file is not hashed again
+    store.refresh(filename)
+    assert store.catalog['source']['hash'] not in (built, None)
+
+## helper functions ##
+
+def _assertSameStore(expected, actual):
+    assert actual.years == expected.years
+    for year in expected.years:
+        grid, fitness, daylight = expected[year]
+        refreshed, refreshedFitness, refreshedDaylight = actual[year]
+        np.testing.assert_array_equal(refreshed.times, grid.times)
+        np.testing.assert_allclose(refreshed.temps, grid.temps, atol=1e-4)
+        np.testing.assert_array_equal(refreshed.flags, grid.flags)
+        np.testing.assert_allclose(refreshedFitness, fitness, atol=1e-4)
+        np.testing.assert_array_equal(refreshedDaylight, daylight)
+        assert actual.meta(year)['gaps'] == expected.meta(year)['gaps']
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from ensemble import makeKernel
+from fitness import createFitnessGrid
+from interpolation import interpolateGrid
+from lazySource import LazySource
+from strategyEngine import DenseSource, runStrategy
+
+@pytest.fixture(scope='module')
+def sensors(filledYear):
+    return filledYear.take(np.arange(24 * 14)) #sensor depths come and go in the first weeks
+
+@pytest.mark.parametrize('method', ['linear', 'density', 'spline'])
+def test_matchesDenseSource(sensors, method):
+    grid = interpolateGrid(sensors, 0.5, method)
+    dense, lazy = DenseSource(grid, createFitnessGrid(grid)), LazySource(sensors, 0.5, method, cacheRows=8)
+    np.testing.assert_array_equal(lazy.depths, dense.depths)
+    assert len(lazy) == len(dense)
+    for t in range(len(dense)):
+        columns = dense.validColumns(t)
+        np.testing.assert_array_equal(lazy.validColumns(t), columns)
+        np.testing.assert_allclose(lazy.temperatureAt(t, columns), dense.temperatureAt(t, columns), rtol=1e-6)
+        np.testing.assert_allclose(lazy.fitnessAt(t, columns), dense.fitnessAt(t, columns), rtol=1e-5, atol=1e-7)
+
+@pytest.mark.parametrize('strategy', ['hillClimbing', 'randomWalkDirectional'])
+def test_strategiesRunTheSame(sensors, strategy):
+    grid = interpolateGrid(sensors, 0.5)
+    kernel = makeKernel(strategy)
+    dense = runStrategy(DenseSource(grid, createFitnessGrid(grid)), kernel, 4, seed=6)
+    lazy = LazySource(sensors, 0.5, cacheRows=2)
+    result = runStrategy(lazy, kernel, 4, seed=6)
+    np.testing.assert_array_equal(result.depthIndex, dense.depthIndex)
+    np.testing.assert_allclose(result.fitness, dense.fitness, rtol=1e-5, atol=1e-7)
+    assert 0 < lazy.computedCells < grid.temps.size #only the depths around the agents are evaluated
+
+def test_rejectsUnknownMethod(sensors):
+    with pytest.raises(ValueError, match='unknown interpolation method'):
+        LazySource(sensors, method='cubic')
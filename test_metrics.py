@@ -0,0 +1,76 @@
+import json
+import numpy as np
+
+from ensemble import makeKernel
+from fitness import createFitnessGrid
+from lakeGrid import INTERPOLATED
+from metrics import Metrics, StageTimer
+from pipeline import STAGES, processLakeYear
+from strategyEngine import DenseSource, agentStreams, runStrategy
+
+def test_pipelineCounters(lakeFile, lakeYears):
+    metrics = Metrics(STAGES)
+    grid, fitness, meta = processLakeYear(lakeFile, lakeYears[0], resolution=0.5, metrics=metrics)
+    report = metrics.report()
+    assert list(report) == list(STAGES)
+    assert all(report[stage]['calls'] == 1 and report[stage]['seconds'] > 0 for stage in STAGES)
+    assert report['fitness']['rows'] == len(grid.times) and report['fitness']['cells'] == fitness.size
+    assert report['ingest']['rows'] == report['resample']['rows'] > 0
+    assert metrics.counters['interpolate.interpolatedCells'] == (grid.flags == INTERPOLATED).sum()
+    for name, count in meta['gaps'].items():
+        assert metrics.counters['gapFill.' + name] == count
+
+def test_strategyCountersMatchCircadianMovement(legacy, filledYear, solarTable, monkeypatch):
+    movement, _ = legacy
+    grid = filledYear.take(np.arange(24 * 10)) #sensor depths come and go, so agents snap
+    fitness = createFitnessGrid(grid)
+    daylight = solarTable.isDaylight(grid.times)
+    result = runStrategy(DenseSource(grid, fitness), makeKernel('circadian', speed='fast'), 5, seed=2, daylight=daylight)
+
+    view = grid.asDict()
+    fitnessDict = dict((date, dict((depth, float(fitness[t, grid.column(depth)])) for depth in view[date].keys()))
+                       for t, date in enumerate(grid.datetimes()))
+    sunsetMatrix = [[sunrise.astype(object), sunset.astype(object)]
+                    for sunrise, sunset in map(solarTable.sunTimes, np.unique(grid.times.astype('datetime64[D]')))]
+    metrics = Metrics()
+    for stream in agentStreams(5, 2):
+        monkeypatch.setattr(movement, 'random', _StreamRandom(stream))
+        movement.circadianMovement(view, fitnessDict, sunsetMatrix, grid.datetimes()[0], grid.datetimes()[-1], 'fast',
+                                   metrics=metrics)
+    assert result.counters['snaps'] > 0 and result.counters['clamps'] > 0
+    assert result.counters == {'snaps': metrics.counters['circadian.snaps'], 'clamps': metrics.counters['circadian.clamps']}
+
+def test_nestedStagesAndMerge(tmp_path):
+    metrics = Metrics(('outer', 'inner'), memory=True, profile=['outer'])
+    with metrics.timed('outer', rows=2, cells=10):
+        with metrics.timed('inner', rows=1):
+            block = np.ones(1 << 20)
+        metrics.count('blocks')
+    metrics.addWork('inner', cells=5)
+    del block
+
+    worker = StageTimer()
+    with worker.timed('inner', rows=3, cells=3):
+        pass
+    metrics.merge(worker)
+    report = metrics.report()
+    assert (report['inner']['calls'], report['inner']['rows'], report['inner']['cells']) == (2, 4, 8)
+    assert report['outer']['seconds'] >= report['inner']['seconds'] - worker.seconds['inner']
+    assert report['outer']['peakBytes'] >= 8 << 20 and report['inner']['peakBytes'] == 0 #only the outermost stage traces
+    assert any('timed' in row['function'] for row in metrics.profileStats(50))
+    metrics.close()
+
+    metrics.dump(str(tmp_path / 'metrics.json'))
+    with open(str(tmp_path / 'metrics.json')) as f:
+        dumped = json.load(f)
+    assert dumped['counters'] == {'blocks': 1} and dumped['stages']['outer']['rows'] == 2
+
+## helper functions ##
+
+class _StreamRandom(object):
+    """The random module of the original strategies drawing from an engine agent stream."""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def choice(self, sequence):
+        return sequence[min(int(self.stream.random() * len(sequence)), len(sequence) - 1)]
@@ -0,0 +1,75 @@
+import itertools
+import numpy as np
+import pytest
+
+from oracle import constrainedOracle, unconstrainedOracle
+
+def _bruteForce(fitness, maxStep, startIndex=None):
+    """The best total over every trajectory through valid cells that moves at most maxStep columns an hour."""
+    fitness = fitness[~np.isnan(fitness).all(axis=1)]
+    nRows, nDepths = fitness.shape
+    best = -np.inf
+    for path in itertools.product(range(nDepths), repeat=nRows):
+        if startIndex is not None and path[0] != startIndex:
+            continue
+        if any(abs(a - b) > maxStep for a, b in zip(path, path[1:])):
+            continue
+        total = sum(fitness[t, d] for t, d in enumerate(path))
+        if not np.isnan(total):
+            best = max(best, total)
+    return best
+
+@pytest.mark.parametrize('seed', range(12))
+@pytest.mark.parametrize('maxStep', [1, 2])
+def test_constrainedMatchesBruteForce(seed, maxStep):
+    rng = np.random.default_rng(seed)
+    fitness = rng.normal(size=(6, 5))
+    fitness[rng.random(fitness.shape) < 0.15] = np.nan
+    fitness[seed % 6] = np.nan #an hour without data is skipped
+    expected = _bruteForce(fitness, maxStep)
+    if not np.isfinite(expected):
+        pytest.skip('no trajectory reaches the end without a restart')
+    result = constrainedOracle(fitness, maxStep)
+    assert len(result.restarts) == 0
+    assert result.totalFitness == pytest.approx(expected)
+    assert np.abs(np.diff(result.depthIndex)).max() <= maxStep
+    np.testing.assert_array_equal(result.fitness, fitness[result.rows, result.depthIndex])
+
+@pytest.mark.parametrize('seed', range(6))
+def test_constrainedStartIndex(seed):
+    fitness = np.random.default_rng(seed).normal(size=(5, 6))
+    result = constrainedOracle(fitness, 1, startIndex=seed)
+    assert result.depthIndex[0] == seed
+    assert result.totalFitness == pytest.approx(_bruteForce(fitness, 1, seed))
+
+def test_constrainedRestarts():
+    nan = np.nan
+    #the lake gets shallower than one step can follow: the trajectory starts again
+    fitness = np.array([[nan, nan, nan, 5.0], [1.0, nan, nan, nan], [2.0, 0.0, nan, nan]])
+    result = constrainedOracle(fitness, 1)
+    assert result.restarts.tolist() == [1]
+    assert result.depthIndex.tolist() == [3, 0, 0]
+    assert result.totalFitness == pytest.approx(8.0)
+
+def test_unconstrainedIsTheRowMaximum():
+    rng = np.random.default_rng(3)
+    fitness = rng.normal(size=(40, 7))
+    fitness[rng.random(fitness.shape) < 0.2] = np.nan
+    fitness[5] = np.nan
+    result = unconstrainedOracle(fitness)
+    assert 5 not in result.rows.tolist()
+    np.testing.assert_allclose(result.fitness, np.nanmax(np.delete(fitness, 5, axis=0), axis=1))
+    assert result.totalFitness >= constrainedOracle(fitness, 1).totalFitness
+
+def test_unconstrainedMatchesOracleMovement(legacy, lakeYear):
+    movement, _ = legacy
+    grid, fitness, _ = lakeYear
+    grid, fitness = grid.take(np.arange(48)), np.asarray(fitness)[:48]
+    view = grid.asDict()
+    fitnessDict = dict((date, dict((depth, float(fitness[t, grid.column(depth)])) for depth in view[date].keys()))
+                       for t, date in enumerate(grid.datetimes()))
+    dates, depths, _, fitnesses = movement.oracleMovement(view, fitnessDict, grid.datetimes()[0], grid.datetimes()[-1], True)
+    order = np.argsort(dates) #the original walks an unordered set of dates
+    result = unconstrainedOracle(fitness)
+    np.testing.assert_allclose(grid.depths[result.depthIndex], np.asarray(depths)[order])
+    np.testing.assert_allclose(result.fitness, np.asarray(fitnesses)[order], rtol=1e-6)
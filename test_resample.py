@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from gapFill import fillGaps, hourlyClimatology
+from lakeGrid import INTERPOLATED, MEASURED, MISSING
+from lakeStore import LakeStore
+from pipeline import processLakeYear
+from resample import nativeStep, resampleRecords
+from streaming import StreamingPipeline
+from temperatureLoader import TemperatureRecords, loadTemperatureFile
+
+@pytest.fixture(scope='module')
+def dailyFile(lakeRecords, tmp_path_factory):
+    """The noon readings of the synthetic lake in the LTER daily layout (no hour column)."""
+    noon = lakeRecords.take(lakeRecords.times.astype('datetime64[h]').astype(np.int64) % 24 == 12)
+    days = np.datetime_as_string(noon.times.astype('datetime64[D]'))
+    filename = str(tmp_path_factory.mktemp('daily') / 'daily.txt')
+    with open(filename, 'w') as f:
+        f.write('sampledate,year4,month,daynum,depth,wtemp,flag_wtemp\n')
+        for row in zip(days.tolist(), noon.depths.tolist(), noon.temps.tolist(), noon.flags.tolist()):
+            f.write('%s,%s,1,1,%g,%.3f,%s\n' % ((row[0], row[0][:4]) + row[1:]))
+    return filename
+
+def test_dailyFileEndToEnd(dailyFile, lakeYears, tmp_path):
+    records = loadTemperatureFile(dailyFile, 'daily')
+    assert nativeStep(records, 'daily') == 1440 and nativeStep(records) == 60
+
+    grid, fitness, meta = processLakeYear(dailyFile, lakeYears[0], resolution=0.5, layout='daily')
+    assert meta['step'] == 1440
+    assert grid.times.tolist() == np.arange('%d-01-01' % lakeYears[0], '%d-01-01' % (lakeYears[0] + 1),
+                                            dtype='datetime64[D]').astype('datetime64[m]').tolist()
+    assert fitness.shape == grid.temps.shape
+    #a day is one step: the readings of the day are on it, not spread over 24 hours of gaps
+    measured = records.toGrid()
+    days = measured.times.astype('datetime64[D]').astype('datetime64[m]')
+    year = days <= grid.times[-1]
+    readings = grid.temps[np.ix_(np.searchsorted(grid.times, days[year]), np.searchsorted(grid.depths, measured.depths))]
+    present = ~np.isnan(measured.temps[year])
+    np.testing.assert_allclose(readings[present], measured.temps[year][present], rtol=1e-6)
+    assert meta['gaps']['missingHours'] < 40
+
+    store = LakeStore.build(str(tmp_path / 'store'), dailyFile, resolution=0.5, layout='daily')
+    assert store.meta(lakeYears[0])['step'] == 1440
+    np.testing.assert_array_equal(store[lakeYears[0]][1], fitness)
+
+    pipeline = StreamingPipeline(dailyFile, layout='daily', resolution=0.5, chunk='Y')
+    chunks = list(pipeline.run())
+    assert pipeline.survey.step == 1440
+    np.testing.assert_allclose(chunks[0].fitness, fitness, rtol=1e-5, atol=1e-6, equal_nan=True)
+
+def test_meanAndInterpolate():
+    times = np.array(['2005-06-01T00:00', '2005-06-01T00:05', '2005-06-01T00:10', '2005-06-01T00:40'],
+                     dtype='datetime64[m]')
+    records = TemperatureRecords(times, np.zeros(4), np.array([10, 12, 20, 30], dtype=np.float32),
+                                 np.array(['', 'x', '', '']), np.full(4, 5, dtype=np.float32))
+    assert nativeStep(records, 'hires') == 5
+    mean = resampleRecords(records, 10)
+    assert mean.temps[:, 0].tolist()[:2] == [11, 20] and np.isnan(mean.temps[2:4, 0]).all()
+    assert mean.flags[:, 0].tolist() == [MEASURED, MEASURED, MISSING, MISSING, MEASURED]
+    sampled = resampleRecords(records, 5, 'interpolate', maxGap=30)
+    np.testing.assert_allclose(sampled.temps[2:, 0], np.linspace(20, 30, 7), rtol=1e-6)
+    assert sampled.flags[3, 0] == INTERPOLATED
+
+def test_resampledCountsMatch(lakeRecords, lakeYears):
+    measured = lakeRecords.toGrid()
+    resampled = resampleRecords(lakeRecords, 60)
+    assert len(resampled.times) > len(measured.times) #whole missing days are rows of NaN
+    _, expected = fillGaps(measured, hourlyClimatology(measured), lakeYears)
+    _, counts = fillGaps(resampled, hourlyClimatology(resampled), lakeYears)
+    assert counts == expected
+    assert all(expected[year]['missingHours'] > 0 for year in lakeYears)
+
+def test_pipelineGapReport(lakeRecords, lakeFile, lakeYears):
+    measured = lakeRecords.toGrid()
+    _, expected = fillGaps(measured, hourlyClimatology(measured), lakeYears[0])
+    _, _, meta = processLakeYear(lakeFile, lakeYears[0], resolution=0.5)
+    assert meta['gaps'] == expected[lakeYears[0]]
@@ -0,0 +1,66 @@
+import calendar
+import datetime
+import numpy as np
+import pytest
+
+from solar import WAUSAU, SolarTable, computeSolarTable
+
+YEAR = 2005
+
+@pytest.fixture(scope='module')
+def usnoFile(tmp_path_factory):
+    """A USNO style table of the computed sunrise and sunset times, in the layout createSunriseData reads."""
+    table = computeSolarTable(WAUSAU[0], WAUSAU[1], YEAR, utcOffset=WAUSAU[2])
+    filename = str(tmp_path_factory.mktemp('usno') / 'sunrise.txt')
+    with open(filename, 'w') as f:
+        f.write('Wausau, Wisconsin\nRise and Set for the Sun\n       Jan.       Feb. ...\n')
+        for day in range(1, 32):
+            blocks = []
+            for month in range(1, 13):
+                if day > calendar.monthrange(YEAR, month)[1]:
+                    blocks.append(' ' * 11)
+                    continue
+                sunrise, sunset = table.sunTimes(np.datetime64('%d-%02d-%02d' % (YEAR, month, day)))
+                blocks.append('%s %s  ' % (str(sunrise)[11:16].replace(':', ''), str(sunset)[11:16].replace(':', '')))
+            f.write('%02d  %s\n' % (day, ''.join(blocks)))
+    return table, filename
+
+def test_fromUSNOMatchesSunriseToDateTime(legacy, usnoFile):
+    _, formatData = legacy
+    table, filename = usnoFile
+    sunsetMatrix = formatData.sunriseToDateTime(formatData.createSunriseData(filename, YEAR))
+    parsed = SolarTable.fromUSNO(filename, YEAR)
+    assert len(parsed) == len(sunsetMatrix) == 365
+    assert parsed.compare(SolarTable.fromSunsetMatrix(sunsetMatrix))['sunsetMaxMinutes'] == 0
+    assert parsed.compare(table) == {'days': 365, 'sunriseMeanMinutes': 0.0, 'sunriseMaxMinutes': 0.0,
+                                     'sunsetMeanMinutes': 0.0, 'sunsetMaxMinutes': 0.0}
+
+def test_matchesFindSunsetTimes(legacy, usnoFile):
+    movement, formatData = legacy
+    _, filename = usnoFile
+    sunsetMatrix = formatData.sunriseToDateTime(formatData.createSunriseData(filename, YEAR))
+    table = SolarTable.fromSunsetMatrix(sunsetMatrix)
+    times = np.arange(np.datetime64('%d-01-01T00:00' % YEAR), np.datetime64('%d-01-01T00:00' % (YEAR + 1)),
+                      np.timedelta64(7, 'h'))
+    daylight = table.isDaylight(times)
+    for time, day in zip(times, daylight):
+        date = time.astype(datetime.datetime)
+        sunrise, sunset = movement.findSunsetTimes(date, sunsetMatrix)
+        assert day == (sunrise <= date < sunset) #the test circadianMovement makes every hour
+        assert table.sunTimes(time) == (np.datetime64(sunrise, 'm'), np.datetime64(sunset, 'm'))
+
+def test_computedTableIsPlausible():
+    table = computeSolarTable(WAUSAU[0], WAUSAU[1], YEAR, YEAR + 1, WAUSAU[2])
+    assert len(table) == 730 and table.firstDay == np.datetime64('%d-01-01' % YEAR)
+    length = table.sunset - table.sunrise
+    assert length[171] == length.max() and length[354] == length[365 + 354] == length.min() #the solstices
+    assert 15.2 * 60 < length.max() < 15.7 * 60 and 8.7 * 60 < length.min() < 9.2 * 60
+    noon = (table.sunrise + table.sunset) / 2
+    assert (abs(noon - (720 - 4 * WAUSAU[1] + 60 * WAUSAU[2])) < 17).all() #within the equation of time
+
+def test_missingDaysAreNight():
+    table = SolarTable('2005-06-01', [300.0, np.nan], [1200.0, np.nan])
+    times = np.array(['2005-05-31T12:00', '2005-06-01T04:59', '2005-06-01T05:00', '2005-06-01T20:00',
+                      '2005-06-02T12:00', '2005-06-03T12:00'], dtype='datetime64[m]')
+    assert table.isDaylight(times).tolist() == [False, False, True, False, False, False]
+    assert table.sunTimes('2005-06-02') is None
@@ -0,0 +1,46 @@
+import datetime
+import numpy as np
+import pytest
+
+from fitness import createFitnessGrid
+from lakeGrid import FILLED, MEASURED
+from stableDepth import stableDepthBaseline
+
+START, END = datetime.datetime(2005, 1, 3, 6), datetime.datetime(2005, 1, 9, 18)
+
+@pytest.mark.parametrize('grid', ['interpolated', 'sensors'])
+def test_matchesFitnessAtStableDepth(grid, legacy, lakeYear, filledYear):
+    movement, _ = legacy
+    if grid == 'sensors':
+        grid = filledYear.take(np.arange(24 * 12)) #missing depths stay missing here
+        fitness = createFitnessGrid(grid)
+    else:
+        grid, fitness = lakeYear[0].take(np.arange(24 * 12)), np.asarray(lakeYear[1])[:24 * 12]
+    view = grid.asDict()
+    fitnessDict = dict((date, dict((depth, float(fitness[t, grid.column(depth)])) for depth in view[date].keys()))
+                       for t, date in enumerate(grid.datetimes()))
+
+    baseline = stableDepthBaseline(grid, fitness, START, END)
+    for d, depth in enumerate(grid.depths.tolist()):
+        dates, temps, fitnesses = movement.fitnessAtStableDepth(view, fitnessDict, depth, START, END, True)
+        #the original only keeps the hours with data at that depth, in time order
+        times, baseTemps, baseFitness = baseline.column(depth)
+        assert times.tolist() == [np.datetime64(date, 'm') for date in dates if depth in view[date]]
+        np.testing.assert_allclose(baseTemps, temps, rtol=1e-6)
+        np.testing.assert_allclose(baseFitness, fitnesses, rtol=1e-6)
+        assert baseline.hours[d] == len(fitnesses)
+        assert baseline.totalFitness[d] == pytest.approx(sum(fitnesses), rel=1e-6, abs=1e-9)
+
+def test_provenanceAndPercentiles(filledYear):
+    fitness = createFitnessGrid(filledYear)
+    everything = stableDepthBaseline(filledYear, fitness)
+    measured = stableDepthBaseline(filledYear, fitness, include=(MEASURED,))
+    isMeasured = filledYear.flags == MEASURED
+    assert (measured.hours == isMeasured.sum(axis=0)).all()
+    assert (everything.hours == (~np.isnan(fitness)).sum(axis=0)).all()
+    assert (everything.hours - measured.hours == (filledYear.flags == FILLED).sum(axis=0)).all()
+    np.testing.assert_allclose(measured.percentileFitness[2], np.nanmedian(np.where(isMeasured, fitness, np.nan), axis=0))
+    order = everything.rank('mean')
+    assert everything.meanFitness[order[0]] == np.nanmax(everything.meanFitness)
+    with pytest.raises(ValueError, match='unknown provenance flags'):
+        stableDepthBaseline(filledYear, fitness, include=(9,))
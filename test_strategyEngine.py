@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from ensemble import STRATEGIES, makeKernel
+from strategyEngine import DenseSource, EngineState, Strategy, _snap, runStrategy
+
+MOVING = [strategy for strategy in STRATEGIES if strategy != 'oracle']
+
+@pytest.mark.parametrize('strategy', MOVING)
+def test_chunkedRunMatchesSingleRun(strategy, lakeYear, tmp_path):
+    grid, fitness, daylight = lakeYear
+    source = DenseSource(grid, fitness)
+    kernel = makeKernel(strategy)
+    whole = runStrategy(source, kernel, 6, seed=3, daylight=daylight, blockSize=100)
+
+    state, parts = EngineState.fresh(6, 3), []
+    for lo in range(0, len(source), 1234):
+        result = runStrategy(source, kernel, daylight=daylight, rows=np.arange(lo, min(lo + 1234, len(source))),
+                             state=state, blockSize=100)
+        parts.append(result)
+        state.save(str(tmp_path / 'state.npz')) #and continue from a copy read back from disk
+        state = EngineState.load(str(tmp_path / 'state.npz'))
+
+    np.testing.assert_array_equal(whole.depthIndex, np.concatenate([part.depthIndex for part in parts], axis=1))
+    np.testing.assert_array_equal(whole.fitness, np.concatenate([part.fitness for part in parts], axis=1))
+    np.testing.assert_allclose(whole.state.totalFitness, state.totalFitness)
+    assert whole.state.steps == state.steps == len(whole.rows)
+
+def test_snapToNearestDepth():
+    depths = np.array([0.5, 1.0, 2.0, 3.5, 6.0, 7.0])
+    columns = np.array([0, 2, 3, 5]) #1 m and 6 m have no data this hour
+    previous = np.arange(len(depths))
+    rank, snapped = _snap(columns, previous, depths)
+    #the original: min(allDepths, key=lambda x: abs(x - previousLocation)), shallower on a tie
+    expected = [min(depths[columns].tolist(), key=lambda x: abs(x - depth)) for depth in depths]
+    assert depths[columns[rank]].tolist() == expected
+    assert snapped.tolist() == [False, True, False, False, True, False]
+
+def test_snapMetersNotColumns():
+    depths = np.array([0.0, 1.0, 1.5, 2.0, 6.0])
+    columns = np.array([0, 4])
+    #column 3 is one column from 4 but 2 m from 0 m and 4 m from 6 m
+    rank, _ = _snap(columns, np.array([3]), depths)
+    assert columns[rank].tolist() == [0]
+
+def test_daylightCheckedOnce(lakeYear):
+    grid, fitness, _ = lakeYear
+    with pytest.raises(ValueError, match='Circadian needs the daylight vector'):
+        runStrategy(DenseSource(grid, fitness), makeKernel('circadian'), 2, rows=np.arange(0))
+    assert not makeKernel('hillClimbing').needsDaylight
+    runStrategy(DenseSource(grid, fitness), makeKernel('hillClimbing'), 2, rows=np.arange(5))
+
+def test_stepIsAbstract():
+    class Sink(Strategy):
+        pass
+
+    with pytest.raises(TypeError):
+        Sink()
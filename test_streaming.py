@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from climatology import ClimatologyAccumulator
+from ensemble import makeKernel
+from pipeline import processLakeYear
+from strategyEngine import DenseSource, EngineState, runStrategy
+from streaming import StreamingPipeline, surveyFile
+from temperatureLoader import loadTemperatureFile
+
+@pytest.fixture(scope='module')
+def streamed(lakeFile, solarTable):
+    strategies = {'hillClimbing': makeKernel('hillClimbing'), 'circadian': makeKernel('circadian')}
+    pipeline = StreamingPipeline(lakeFile, strategies, resolution=0.5, nAgents=3, seed=9, solarTable=solarTable,
+                                 chunkSize=5000)
+    chunks = list(pipeline.run())
+    return pipeline, chunks
+
+def test_matchesProcessLakeYear(streamed, lakeFile, lakeYears):
+    pipeline, chunks = streamed
+    assert len(chunks) == 12 * len(lakeYears) and pipeline.outOfOrder == 0
+    times = np.concatenate([chunk.grid.times for chunk in chunks])
+    temps = np.concatenate([chunk.grid.temps for chunk in chunks])
+    fitness = np.concatenate([chunk.fitness for chunk in chunks])
+    gaps, hours = {}, 0
+    for year in lakeYears:
+        grid, expected, meta = processLakeYear(lakeFile, year, resolution=0.5)
+        rows = np.searchsorted(times, grid.times)
+        assert np.array_equal(times[rows], grid.times)
+        assert np.array_equal(chunks[0].grid.depths, grid.depths)
+        np.testing.assert_allclose(temps[rows], grid.temps, rtol=1e-6, equal_nan=True)
+        np.testing.assert_allclose(fitness[rows], expected, rtol=1e-5, atol=1e-6, equal_nan=True)
+        hours += len(grid.times)
+        for name, count in meta['gaps'].items():
+            gaps[name] = gaps.get(name, 0) + count
+    assert len(times) == hours
+    assert pipeline.report()['gaps'] == gaps
+
+def test_agentsCarryAcrossChunks(streamed, lakeFile, lakeYears, solarTable):
+    pipeline, chunks = streamed
+    years = [processLakeYear(lakeFile, year, resolution=0.5) for year in lakeYears]
+    for name in pipeline.strategies:
+        #one uninterrupted run over the whole record, year after year
+        state = EngineState.fresh(3, 9)
+        depthIndex = []
+        for grid, fitness, _ in years:
+            result = runStrategy(DenseSource(grid, fitness), makeKernel(name), daylight=solarTable.isDaylight(grid.times),
+                                 state=state)
+            depthIndex.append(result.depthIndex)
+        streamedIndex = np.concatenate([chunk.results[name].depthIndex for chunk in chunks], axis=1)
+        np.testing.assert_array_equal(streamedIndex, np.concatenate(depthIndex, axis=1))
+        np.testing.assert_allclose(pipeline.totalFitness()[name], state.totalFitness, rtol=1e-5)
+
+def test_surveyMatchesClimatology(lakeFile):
+    records = loadTemperatureFile(lakeFile)
+    survey = surveyFile(lakeFile, chunkSize=3000)
+    assert survey.records == len(records) and survey.step == 60
+    assert survey.depths.tolist() == np.unique(records.depths).tolist()
+    expected = ClimatologyAccumulator.fromGrid(records.toGrid())
+    np.testing.assert_allclose(survey.accumulator.mean(), expected.mean(), rtol=1e-6, equal_nan=True)
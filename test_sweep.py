@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from ensemble import runEnsemble
+from oracle import unconstrainedOracle
+from sweep import expandSweep, runSweep, runTask
+
+def test_expandSweep():
+    runs = expandSweep({'year': [2005, 2006], 'seed': [1],
+                        'strategy': [{'strategy': 'circadian', 'speed': 'fast'}, 'oracle']})
+    #settings vary in name order, the last name fastest
+    assert runs == [{'seed': 1, 'strategy': 'circadian', 'speed': 'fast', 'year': 2005},
+                    {'seed': 1, 'strategy': 'circadian', 'speed': 'fast', 'year': 2006},
+                    {'seed': 1, 'strategy': 'oracle', 'year': 2005},
+                    {'seed': 1, 'strategy': 'oracle', 'year': 2006}]
+
+def test_runTaskMatchesEnsemble(lakeYear):
+    grid, fitness, daylight = lakeYear
+    output = runTask(grid, fitness, daylight, {'strategy': 'circadian', 'speed': 'fast', 'seed': 4}, nAgents=3,
+                     keepTrajectories=True)
+    expected = runEnsemble(grid, fitness, 'circadian', 3, seed=4, daylight=daylight, speed='fast')
+    np.testing.assert_array_equal(output['depths'], expected.depths)
+    np.testing.assert_allclose(output['totalFitness'], expected.totalFitness)
+    np.testing.assert_allclose(output['meanDepth'], expected.depths.mean(axis=1), rtol=1e-5)
+
+    oracle = runTask(grid, fitness, daylight, {'strategy': 'oracle'})
+    assert oracle['totalFitness'][0] == pytest.approx(np.nansum(unconstrainedOracle(fitness).fitness, dtype=np.float64))
+
+def test_poolMatchesInProcess(lakeYear, lakeYears):
+    grid, fitness, daylight = lakeYear
+    lakes = {lakeYears[0]: (grid, fitness, daylight)}
+    runs = expandSweep({'year': [lakeYears[0]], 'seed': [1, 2],
+                        'strategy': ['hillClimbing', 'circadian', 'constrainedOracle', 'teleport']})
+    results = list(runSweep(lakes, runs, workers=2, retries=1, nAgents=2, keepTrajectories=True))
+    assert len(results) == len(runs)
+
+    for result in results:
+        run = result['run']
+        if run['strategy'] == 'teleport':
+            assert 'unknown strategy' in result['error'] and result['attempts'] == 2
+            continue
+        expected = runTask(grid, fitness, daylight, run, nAgents=2, keepTrajectories=True)
+        np.testing.assert_array_equal(result['depths'], expected['depths'])
+        np.testing.assert_array_equal(result['totalFitness'], expected['totalFitness'])
@@ -0,0 +1,50 @@
+import numpy as np
+
+from temperatureLoader import (BAD_COLUMNS, BAD_DATE, BAD_DEPTH, BAD_FLAG, BAD_FREQ, BAD_TEMP, BAD_TIME,
+                               REJECT_REASONS, loadTemperatureFile, parseLines)
+
+def test_rejectReasons():
+    lines = ['2005-06-01 00:00:00,2005,6,152,0100,1.5,20.25,\n',
+             '2005-06-01 00:00:00,2005,6,152,0100,1.5\n', #too few columns
+             '2005-02-30 00:00:00,2005,2,61,0100,1.5,20.25,\n', #no such day
+             '2005-06-01 00:00:00,2005,6,152,2500,1.5,20.25,\n', #hour out of range
+             '2005-06-01 00:00:00,2005,6,152,0100,deep,20.25,\n',
+             '2005-06-01 00:00:00,2005,6,152,0100,1.5,,\n', #empty wtemp
+             '"2005-06-01 00:00:00",2005,6,152,"0200","2","19.5","A"\r\n']
+    records = parseLines(lines, 'hourly', firstLine=2)
+    assert len(records) == 2
+    assert records.rejectLines.tolist() == [3, 4, 5, 6, 7]
+    assert records.rejectReasons.tolist() == [BAD_COLUMNS, BAD_DATE, BAD_TIME, BAD_DEPTH, BAD_TEMP]
+    assert records.rejectSummary() == dict((REJECT_REASONS[code], 1)
+                                           for code in (BAD_COLUMNS, BAD_DATE, BAD_TIME, BAD_DEPTH, BAD_TEMP))
+    assert records.times.tolist() == np.array(['2005-06-01T01:00', '2005-06-01T02:00'], 'datetime64[m]').tolist()
+    np.testing.assert_allclose(records.depths, [1.5, 2.0])
+    np.testing.assert_allclose(records.temps, [20.25, 19.5])
+    assert records.flags.tolist() == ['', 'A']
+
+def test_rejectReasonsHires():
+    lines = ['2005-06-01,2005,6,152,0130,1,1.5,20.25,\n',
+             '2005-06-01,2005,6,152,0175,1,1.5,20.25,\n', #minute out of range
+             '2005-06-01,2005,6,152,0130,often,1.5,20.25,\n']
+    records = parseLines(lines, 'hires')
+    assert records.times.tolist() == np.array(['2005-06-01T01:30'], 'datetime64[m]').tolist()
+    assert records.rejectLines.tolist() == [2, 3]
+    assert records.rejectReasons.tolist() == [BAD_TIME, BAD_FREQ]
+
+def test_longFlagsAreRejected():
+    lines = ['2005-06-01 00:00:00,2005,6,152,0100,1.5,20.25,LONGFLAGXX\n',
+             '2005-06-01 00:00:00,2005,6,152,0100,2,20.25,EIGHTCHR\r\n',
+             '2005-06-01 00:00:00,2005,6,152,0100,3,20.25,"EIGHTCHR"\n',
+             '2005-06-01 00:00:00,2005,6,152,0100,4,20.25,NINECHARS\n']
+    records = parseLines(lines, 'hourly')
+    assert records.flags.tolist() == ['EIGHTCHR', 'EIGHTCHR']
+    assert records.rejectLines.tolist() == [1, 4]
+    assert records.rejectReasons.tolist() == [BAD_FLAG, BAD_FLAG]
+    assert records.rejectSummary() == {'flag too long': 2}
+
+def test_chunksMatchWholeFile(lakeFile):
+    whole = loadTemperatureFile(lakeFile, chunkSize=10 ** 7)
+    chunked = loadTemperatureFile(lakeFile, chunkSize=997)
+    assert np.array_equal(whole.times, chunked.times)
+    assert np.array_equal(whole.temps, chunked.temps)
+    assert len(chunked.rejectLines) == 0